@@ -2,4 +2,4 @@
 Models package for Pydantic data models used in the application.
 """
 
-from .chat_models import Message, ChatRequest, ChatResponse, TestLLMRequest
+from .chat_models import Message, ChatRequest, BatchChatRequest, ChatResponse, TestLLMRequest
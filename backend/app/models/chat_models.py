@@ -33,11 +33,29 @@ class ChatRequest(BaseModel):
     Request model for chat interactions.
     
     Attributes:
-        messages (List[Message]): List of messages in the conversation
+        messages (List[Message]): New messages for this turn. Without chat_id this
+            is the whole conversation; with chat_id only the messages since the last turn.
         agent_type (str): Type of agent to use (chatbot, summary, etc.)
+        chat_id (Optional[str]): Existing chat to continue; earlier turns are loaded from storage
     """
     messages: List[Message]
     agent_type: str = "chatbot"  # default to chatbot agent
+    chat_id: Optional[str] = None
+
+
+class BatchChatRequest(BaseModel):
+    """
+    Request model for running many chat requests in one call.
+    
+    Attributes:
+        requests (List[ChatRequest]): The items, each handled like a /chat request
+        batch_id (Optional[str]): Batch to resume; resubmit the same requests with
+            the id from the first run to skip the items that already finished
+        concurrency (Optional[int]): Items in flight at once (capped by the server)
+    """
+    requests: List[ChatRequest]
+    batch_id: Optional[str] = None
+    concurrency: Optional[int] = None
 
 
 class ChatResponse(BaseModel):
@@ -1,8 +1,25 @@
+import os
+import json
+import time
+import asyncio
+import uuid
 import logging
 import traceback
+from collections import OrderedDict
 from enum import Enum
-from typing import Dict, List, Optional, Tuple, Any, Union
-from .llm_service import get_llm_service, LLMService
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Any, Union
+from .llm_service import get_llm_service, Completion, LLMService, OPENAI_MODEL_NAME
+from .context_window import ContextWindowManager
+from .summarizer import IncrementalSummarizer
+from .scheduler import RequestScheduler, SchedulerOverloaded
+from .batch import BatchResultStore
+from .prompts import ANALYSIS_PROMPT, CHATBOT_PROMPT
+from .resilience import LLMError
+from .database import get_database_service
+from .tokens import lazy_token_counter, MESSAGE_OVERHEAD_TOKENS
+from .metrics import REQUEST_LATENCY, AGENT_ERRORS, SCHEDULER_LOAD, SCHEDULER_SHED
+from .tracing import get_tracer, current_span
+from .shared_state import DEFAULT_TTL, get_shared_state
 
 class AgentError(Exception):
     """Custom exception for agent-related errors"""
@@ -22,6 +39,7 @@ class ErrorType(Enum):
     CONTENT_FILTER_ERROR = "content_filter_error"
     INVALID_REQUEST_ERROR = "invalid_request_error"
     INTERNAL_ERROR = "internal_error"
+    UPSTREAM_UNAVAILABLE = "upstream_unavailable"
     UNKNOWN_ERROR = "unknown_error"
 
 
@@ -37,6 +55,51 @@ class AIService:
             "analysis": self._process_analysis_request,
         }
         
+        # Prompt builders for agents that can stream their answer
+        # (summaries may take several model calls, so they are sent in one piece)
+        self.prompt_builders = {
+            "chatbot": self._build_chatbot_prompt,
+        }
+        
+        # Per-agent token budgets for conversation transcripts, and rolling summaries
+        # that only fold in messages added since the previous request
+        self.token_counter = lazy_token_counter(OPENAI_MODEL_NAME)
+        self.shared_state = get_shared_state()
+        self.summarizer = IncrementalSummarizer.from_env(self._generate, self.token_counter, self.shared_state)
+        self.context_window = ContextWindowManager.from_env(self.token_counter, self.summarizer)
+        
+        # Admission control in front of the LLM: global concurrency cap, per-agent
+        # priorities and load shedding (raises SchedulerOverloaded when full),
+        # across all workers when the state is shared
+        self.scheduler = RequestScheduler.from_env(self.shared_state)
+        self.tracer = get_tracer()
+        SCHEDULER_LOAD.set_function(self._scheduler_load)
+        SCHEDULER_SHED.set_function(lambda: {(): self.scheduler.shed})
+        
+        # Questions close enough to a FAQ/knowledge entry are answered from it without
+        # calling the chat model (index built on first use, see faq_index.py). Off by
+        # default: every chatbot question then costs an embedding request
+        self.faq_enabled = os.getenv("FAQ_MATCH_ENABLED", "false").lower() in ("1", "true", "yes")
+        self._faq_index = None
+        
+        # Retrieval over local policy/product documents for the chatbot prompt
+        # (off unless RAG_CORPUS_DIR is set, see document_index.py)
+        self.rag_corpus = os.getenv("RAG_CORPUS_DIR") or None
+        self.rag_top_k = int(os.getenv("RAG_TOP_K", "4"))
+        self.rag_min_score = float(os.getenv("RAG_MIN_SCORE", "0.3"))
+        self._document_index = None
+        
+        # Bulk requests: items run this many at a time, and finished items are
+        # saved (store opened on first use) so an interrupted batch can resume
+        self.batch_max_concurrency = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+        self.batch_max_items = int(os.getenv("BATCH_MAX_ITEMS", "10000"))
+        self._batches = None
+        
+        # Latest computed inventory analysis per chat, narrated by the analysis agent
+        # (in the shared state store instead when SHARED_STATE_PATH is set)
+        self.inventory_summaries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.max_inventory_summaries = 100
+        
         # Response templates for different scenarios
         self.error_responses = {
             ErrorType.API_ERROR.value: "I'm having trouble connecting to my knowledge source. Please try again in a few moments.",
@@ -46,11 +109,16 @@ class AIService:
             ErrorType.CONTENT_FILTER_ERROR.value: "I'm unable to provide information on that topic. Let's discuss something else.",
             ErrorType.INVALID_REQUEST_ERROR.value: "I couldn't understand that request properly. Could you rephrase it?",
             ErrorType.INTERNAL_ERROR.value: "I'm experiencing an internal issue. My team has been notified.",
+            ErrorType.UPSTREAM_UNAVAILABLE.value: "My knowledge source is temporarily unavailable. Please try again in a minute.",
             ErrorType.UNKNOWN_ERROR.value: "Something went wrong. Please try again or contact support if this persists."
         }
     
     def _classify_error(self, e: Exception) -> Tuple[str, str]:
         """Classify an exception to determine the error type and appropriate message"""
+        # Typed LLM failures carry their own classification
+        if isinstance(e, LLMError):
+            return e.error_type, self.error_responses[e.error_type]
+        
         error_message = str(e).lower()
         
         if "rate limit" in error_message or "quota" in error_message:
@@ -93,6 +161,10 @@ class AIService:
         self.logger.debug(f"Error traceback: {traceback.format_exc()}")
         
         error_type, error_message = self._classify_error(e)
+        AGENT_ERRORS.inc(1, (self._agent_label(agent_type), error_type))
+        span = current_span()
+        span.set_attribute("error.type", error_type)
+        span.set_status("error", str(e))
         
         return self._format_response(
             content=error_message,
@@ -104,95 +176,446 @@ class AIService:
             }
         )
     
-    async def process_request(self, messages: List[Dict[str, str]], agent_type: str = "chatbot") -> Dict[str, Union[str, Any]]:
-        """Process an AI request using the specified agent type"""
+    async def process_request(self, messages: List[Dict[str, str]], agent_type: str = "chatbot", chat_id: Optional[str] = None, client_id: Optional[str] = None) -> Dict[str, Union[str, Any]]:
+        """
+        Process an AI request using the specified agent type
+        
+        Raises:
+            SchedulerOverloaded: If the request queue is full
+        """
         self.logger.info(f"Processing request with agent type: {agent_type}")
         
+        # Unknown agent types are queued, traced and measured as the chatbot that serves
+        # them, so client input never becomes a metric label
+        label = self._agent_label(agent_type)
+        started = time.perf_counter()
+        with self.tracer.start_as_current_span("agent.request", {"agent_type": label}) as span:
+            async with self.scheduler.slot(label, client_id) as queue_wait:
+                span.set_attribute("queue_wait_ms", round(queue_wait * 1000, 2))
+                response = await self._dispatch(messages, agent_type, chat_id)
+        REQUEST_LATENCY.observe(time.perf_counter() - started, (label,))
+        response.setdefault("metadata", {})["queue_wait_ms"] = round(queue_wait * 1000, 2)
+        return response
+    
+    def _scheduler_load(self) -> Dict[Tuple[str, ...], int]:
+        stats = self.scheduler.stats()
+        return {("active",): stats["active"], ("queued",): stats["queued"]}
+    
+    def _agent_label(self, agent_type: str) -> str:
+        """Metric label for an agent type; unknown types are served by the chatbot"""
+        return agent_type if agent_type in self.agents else "chatbot"
+    
+    async def _dispatch(self, messages: List[Dict[str, str]], agent_type: str, chat_id: Optional[str] = None) -> Dict[str, Any]:
+        """Run the agent handler without admission control"""
         try:
             # Use the appropriate agent handler, default to chatbot if agent_type is not supported
             handler = self.agents.get(agent_type, self.agents["chatbot"])
-            return await handler(messages)
+            return await handler(messages, chat_id)
         except Exception as e:
             return self._handle_error(e, agent_type)
     
-    async def _process_chatbot_request(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    @property
+    def batches(self) -> BatchResultStore:
+        if self._batches is None:
+            self._batches = BatchResultStore.from_env()
+        return self._batches
+    
+    async def process_batch(self, requests: List[Dict[str, Any]], batch_id: Optional[str] = None, concurrency: Optional[int] = None, client_id: Optional[str] = None) -> Tuple[str, AsyncIterator[Dict[str, Any]]]:
+        """
+        Run many chat requests with bounded concurrency, reporting each as it finishes
+        
+        Each item is handled like a /chat request: a chat_id continues that
+        chat's stored history, and the exchange is stored once it succeeds.
+        Items go through the scheduler as client `client_id` (default
+        "batch:<batch_id>"), so interactive traffic keeps its fair share, and
+        wait for capacity instead of being shed.
+        
+        Submitting a batch again with the same batch_id resumes it: items that
+        already succeeded are replayed from the batch store, the others run.
+        
+        Args:
+            requests (List[Dict[str, Any]]): Items with "messages" and optionally
+                "agent_type" and "chat_id", as in ChatRequest
+            batch_id (Optional[str]): Id of a batch to resume, or of a new one
+            concurrency (Optional[int]): Items in flight at once, capped at BATCH_MAX_CONCURRENCY
+            client_id (Optional[str]): Scheduler identity of the batch
+        
+        Returns:
+            Tuple[str, AsyncIterator[Dict[str, Any]]]: The batch_id, and events:
+                one {"type": "batch"} header, a {"type": "result"} or
+                {"type": "error"} event per item (with its "index", "chat_id" and
+                "message"), and a final {"type": "done"} with the counts
+        
+        Raises:
+            ValueError: If the batch is empty or larger than BATCH_MAX_ITEMS
+            BatchConflictError: If batch_id belongs to a batch with different requests
+        """
+        if not requests:
+            raise ValueError("A batch needs at least one request")
+        if len(requests) > self.batch_max_items:
+            raise ValueError(f"A batch can have at most {self.batch_max_items} requests, got {len(requests)}")
+        batch_id = batch_id or str(uuid.uuid4())
+        concurrency = max(1, min(concurrency or self.batch_max_concurrency, self.batch_max_concurrency))
+        saved = await asyncio.to_thread(self.batches.begin, batch_id, requests)
+        self.logger.info(f"Batch {batch_id}: {len(requests)} requests, {len(saved)} already done, concurrency {concurrency}")
+        return batch_id, self._batch_events(batch_id, requests, saved, concurrency, client_id or f"batch:{batch_id}")
+    
+    async def _batch_events(self, batch_id: str, requests: List[Dict[str, Any]], saved: Dict[int, Dict[str, Any]], concurrency: int, client_id: str) -> AsyncIterator[Dict[str, Any]]:
+        yield {"type": "batch", "batch_id": batch_id, "total": len(requests), "resumed": len(saved)}
+        for index in sorted(saved):
+            yield {"type": "result", **saved[index], "resumed": True}
+        
+        todo = iter([(i, request) for i, request in enumerate(requests) if i not in saved])
+        remaining = len(requests) - len(saved)
+        finished: asyncio.Queue = asyncio.Queue()
+        
+        async def worker():
+            # Workers share one iterator, so at most `concurrency` items are in flight
+            for index, request in todo:
+                await finished.put(await self._run_batch_item(batch_id, index, request, client_id))
+        
+        workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, remaining))]
+        failed = 0
+        try:
+            for _ in range(remaining):
+                event = await finished.get()
+                failed += event["type"] == "error"
+                yield event
+        finally:
+            # A client that disconnects stops the batch; finished items stay saved
+            for task in workers:
+                task.cancel()
+        yield {"type": "done", "batch_id": batch_id, "completed": len(requests) - failed, "failed": failed, "resumed": len(saved)}
+    
+    async def _run_batch_item(self, batch_id: str, index: int, request: Dict[str, Any], client_id: str) -> Dict[str, Any]:
+        """Run one batch item like a /chat request; never raises"""
+        agent_type = request.get("agent_type", "chatbot")
+        chat_id = request.get("chat_id")
+        new_messages = request["messages"]
+        try:
+            db_service = get_database_service()
+            history = await db_service.get_conversation(chat_id) if chat_id else []
+            chat_id = chat_id or str(uuid.uuid4())
+            while True:
+                try:
+                    response = await self.process_request(history + new_messages, agent_type, chat_id, client_id)
+                    break
+                except SchedulerOverloaded as e:
+                    # Bulk work waits for capacity rather than failing
+                    await asyncio.sleep(e.retry_after)
+            if response.get("metadata", {}).get("error"):
+                # Not saved, so resuming the batch runs the item again
+                return {"type": "error", "index": index, "chat_id": chat_id, "message": response}
+            await db_service.store_messages(chat_id, new_messages + [response])
+            result = {"index": index, "chat_id": chat_id, "message": response}
+            await asyncio.to_thread(self.batches.save, batch_id, result)
+            return {"type": "result", **result}
+        except Exception as e:
+            self.logger.error(f"Error in batch {batch_id} item {index}: {str(e)}")
+            return {"type": "error", "index": index, "chat_id": chat_id, "message": self._handle_error(e, agent_type)}
+    
+    def batch_results(self, batch_id: str) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        """
+        Saved results of a batch
+        
+        Returns:
+            Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]: ({"batch_id", "total",
+                "completed"}, results in item order), or None for an unknown batch
+        """
+        info = self.batches.info(batch_id)
+        if info is None:
+            return None
+        saved = self.batches.completed(batch_id)
+        return {"batch_id": batch_id, "total": info["total"], "completed": len(saved)}, [saved[i] for i in sorted(saved)]
+    
+    async def _generate(self, messages: List[Dict[str, str]]) -> Completion:
+        """Send a standalone list of chat messages to the LLM service"""
+        return await get_llm_service().generate_messages(messages)
+    
+    async def stream_request(self, messages: List[Dict[str, str]], agent_type: str = "chatbot", chat_id: Optional[str] = None, client_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Admit a streaming AI request and return its event stream.
+        
+        The returned iterator yields {"type": "token", "content": ...} events
+        while the model is generating, followed by exactly one
+        {"type": "done", "message": ...} event carrying the same response dict
+        process_request would return. Admission happens before this returns,
+        so callers can still answer with a 429 when the queue is full.
+        
+        The run slot belongs to the returned iterator from then on: it is
+        released when the iterator finishes or is closed, including when it
+        is dropped without ever being iterated (a client that disconnects
+        before the response starts).
+        
+        Raises:
+            SchedulerOverloaded: If the request queue is full
+        """
+        self.logger.info(f"Streaming request with agent type: {agent_type}")
+        events = self._stream_events(messages, agent_type, chat_id, client_id)
+        # Run the stream up to admission, so its own finally holds the slot
+        await events.__anext__()
+        return events
+    
+    async def _stream_events(self, messages: List[Dict[str, str]], agent_type: str, chat_id: Optional[str], client_id: Optional[str]) -> AsyncIterator[Dict[str, Any]]:
+        label = self._agent_label(agent_type)
+        queue_wait = await self.scheduler.acquire(label, client_id)
+        started = time.monotonic()
+        attributes = {"agent_type": label, "queue_wait_ms": round(queue_wait * 1000, 2)}
+        try:
+            # Consumed by stream_request; never reaches the caller
+            yield {"type": "admitted"}
+            with self.tracer.start_as_current_span("agent.stream", attributes):
+                async for event in self._generate_events(messages, agent_type, chat_id):
+                    if event["type"] == "done":
+                        event["message"].setdefault("metadata", {})["queue_wait_ms"] = round(queue_wait * 1000, 2)
+                    yield event
+        finally:
+            elapsed = time.monotonic() - started
+            self.scheduler.release(elapsed)
+            REQUEST_LATENCY.observe(queue_wait + elapsed, (label,))
+    
+    async def _generate_events(self, messages: List[Dict[str, str]], agent_type: str, chat_id: Optional[str]) -> AsyncIterator[Dict[str, Any]]:
+        if agent_type not in self.agents:
+            agent_type = "chatbot"
+        if agent_type == "chatbot":
+            response = await self._answer_from_faq(messages)
+            if response is not None:
+                yield {"type": "token", "content": response["content"]}
+                yield {"type": "done", "message": response}
+                return
+        
+        try:
+            prepared = await self._prepare_prompt(agent_type, messages, chat_id)
+        except Exception as e:
+            yield {"type": "done", "message": self._handle_error(e, agent_type)}
+            return
+        
+        # Agents without a streamable prompt (analysis, empty summaries) answer in one piece
+        if prepared is None:
+            response = await self._dispatch(messages, agent_type, chat_id)
+            yield {"type": "token", "content": response["content"]}
+            yield {"type": "done", "message": response}
+            return
+        
+        prompt, metadata = prepared
+        chunks = []
+        try:
+            llm_service = get_llm_service()
+            async for token in llm_service.stream_messages(prompt):
+                chunks.append(token)
+                yield {"type": "token", "content": token}
+        except Exception as e:
+            yield {"type": "done", "message": self._handle_error(e, agent_type)}
+            return
+        
+        response = "".join(chunks)
+        # Streamed completions carry no provider usage; count the answer locally
+        metadata["tokens_used"] = llm_service.token_counter(response)
+        yield {"type": "done", "message": self._format_response(response, agent_type, metadata)}
+    
+    async def _prepare_prompt(self, agent_type: str, messages: List[Dict[str, str]], chat_id: Optional[str]) -> Optional[Tuple[List[Dict[str, str]], Dict[str, Any]]]:
+        """Run the agent's prompt builder, if it has one, in its own span"""
+        builder = self.prompt_builders.get(agent_type)
+        if builder is None:
+            return None
+        with self.tracer.start_as_current_span("agent.build_prompt", {"agent_type": agent_type}) as span:
+            prepared = await builder(messages, chat_id)
+            context = prepared[1].get("context") if prepared else None
+            if context:
+                span.set_attributes({
+                    "prompt.tokens": context["prompt_tokens_after"],
+                    "prompt.static_prefix_tokens": context["static_prefix_tokens"],
+                    "prompt.messages_trimmed": context["messages_trimmed"],
+                })
+        return prepared
+    
+    async def _build_chatbot_prompt(self, messages: List[Dict[str, str]], chat_id: Optional[str] = None) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """Build the financial advisor chat messages. Returns (messages, metadata)."""
+        # Get the last message from the user
+        last_message = messages[-1]["content"] if messages else ""
+        
+        # Excerpts from internal documents relevant to the question
+        excerpts = await self._retrieve_documents(last_message)
+        document_context = ""
+        if excerpts:
+            document_context = "Relevant excerpts from internal documents:\n"
+            for i, excerpt in enumerate(excerpts, start=1):
+                source = os.path.basename(excerpt["source"])
+                heading = f" > {excerpt['heading']}" if excerpt["heading"] else ""
+                document_context += f"[{i}] ({source}{heading})\n{excerpt['text']}\n"
+            document_context += "\n"
+        
+        # Keep as much earlier conversation as fits the chatbot's token budget
+        history, summary, context_metrics = await self.context_window.fit(
+            "chatbot",
+            messages[:-1],
+            reserved_tokens=self.token_counter(last_message) + self.token_counter(document_context) + MESSAGE_OVERHEAD_TOKENS,
+            chat_id=chat_id,
+        )
+        
+        # The conversation goes to the model as its own turns, after the system
+        # message and ahead of the new question, so it is sent exactly once
+        conversation = []
+        if summary:
+            conversation.append({"role": "system", "content": f"Summary of earlier conversation:\n{summary}"})
+        for msg in history:
+            conversation.append({"role": "user" if msg["role"] == "user" else "assistant", "content": msg["content"]})
+        prompt = CHATBOT_PROMPT.messages(conversation, documents=document_context, question=last_message)
+        
+        # Report prompt size before and after trimming the transcript
+        prompt_tokens = get_llm_service().count_prompt_tokens(prompt)
+        metadata = {
+            "response_type": "financial_advice",
+            "context": {
+                "prompt_tokens_before": prompt_tokens - context_metrics["history_tokens_after"] + context_metrics["history_tokens_before"],
+                "prompt_tokens_after": prompt_tokens,
+                "static_prefix_tokens": CHATBOT_PROMPT.system_tokens(self.token_counter),
+                "messages_trimmed": context_metrics["messages_trimmed"],
+                "token_budget": context_metrics["token_budget"],
+            },
+        }
+        if excerpts:
+            metadata["sources"] = [
+                {"source": os.path.basename(e["source"]), "heading": e["heading"], "score": e["score"]} for e in excerpts
+            ]
+        return prompt, metadata
+    
+    async def _process_chatbot_request(self, messages: List[Dict[str, str]], chat_id: Optional[str] = None) -> Dict[str, Any]:
         """Process a request using the chatbot agent with GPT-4o mini as a financial advisor"""
+        response = await self._answer_from_faq(messages)
+        if response is not None:
+            return response
+        
         try:
-            # Get the last message from the user
-            last_message = messages[-1]["content"] if messages else ""
-            
-            # Format conversation history for context
-            conversation_history = ""
-            if len(messages) > 1:
-                conversation_history = "\n\nConversation history:\n"
-                for i, msg in enumerate(messages[:-1]):
-                    role = "User" if msg["role"] == "user" else "Assistant"
-                    conversation_history += f"{role}: {msg['content']}\n"
-            
-            # Comprehensive financial advisor prompt
-            financial_advisor_prompt = """
-            You are a knowledgeable and ethical financial advisor assistant with expertise in:
-            1. Personal finance and budgeting
-            2. Investment strategies and portfolio management
-            3. Retirement planning and savings
-            4. Tax optimization strategies
-            5. Insurance and risk management
-            6. Debt management and credit improvement
-            
-            Guidelines:
-            - Provide personalized, actionable financial advice based on the information shared
-            - Always prioritize the client's long-term financial well-being
-            - Explain financial concepts in clear, simple terms while maintaining accuracy
-            - Disclose limitations and uncertainties in your advice
-            - When appropriate, suggest seeking professional advice for complex situations
-            - Do not recommend specific investment products or make promises about returns
-            - Maintain a professional, supportive, and non-judgmental tone
-            - Ask clarifying questions when needed to provide better guidance
-            
-            User's query: {last_message}
-            {conversation_history}
-            
-            Please provide helpful financial advice based on the above information:
-            """
+            prompt, metadata = await self._prepare_prompt("chatbot", messages, chat_id)
             
             # Use the LLM service to generate a financial advisor response
             llm_service = get_llm_service()
-            response = await llm_service.generate_response(financial_advisor_prompt.format(
-                last_message=last_message,
-                conversation_history=conversation_history
-            ))
+            completion = await llm_service.generate_messages(prompt)
             
             # Use the centralized response formatter
+            metadata.update(self._token_usage(completion))
             return self._format_response(
-                content=response,
+                content=completion.text,
                 agent_type="chatbot",
-                metadata={
-                    "response_type": "financial_advice",
-                    "tokens_used": len(response.split()) * 1.3  # Estimate
-                }
+                metadata=metadata
             )
         except Exception as e:
             return self._handle_error(e, "chatbot")
     
-    async def _process_summary_request(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    @staticmethod
+    def _token_usage(completion) -> Dict[str, int]:
+        """Response metadata for the tokens a completion cost upstream"""
+        return {
+            "prompt_tokens": completion.prompt_tokens,
+            "cached_prompt_tokens": completion.cached_prompt_tokens,
+            "completion_tokens": completion.completion_tokens,
+            "tokens_used": completion.total_tokens,
+            "cached": completion.cached,
+        }
+    
+    def warm_up(self):
+        """
+        Load what the first chat request would otherwise load: the chat model
+        client, the tokenizer and, when FAQ matching is on, the embedding stack.
+        Blocking; main.py runs it in a worker thread at startup.
+        """
+        get_llm_service().warm_up()
+        self.token_counter("")
+        if self.faq_enabled:
+            self._get_faq_index()
+    
+    def _get_faq_index(self):
+        if self._faq_index is None:
+            # Imported here so numpy is only needed once FAQ matching is used
+            from .faq_index import FAQIndex
+            from .embeddings import get_embedding_service
+            self._faq_index = FAQIndex.from_env(get_embedding_service())
+        return self._faq_index
+    
+    def _get_document_index(self):
+        if self._document_index is None:
+            from .document_index import DocumentIndex
+            from .embeddings import get_embedding_service
+            self._document_index = DocumentIndex.from_env(get_embedding_service(), self.token_counter)
+        return self._document_index
+    
+    async def reindex_documents(self) -> Dict[str, Any]:
+        """
+        Re-index the RAG corpus, re-reading only new and changed files
+        
+        Returns:
+            Dict[str, Any]: Sync counts, or {"enabled": False} without RAG_CORPUS_DIR
+        """
+        if not self.rag_corpus:
+            return {"enabled": False}
+        return {"enabled": True, **await self._get_document_index().sync(self.rag_corpus)}
+    
+    async def _retrieve_documents(self, query: str) -> List[Dict[str, Any]]:
+        """Top document chunks for a query; empty when RAG is off or retrieval fails"""
+        if not self.rag_corpus or not query.strip():
+            return []
+        with self.tracer.start_as_current_span("rag.retrieve") as span:
+            try:
+                excerpts = await self._get_document_index().search(query, self.rag_top_k, self.rag_min_score)
+            except Exception as e:
+                self.logger.warning(f"Document retrieval failed, answering without it: {str(e)}")
+                span.record_exception(e)
+                return []
+            span.set_attribute("rag.results", len(excerpts))
+            return excerpts
+    
+    async def search_faqs(self, question: str, k: int = 3) -> List[Dict[str, Any]]:
+        """Find the FAQ entries most similar to a question, best first"""
+        index = self._get_faq_index()
+        await index.sync(await get_database_service().get_faqs())
+        return [{**entry, "similarity": round(score, 4)} for entry, score in await index.search(question, k)]
+    
+    async def _answer_from_faq(self, messages: List[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+        """Answer the latest user message from a matching FAQ entry, or None to use the model"""
+        if not self.faq_enabled or not messages or messages[-1]["role"] != "user":
+            return None
+        with self.tracer.start_as_current_span("faq.match") as span:
+            try:
+                index = self._get_faq_index()
+                await index.sync(await get_database_service().get_faqs())
+                match = await index.match(messages[-1]["content"])
+            except Exception as e:
+                # Retrieval is an optimization; the model can still answer
+                self.logger.warning(f"FAQ lookup failed, falling back to the model: {str(e)}")
+                span.record_exception(e)
+                return None
+            span.set_attribute("faq.hit", match is not None)
+        if match is None:
+            return None
+        
+        entry, score = match
+        return self._format_response(
+            content=entry["answer"],
+            agent_type="chatbot",
+            metadata={
+                "response_type": "faq",
+                "faq_question": entry["question"],
+                "similarity": round(score, 4),
+                "tokens_used": 0
+            }
+        )
+    
+    async def _process_summary_request(self, messages: List[Dict[str, str]], chat_id: Optional[str] = None) -> Dict[str, Any]:
         """Process a request using the summary agent with GPT-4o mini"""
         try:
             # Get all the messages to summarize
             message_texts = [msg["content"] for msg in messages if msg["role"] != "assistant"]
-            combined_text = "\n".join(message_texts)
             
-            if not combined_text.strip():
+            if not "".join(message_texts).strip():
                 return self._format_response(
                     content="There's no content to summarize. Please provide some text or questions to generate a summary.",
                     agent_type="summary",
                     metadata={"response_type": "empty_input_warning"}
                 )
             
-            # Use the LLM service to generate a summary
-            llm_service = get_llm_service()
-            response = await llm_service.generate_response(
-                f"Please provide a concise summary of the following conversation:\n{combined_text}"
-            )
+            # Fold only the messages added since this chat's last summary
+            response, summary_metrics = await self.summarizer.summarize(message_texts, key=chat_id)
             
             # Return formatted response
             return self._format_response(
@@ -201,21 +624,87 @@ class AIService:
                 metadata={
                     "response_type": "conversation_summary",
                     "source_messages": len(message_texts),
-                    "tokens_used": len(response.split()) * 1.3  # Estimate
+                    "new_messages": summary_metrics["new_messages"],
+                    "llm_calls": summary_metrics["llm_calls"],
+                    # Summed over every call the summarizer made, as reported upstream
+                    "prompt_tokens": summary_metrics["prompt_tokens"],
+                    "cached_prompt_tokens": summary_metrics["cached_prompt_tokens"],
+                    "completion_tokens": summary_metrics["completion_tokens"],
+                    "tokens_used": summary_metrics["prompt_tokens"] + summary_metrics["completion_tokens"],
                 }
             )
         except Exception as e:
             return self._handle_error(e, "summary")
         
     
-    async def _process_analysis_request(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
-        """Process a request using the analysis agent"""
-        # Placeholder for analysis agent logic
-        return self._format_response(
-            content="This is a placeholder analysis. LangChain integration coming soon.",
-            agent_type="analysis",
-            metadata={"response_type": "placeholder"}
-        )
+    async def analyze_inventory(self, data: bytes, filename: str, chat_id: str, question: Optional[str] = None, client_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Run the inventory analysis engine on an uploaded table and narrate the results
+        
+        Raises:
+            InventoryDataError: If the table cannot be read or lacks required columns
+            SchedulerOverloaded: If the request queue is full
+        """
+        self.logger.info(f"Analyzing inventory table {filename} for chat {chat_id}")
+        
+        # CPU-bound work runs off the event loop
+        summary = await asyncio.to_thread(self._run_inventory_analysis, data, filename)
+        await self._save_inventory_summary(chat_id, summary)
+        
+        messages = [{"role": "user", "content": question or "Give me an overview of this inventory."}]
+        return await self.process_request(messages, "analysis", chat_id, client_id)
+    
+    def _run_inventory_analysis(self, data: bytes, filename: str) -> Dict[str, Any]:
+        # Imported here so pandas/numpy are only needed when the analysis agent is used
+        from .inventory_analysis import InventoryAnalyzer, load_inventory_table
+        
+        analyzer = InventoryAnalyzer()
+        results = analyzer.analyze(load_inventory_table(data, filename))
+        return analyzer.summarize(results)
+    
+    async def _save_inventory_summary(self, chat_id: str, summary: Dict[str, Any]):
+        if self.shared_state is not None:
+            await asyncio.to_thread(self.shared_state.set, f"inventory:{chat_id}", summary, DEFAULT_TTL)
+            return
+        self.inventory_summaries[chat_id] = summary
+        self.inventory_summaries.move_to_end(chat_id)
+        while len(self.inventory_summaries) > self.max_inventory_summaries:
+            self.inventory_summaries.popitem(last=False)
+    
+    async def _inventory_summary(self, chat_id: str) -> Optional[Dict[str, Any]]:
+        if self.shared_state is not None:
+            return await asyncio.to_thread(self.shared_state.get, f"inventory:{chat_id}")
+        return self.inventory_summaries.get(chat_id)
+    
+    async def _process_analysis_request(self, messages: List[Dict[str, str]], chat_id: Optional[str] = None) -> Dict[str, Any]:
+        """Process a request using the analysis agent, narrating precomputed inventory metrics"""
+        try:
+            summary = await self._inventory_summary(chat_id) if chat_id else None
+            if summary is None:
+                return self._format_response(
+                    content="Please upload an inventory table (CSV with sku, date, on_hand and units_sold columns) so I can analyze it.",
+                    agent_type="analysis",
+                    metadata={"response_type": "missing_inventory_data"}
+                )
+            
+            question = messages[-1]["content"] if messages else ""
+            prompt = ANALYSIS_PROMPT.messages(results=json.dumps(summary), question=question)
+            
+            # The model only narrates; every number comes from the analysis engine
+            llm_service = get_llm_service()
+            completion = await llm_service.generate_messages(prompt)
+            
+            return self._format_response(
+                content=completion.text,
+                agent_type="analysis",
+                metadata={
+                    "response_type": "inventory_analysis",
+                    "analysis": summary,
+                    **self._token_usage(completion)
+                }
+            )
+        except Exception as e:
+            return self._handle_error(e, "analysis")
 
 # Singleton instance
 ai_service = AIService()
@@ -0,0 +1,81 @@
+"""
+Result store for batch chat requests.
+
+A batch is a list of chat requests run in one call to AIService.process_batch.
+Every item that finishes successfully is saved here under the batch's id as
+soon as it completes, so an interrupted batch (dropped connection, restarted
+worker) can be submitted again with the same batch_id: saved items are
+replayed instead of being sent to the model again, and only the rest run.
+
+Results are kept in the shared state store when SHARED_STATE_PATH is set, so
+any worker can resume a batch, and otherwise in their own SQLite file
+(BATCH_STORE_PATH, default DATA_DIR/batches.db). They expire after
+BATCH_RESULTS_TTL seconds.
+"""
+import os
+import json
+import hashlib
+from typing import Any, Dict, List, Optional
+
+from .paths import data_path
+from .shared_state import SharedState, get_shared_state
+
+
+class BatchConflictError(ValueError):
+    """A batch_id was reused for a different list of requests"""
+
+
+def batch_fingerprint(requests: List[Dict[str, Any]]) -> str:
+    """Hash of a batch's requests, to recognise the same batch when it is resubmitted"""
+    return hashlib.sha256(json.dumps(requests, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class BatchResultStore:
+    """
+    Completed batch items, keyed by batch_id and item index
+
+    Args:
+        state (SharedState): Store the results are written to
+        ttl (float): Seconds a batch's results are kept after its last update
+    """
+    def __init__(self, state: SharedState, ttl: float = 7 * 86400.0):
+        self.state = state
+        self.ttl = ttl
+
+    @classmethod
+    def from_env(cls) -> "BatchResultStore":
+        """Build from SHARED_STATE_PATH (or BATCH_STORE_PATH, default DATA_DIR/batches.db) and BATCH_RESULTS_TTL"""
+        state = get_shared_state() or SharedState(os.getenv("BATCH_STORE_PATH") or data_path("batches.db"))
+        return cls(state, ttl=float(os.getenv("BATCH_RESULTS_TTL", str(7 * 86400))))
+
+    def begin(self, batch_id: str, requests: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+        """
+        Register a batch, or recognise a resubmitted one
+
+        Returns:
+            Dict[int, Dict[str, Any]]: Results already saved for the batch, by item index
+
+        Raises:
+            BatchConflictError: If batch_id was used for different requests
+        """
+        fingerprint = batch_fingerprint(requests)
+
+        def register(meta):
+            if meta is not None and meta["fingerprint"] != fingerprint:
+                raise BatchConflictError(f"Batch {batch_id} was submitted with different requests")
+            return meta or {"fingerprint": fingerprint, "total": len(requests)}
+
+        self.state.update(f"batch:{batch_id}:meta", register, ttl=self.ttl)
+        return self.completed(batch_id)
+
+    def info(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """The batch's size and fingerprint, or None if it is unknown or expired"""
+        return self.state.get(f"batch:{batch_id}:meta")
+
+    def completed(self, batch_id: str) -> Dict[int, Dict[str, Any]]:
+        """Saved results of a batch, by item index"""
+        return {result["index"]: result for _, result in self.state.scan(f"batch:{batch_id}:item:")}
+
+    def save(self, batch_id: str, result: Dict[str, Any]):
+        """Save a finished item's result (a dict with its "index")"""
+        self.state.set(f"batch:{batch_id}:item:{result['index']:08d}", result, ttl=self.ttl)
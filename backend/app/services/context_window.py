@@ -0,0 +1,136 @@
+"""
+Token-budgeted context windows for the agents.
+
+Each agent type has a token budget for the conversation transcript it sends
+to the model, and only the newest turns of a transcript are considered at
+all, so the prompt (and the work of sizing it) stays bounded however long a
+chat or a client-sent history grows. When a transcript is over budget the
+oldest turns are dropped,
+and with the "summarize" strategy they are replaced by a rolling summary that
+is kept per chat and only extended with newly dropped turns
+(see summarizer.IncrementalSummarizer). The summary counts against the
+budget too: if it does not fit next to the kept turns, more of them are
+dropped and folded into it.
+"""
+import os
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .summarizer import IncrementalSummarizer
+from .tokens import MESSAGE_OVERHEAD_TOKENS
+
+DEFAULT_BUDGETS = {
+    "chatbot": 3000,
+    "summary": 12000,
+    "analysis": 3000,
+}
+
+
+class ContextWindowManager:
+    """
+    Fits conversation transcripts into per-agent token budgets.
+
+    Args:
+        token_counter (Callable[[str], int]): Function used to size messages
+        budgets (Optional[Dict[str, int]]): Token budget per agent type
+        strategy (str): "trim" to drop old turns, "summarize" to replace them with a summary
+        summarizer (Optional[IncrementalSummarizer]): Produces rolling summaries for "summarize"
+        max_turns (int): Newest user/assistant turns considered per request (0 for no limit)
+    """
+    def __init__(
+        self,
+        token_counter: Callable[[str], int],
+        budgets: Optional[Dict[str, int]] = None,
+        strategy: str = "trim",
+        summarizer: Optional[IncrementalSummarizer] = None,
+        max_turns: int = 10,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.token_counter = token_counter
+        self.budgets = budgets or dict(DEFAULT_BUDGETS)
+        self.strategy = strategy
+        self.summarizer = summarizer
+        self.max_turns = max_turns
+
+    @classmethod
+    def from_env(cls, token_counter: Callable[[str], int], summarizer: Optional[IncrementalSummarizer] = None) -> "ContextWindowManager":
+        """Build a manager from CONTEXT_TOKEN_BUDGET_<AGENT>, CONTEXT_TRIM_STRATEGY and CONTEXT_MAX_TURNS"""
+        budgets = {
+            agent: int(os.getenv(f"CONTEXT_TOKEN_BUDGET_{agent.upper()}", str(default)))
+            for agent, default in DEFAULT_BUDGETS.items()
+        }
+        return cls(
+            token_counter=token_counter,
+            budgets=budgets,
+            strategy=os.getenv("CONTEXT_TRIM_STRATEGY", "trim").lower(),
+            summarizer=summarizer,
+            max_turns=int(os.getenv("CONTEXT_MAX_TURNS", "10")),
+        )
+
+    def message_tokens(self, message: Dict[str, str]) -> int:
+        return self.token_counter(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+    async def fit(
+        self,
+        agent_type: str,
+        history: List[Dict[str, str]],
+        reserved_tokens: int = 0,
+        chat_id: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, str]], Optional[str], Dict[str, int]]:
+        """
+        Fit earlier messages into the agent's budget.
+
+        Args:
+            agent_type (str): Agent whose budget applies
+            history (List[Dict[str, str]]): Earlier messages, oldest first
+            reserved_tokens (int): Budget already used by the current query
+            chat_id (Optional[str]): Chat the rolling summary belongs to
+
+        Returns:
+            Tuple[List[Dict[str, str]], Optional[str], Dict[str, int]]:
+                Kept messages, summary of dropped messages (or None), and metrics
+        """
+        budget = self.budgets.get(agent_type, DEFAULT_BUDGETS["chatbot"])
+        # Turns older than the window are dropped before anything is sized
+        outside = max(0, len(history) - 2 * self.max_turns) if self.max_turns else 0
+        history = history[outside:]
+        sizes = [self.message_tokens(msg) for msg in history]
+        total = sum(sizes)
+        available = budget - reserved_tokens
+
+        # Keep the newest messages that fit, walking backwards
+        start = self._first_kept(sizes, len(history), available)
+
+        summary, summary_tokens = None, 0
+        if start and self.strategy == "summarize" and self.summarizer is not None:
+            while True:
+                # Only turns dropped since the last request are sent to the model
+                summary, _ = await self.summarizer.summarize(
+                    [f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}" for msg in history[:start]],
+                    key=f"context:{chat_id}" if chat_id else None,
+                )
+                # The summary goes to the model as its own message
+                summary_tokens = self.token_counter(summary) + MESSAGE_OVERHEAD_TOKENS
+                fitted = self._first_kept(sizes, len(history), available - summary_tokens)
+                if fitted <= start:
+                    break
+                # Make room for the summary by folding more of the oldest kept turns into it
+                start = fitted
+        kept, dropped = history[start:], history[:start]
+
+        metrics = {
+            "history_tokens_before": total,
+            "history_tokens_after": sum(sizes[start:]) + summary_tokens,
+            "messages_trimmed": outside + len(dropped),
+            "token_budget": budget,
+        }
+        return kept, summary, metrics
+
+    @staticmethod
+    def _first_kept(sizes: List[int], end: int, available: int) -> int:
+        """Index of the oldest message kept when the newest ones up to `end` fill `available` tokens"""
+        start = end
+        while start > 0 and sizes[start - 1] <= available:
+            start -= 1
+            available -= sizes[start]
+        return start
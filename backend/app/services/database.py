@@ -1,39 +1,189 @@
+import os
+import json
+import time
+import asyncio
 import logging
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+from .storage import StorageBackend, create_storage_backend
+from .metrics import DB_WRITE_FAILURES, DB_WRITE_LATENCY, DB_WRITE_QUEUE
+from .tracing import get_tracer
+from .shared_state import get_shared_state
 
-# This is a simple in-memory database for now
-# In a production environment, this would be replaced with a proper database connection
+# Chats are kept in a pluggable storage backend: an in-memory dict by default,
+# or SQLite when DATABASE_BACKEND=sqlite. Every write goes through one queue
+# whose writer task stores concurrent calls in batches and retries failed
+# batches; with write-behind (unless DATABASE_WRITE_BEHIND=false) callers do
+# not wait for their write. With SHARED_STATE_PATH set (several workers) the
+# defaults become SQLite and synchronous writes, so a chat's next turn sees
+# its history on whichever worker serves it.
 class DatabaseService:
-    def __init__(self):
+    def __init__(self, backend: Optional[StorageBackend] = None, write_behind: Optional[bool] = None,
+                 queue_size: Optional[int] = None, batch_size: Optional[int] = None,
+                 write_retries: Optional[int] = None, retry_delay: float = 0.1):
         self.logger = logging.getLogger(__name__)
         self.logger.info("Initializing DatabaseService")
         
-        # In-memory storage
-        self.chats: Dict[str, List[Dict[str, str]]] = {}
+        self.backend = backend or create_storage_backend()
+        self._metric_labels = (type(self.backend).__name__,)
+        self.tracer = get_tracer()
+        
+        # Store calls queue their messages; one writer task drains the queue in batches.
+        # Write-behind callers return once queued, others once their batch is stored.
+        # A full queue makes callers wait (backpressure).
+        if write_behind is None:
+            # The read barrier only covers this process's queue
+            default = "false" if get_shared_state() is not None else "true"
+            write_behind = os.getenv("DATABASE_WRITE_BEHIND", default).lower() not in ("0", "false", "no")
+        self.write_behind = write_behind
+        self.queue_size = queue_size or int(os.getenv("DATABASE_WRITE_QUEUE_SIZE", "1000"))
+        self.batch_size = batch_size or int(os.getenv("DATABASE_BATCH_SIZE", "256"))
+        # A failed batch is retried this many times, backing off from retry_delay
+        # seconds, before its messages are given up on
+        self.write_retries = write_retries if write_retries is not None else int(os.getenv("DATABASE_WRITE_RETRIES", "5"))
+        self.retry_delay = retry_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Latest queued write per chat, and overall, for reads to wait on
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._last_write: Optional[asyncio.Future] = None
+        DB_WRITE_QUEUE.set_function(lambda: {(): self._queue.qsize() if self._queue is not None else 0})
+        
+        # How many stored messages are replayed when a request continues a chat
+        self.context_max_messages = int(os.getenv("CHAT_CONTEXT_MAX_MESSAGES", "50"))
         self.faqs: List[Dict[str, str]] = [
             {"question": "What can Inventory Analyzer AI do?", "answer": "It can analyze inventory data and provide insights."},
             {"question": "How do I use the Summary Agent?", "answer": "Select the Summary Agent option for concise analysis."},
             {"question": "How do I use the Chatbot Agent?", "answer": "Select the Chatbot Agent option for interactive conversations."}
         ]
+        # Extra FAQ/knowledge entries, a JSON list of {"question", "answer"} objects
+        faq_path = os.getenv("FAQ_PATH")
+        if faq_path:
+            with open(faq_path, encoding="utf-8") as f:
+                self.faqs.extend(json.load(f))
     
-    async def store_message(self, chat_id: str, message: Dict[str, str]):
+    async def store_message(self, chat_id: str, message: Dict[str, Any]):
         """Store a message in the specified chat"""
-        if chat_id not in self.chats:
-            self.chats[chat_id] = []
+        return await self.store_messages(chat_id, [message])
+    
+    async def store_messages(self, chat_id: str, messages: List[Dict[str, Any]]):
+        """
+        Store messages in the specified chat, in order
+        
+        The messages are queued for the writer task. With write-behind on, this
+        returns once the queue accepts them, waiting only while it is full.
+        Reads of the chat wait for its queued writes, so a follow-up turn
+        always sees them. Otherwise this returns after the backend has written
+        them.
         
-        self.chats[chat_id].append(message)
-        self.logger.info(f"Stored message in chat {chat_id}")
+        Raises:
+            Exception: Without write-behind, the backend's error if the batch
+                still failed after every retry
+        """
+        attributes = {"db.backend": self._metric_labels[0], "chat_id": chat_id,
+                      "db.messages": len(messages), "db.write_behind": self.write_behind}
+        with self.tracer.start_as_current_span("db.store_messages", attributes):
+            self._ensure_writer()
+            done = self._loop.create_future()
+            # Failures are logged by the writer; waiting readers only need completion
+            done.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._pending[chat_id] = self._last_write = done
+            await self._queue.put((chat_id, messages, done))
+            if not self.write_behind:
+                await asyncio.shield(done)
+        self.logger.debug(f"Stored {len(messages)} message(s) in chat {chat_id}")
         return True
     
-    async def get_chat_history(self, chat_id: Optional[str] = None) -> Dict[str, List[Dict[str, str]]]:
-        """Retrieve chat history, either for a specific chat or all chats"""
-        if chat_id:
-            return {chat_id: self.chats.get(chat_id, [])}
-        return self.chats
+    def _ensure_writer(self):
+        # Created lazily so the queue and task bind to the running event loop
+        loop = asyncio.get_running_loop()
+        if self._writer is None or self._writer.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._pending.clear()
+            self._last_write = None
+            self._writer = loop.create_task(self._write_loop())
+    
+    async def _write_loop(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            
+            rows = [(chat_id, message) for chat_id, messages, _ in batch for message in messages]
+            error = await self._write(rows)
+            for chat_id, _, done in batch:
+                if error is None:
+                    done.set_result(True)
+                else:
+                    done.set_exception(error)
+                if self._pending.get(chat_id) is done:
+                    del self._pending[chat_id]
+                self._queue.task_done()
+    
+    async def _write(self, rows: List[Tuple[str, Dict[str, Any]]]) -> Optional[Exception]:
+        """
+        Store a batch, retrying with exponential backoff. Later batches wait
+        meanwhile, so each chat's messages keep their order.
+        
+        Returns:
+            Optional[Exception]: None once stored, or the last error if every attempt failed
+        """
+        for attempt in range(self.write_retries + 1):
+            started = time.perf_counter()
+            try:
+                await self.backend.append_messages(rows)
+                DB_WRITE_LATENCY.observe(time.perf_counter() - started, self._metric_labels)
+                return None
+            except Exception as e:
+                if attempt == self.write_retries:
+                    DB_WRITE_FAILURES.inc(1, (self._metric_labels[0], "dropped"))
+                    self.logger.error(f"Dropping {len(rows)} queued messages after {attempt + 1} failed writes: {str(e)}")
+                    return e
+                DB_WRITE_FAILURES.inc(1, (self._metric_labels[0], "retried"))
+                delay = min(self.retry_delay * 2 ** attempt, 5.0)
+                self.logger.warning(f"Error writing {len(rows)} queued messages, retrying in {delay:.2f}s: {str(e)}")
+                await asyncio.sleep(delay)
+    
+    async def _settled(self, chat_id: Optional[str] = None):
+        """Wait until queued writes to a chat, or to every chat, have reached the backend"""
+        if self._loop is not asyncio.get_running_loop():
+            return
+        pending = self._pending.get(chat_id) if chat_id else self._last_write
+        if pending is not None and not pending.done():
+            await asyncio.wait([pending])
+    
+    async def flush(self):
+        """Wait until every queued write has reached the backend"""
+        if self._queue is not None and self._loop is asyncio.get_running_loop():
+            await self._queue.join()
+    
+    async def get_conversation(self, chat_id: str) -> List[Dict[str, str]]:
+        """Rebuild the recent role/content transcript of a chat to continue it"""
+        await self._settled(chat_id)
+        messages = await self.backend.get_recent_messages(chat_id, self.context_max_messages)
+        return [{"content": msg["content"], "role": msg["role"]} for msg in messages]
+    
+    async def get_messages_page(self, chat_id: str, limit: int = 50, cursor: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Retrieve one page of a chat's messages, oldest first, and the cursor for the next page"""
+        await self._settled(chat_id)
+        return await self.backend.get_messages_page(chat_id, limit, cursor)
+    
+    async def list_chats(self, limit: int = 50, cursor: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Retrieve one page of chat summaries with a last-message preview, newest chat first"""
+        await self._settled()
+        return await self.backend.list_chats(limit, cursor)
     
     async def get_faqs(self) -> List[Dict[str, str]]:
         """Retrieve all FAQs"""
         return self.faqs
+    
+    async def close(self):
+        """Flush queued and pending writes and close the storage backend"""
+        await self.flush()
+        if self._writer is not None and not self._writer.done():
+            self._writer.cancel()
+        await self.backend.close()
 
 # Singleton instance
 database_service = DatabaseService()
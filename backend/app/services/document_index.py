@@ -0,0 +1,426 @@
+"""
+Retrieval over local document corpora (policy and product markdown, PDFs).
+
+Files are read as a stream of blocks, cut into heading-aware chunks of about
+`chunk_tokens` tokens, and embedded a batch at a time, so ingestion memory
+stays bounded whatever the corpus size. Chunks and their vectors live in a
+SQLite file; a sync only re-reads files whose size, mtime and content hash
+changed, and unchanged chunk texts inside a changed file come back from the
+EmbeddingService store instead of the API. Search is a matrix-vector
+product over the normalized chunk vectors.
+"""
+import os
+import re
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .embeddings import EmbeddingService
+from .paths import data_path
+
+TEXT_SUFFIXES = {".md", ".markdown", ".txt"}
+PDF_SUFFIXES = {".pdf"}
+# Chunks of a file being re-indexed are written under this path prefix until the swap
+STAGING_PREFIX = "staging:"
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+
+
+@dataclass
+class Chunk:
+    heading: str
+    text: str
+
+    @property
+    def embedding_text(self) -> str:
+        return f"{self.heading}\n{self.text}" if self.heading else self.text
+
+
+def iter_markdown_blocks(path: str) -> Iterator[Tuple[str, str]]:
+    """
+    Read a markdown or text file one line at a time
+
+    Yields:
+        Tuple[str, str]: (heading path, paragraph) per blank-line separated block;
+            fenced code blocks are kept whole
+    """
+    headings: List[str] = []
+    lines: List[str] = []
+    in_fence = False
+
+    def flush():
+        text = "\n".join(lines).strip()
+        lines.clear()
+        return text
+
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.lstrip().startswith("```"):
+                in_fence = not in_fence
+                lines.append(line)
+                continue
+            match = None if in_fence else _HEADING.match(line)
+            if match:
+                text = flush()
+                if text:
+                    yield " > ".join(headings), text
+                level = len(match.group(1))
+                headings = headings[:level - 1] + [match.group(2)]
+            elif not line.strip() and not in_fence:
+                text = flush()
+                if text:
+                    yield " > ".join(headings), text
+            else:
+                lines.append(line)
+    text = flush()
+    if text:
+        yield " > ".join(headings), text
+
+
+def iter_pdf_blocks(path: str) -> Iterator[Tuple[str, str]]:
+    """
+    Read a PDF one page at a time (requires the optional `pypdf` package)
+
+    Yields:
+        Tuple[str, str]: ("<file> p.<n>", paragraph) per paragraph of extracted text
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    name = os.path.basename(path)
+    for number, page in enumerate(reader.pages, start=1):
+        for paragraph in re.split(r"\n\s*\n", page.extract_text() or ""):
+            paragraph = " ".join(paragraph.split())
+            if paragraph:
+                yield f"{name} p.{number}", paragraph
+
+
+def chunk_blocks(
+    blocks: Iterator[Tuple[str, str]],
+    token_counter: Callable[[str], int],
+    chunk_tokens: int = 400,
+    overlap_tokens: int = 50,
+) -> Iterator[Chunk]:
+    """
+    Pack consecutive blocks under the same heading into chunks of about `chunk_tokens`
+
+    A chunk starts with the last blocks of the previous one (up to
+    `overlap_tokens`) so text cut at a boundary stays retrievable; blocks
+    longer than a chunk are split on word boundaries.
+    """
+    heading = None
+    parts: List[Tuple[str, int]] = []
+    size = 0
+
+    for block_heading, text in blocks:
+        if block_heading != heading:
+            if parts:
+                yield Chunk(heading or "", "\n\n".join(p for p, _ in parts))
+            heading, parts, size = block_heading, [], 0
+
+        tokens = token_counter(text)
+        pieces = [(text, tokens)]
+        if tokens > chunk_tokens:
+            words = text.split()
+            step = max(1, len(words) * chunk_tokens // tokens)
+            pieces = [(" ".join(words[i:i + step]), chunk_tokens) for i in range(0, len(words), step)]
+
+        for piece, piece_tokens in pieces:
+            if parts and size + piece_tokens > chunk_tokens:
+                yield Chunk(heading or "", "\n\n".join(p for p, _ in parts))
+                # Carry the tail of this chunk into the next one
+                overlap, kept = [], 0
+                for part in reversed(parts):
+                    if kept + part[1] > overlap_tokens:
+                        break
+                    overlap.insert(0, part)
+                    kept += part[1]
+                parts, size = overlap, kept
+            parts.append((piece, piece_tokens))
+            size += piece_tokens
+
+    if parts:
+        yield Chunk(heading or "", "\n\n".join(p for p, _ in parts))
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DocumentIndex:
+    """
+    Chunked, embedded and incrementally re-indexed store of local documents
+
+    Args:
+        path (str): SQLite file for chunks, vectors and file fingerprints
+        embeddings (EmbeddingService): Source of chunk and query embeddings
+        token_counter (Callable[[str], int]): Token counter used to size chunks
+        chunk_tokens (int): Target chunk size
+        overlap_tokens (int): Tokens repeated from the previous chunk
+        batch_size (int): Chunks embedded and written per step while ingesting
+    """
+    def __init__(
+        self,
+        path: str,
+        embeddings: EmbeddingService,
+        token_counter: Callable[[str], int],
+        chunk_tokens: int = 400,
+        overlap_tokens: int = 50,
+        batch_size: int = 64,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.embeddings = embeddings
+        self.token_counter = token_counter
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.batch_size = batch_size
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                digest TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                ordinal INTEGER NOT NULL,
+                heading TEXT NOT NULL,
+                text TEXT NOT NULL,
+                vector BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_path ON chunks (path);
+            """
+        )
+        # Rows left behind by a sync that was interrupted mid-file
+        self._conn.execute("DELETE FROM chunks WHERE path LIKE ?", (STAGING_PREFIX + "%",))
+        self._db_lock = threading.Lock()
+        self._sync_lock = asyncio.Lock()
+
+        # (chunk ids, normalized vectors), swapped as a pair after each sync
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._loaded = False
+
+    @classmethod
+    def from_env(cls, embeddings: EmbeddingService, token_counter: Callable[[str], int]) -> "DocumentIndex":
+        """Build from DOCUMENT_INDEX_PATH (default DATA_DIR/documents.db), RAG_CHUNK_TOKENS and RAG_CHUNK_OVERLAP"""
+        return cls(
+            os.getenv("DOCUMENT_INDEX_PATH") or data_path("documents.db"),
+            embeddings,
+            token_counter,
+            chunk_tokens=int(os.getenv("RAG_CHUNK_TOKENS", "400")),
+            overlap_tokens=int(os.getenv("RAG_CHUNK_OVERLAP", "50")),
+        )
+
+    def _execute(self, sql: str, params=()) -> List[tuple]:
+        with self._db_lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _iter_blocks(self, path: str) -> Optional[Iterator[Tuple[str, str]]]:
+        suffix = os.path.splitext(path)[1].lower()
+        if suffix in TEXT_SUFFIXES:
+            return iter_markdown_blocks(path)
+        if suffix in PDF_SUFFIXES:
+            try:
+                import pypdf  # noqa: F401
+            except ImportError:
+                self.logger.warning(f"Skipping {path}: install pypdf to index PDFs")
+                return None
+            return iter_pdf_blocks(path)
+        return None
+
+    def _scan(self, root: str) -> Dict[str, os.stat_result]:
+        found = {}
+        for directory, _, names in os.walk(root):
+            for name in names:
+                if os.path.splitext(name)[1].lower() in TEXT_SUFFIXES | PDF_SUFFIXES:
+                    path = os.path.abspath(os.path.join(directory, name))
+                    found[path] = os.stat(path)
+        return found
+
+    async def sync(self, root: str) -> Dict[str, Any]:
+        """
+        Bring the index in line with the documents under `root`
+
+        New and changed files are re-chunked and re-embedded, removed files
+        are dropped, and untouched files are not read at all.
+
+        Returns:
+            Dict[str, Any]: Counts of indexed, unchanged and removed files and new chunks
+        """
+        async with self._sync_lock:
+            started = time.perf_counter()
+            stats = {"files_indexed": 0, "files_unchanged": 0, "files_removed": 0, "chunks_written": 0}
+            found = await asyncio.to_thread(self._scan, root)
+            known = {row[0]: row[1:] for row in await asyncio.to_thread(
+                self._execute, "SELECT path, mtime_ns, size, digest FROM files"
+            )}
+
+            for path in known.keys() - found.keys():
+                await asyncio.to_thread(self._remove_file, path)
+                stats["files_removed"] += 1
+
+            for path, stat in sorted(found.items()):
+                previous = known.get(path)
+                if previous and previous[:2] == (stat.st_mtime_ns, stat.st_size):
+                    stats["files_unchanged"] += 1
+                    continue
+                digest = await asyncio.to_thread(_file_digest, path)
+                if previous and previous[2] == digest:
+                    # Touched but not edited
+                    await asyncio.to_thread(self._record_file, path, stat, digest)
+                    stats["files_unchanged"] += 1
+                    continue
+                try:
+                    written = await self._index_file(path, stat, digest)
+                except Exception as e:
+                    self.logger.error(f"Error indexing {path}: {str(e)}")
+                    continue
+                if written is not None:
+                    stats["files_indexed"] += 1
+                    stats["chunks_written"] += written
+
+            if stats["files_indexed"] or stats["files_removed"] or not self._loaded:
+                await asyncio.to_thread(self._load_matrix)
+            stats["chunks"] = len(self._ids)
+            stats["seconds"] = round(time.perf_counter() - started, 3)
+            self.logger.info(f"Document index synced: {stats}")
+            return stats
+
+    async def _index_file(self, path: str, stat: os.stat_result, digest: str) -> Optional[int]:
+        blocks = self._iter_blocks(path)
+        if blocks is None:
+            return None
+        chunks = chunk_blocks(blocks, self.token_counter, self.chunk_tokens, self.overlap_tokens)
+
+        # New rows are written under a temporary path and swapped in at the end,
+        # so searches never see a half-indexed file
+        staging = STAGING_PREFIX + path
+        await asyncio.to_thread(self._execute, "DELETE FROM chunks WHERE path = ?", (staging,))
+        ordinal = 0
+        while True:
+            batch = [chunk for _, chunk in zip(range(self.batch_size), chunks)]
+            if not batch:
+                break
+            vectors = await self.embeddings.embed([chunk.embedding_text for chunk in batch])
+            rows = [
+                (staging, ordinal + i, chunk.heading, chunk.text, np.asarray(vector, dtype=np.float32).tobytes())
+                for i, (chunk, vector) in enumerate(zip(batch, vectors))
+            ]
+            await asyncio.to_thread(self._insert_chunks, rows)
+            ordinal += len(batch)
+        await asyncio.to_thread(self._commit_file, path, staging, stat, digest)
+        return ordinal
+
+    def _insert_chunks(self, rows: List[tuple]):
+        with self._db_lock:
+            self._conn.executemany(
+                "INSERT INTO chunks (path, ordinal, heading, text, vector) VALUES (?, ?, ?, ?, ?)", rows
+            )
+
+    def _commit_file(self, path: str, staging: str, stat: os.stat_result, digest: str):
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM chunks WHERE path = ?", (path,))
+                self._conn.execute("UPDATE chunks SET path = ? WHERE path = ?", (path, staging))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO files (path, mtime_ns, size, digest) VALUES (?, ?, ?, ?)",
+                    (path, stat.st_mtime_ns, stat.st_size, digest),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _record_file(self, path: str, stat: os.stat_result, digest: str):
+        self._execute(
+            "UPDATE files SET mtime_ns = ?, size = ?, digest = ? WHERE path = ?",
+            (stat.st_mtime_ns, stat.st_size, digest, path),
+        )
+
+    def _remove_file(self, path: str):
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM chunks WHERE path = ?", (path,))
+            self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+            self._conn.execute("COMMIT")
+
+    def _load_matrix(self):
+        with self._db_lock:
+            live = "FROM chunks WHERE path NOT LIKE ?"
+            count = self._conn.execute(f"SELECT COUNT(*) {live}", (STAGING_PREFIX + "%",)).fetchone()[0]
+            cursor = self._conn.execute(f"SELECT id, vector {live} ORDER BY id", (STAGING_PREFIX + "%",))
+            ids = np.zeros(count, dtype=np.int64)
+            matrix = None
+            row = 0
+            for rows in iter(lambda: cursor.fetchmany(1024), []):
+                for chunk_id, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    if matrix is None:
+                        matrix = np.zeros((count, len(vector)), dtype=np.float32)
+                    ids[row] = chunk_id
+                    matrix[row] = vector
+                    row += 1
+        if matrix is None:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        self._ids, self._matrix = ids, matrix
+        self._loaded = True
+
+    async def search(self, query: str, k: int = 4, min_score: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        Find the chunks most relevant to a query
+
+        Returns:
+            List[Dict[str, Any]]: Up to k chunks ({source, heading, text, score}), best first
+        """
+        if not self._loaded:
+            await asyncio.to_thread(self._load_matrix)
+        ids, matrix = self._ids, self._matrix
+        if not len(ids) or not query.strip():
+            return []
+        query_vector = (await self.embeddings.embed([query], persist=False))[0]
+        scores = matrix @ (query_vector / max(float(np.linalg.norm(query_vector)), 1e-12))
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = [i for i in top[np.argsort(-scores[top])] if scores[i] >= min_score]
+        if not top:
+            return []
+
+        chunk_ids = [int(ids[i]) for i in top]
+        placeholders = ",".join("?" * len(chunk_ids))
+        rows = {row[0]: row[1:] for row in await asyncio.to_thread(
+            self._execute, f"SELECT id, path, heading, text FROM chunks WHERE id IN ({placeholders})", chunk_ids
+        )}
+        return [
+            {"source": rows[cid][0], "heading": rows[cid][1], "text": rows[cid][2], "score": round(float(scores[i]), 4)}
+            for cid, i in zip(chunk_ids, top) if cid in rows
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        files = self._execute("SELECT COUNT(*) FROM files")[0][0]
+        return {"files": files, "chunks": len(self._ids)}
+
+    def close(self):
+        with self._db_lock:
+            self._conn.close()
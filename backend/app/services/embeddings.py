@@ -0,0 +1,378 @@
+"""
+Embeddings for retrieval features.
+
+OpenAIEmbedder calls the provider's Embeddings API through the same
+OpenAI-compatible endpoint, shared HTTP pool and retry policy as the chat
+model. EmbeddingService sits in front of it and keeps that API cheap:
+
+- texts are deduplicated by content hash, both within a call and against
+  requests already in flight;
+- texts from concurrent callers are gathered into one API request of up to
+  `batch_size` inputs;
+- vectors are kept in an EmbeddingStore, an append-only, memory-mapped
+  float32 file with an offset index, so a restarted worker reuses earlier
+  work without reading or copying the vectors into memory. Several worker
+  processes can share one store: appends take a file lock and first pick up
+  rows the other workers added.
+"""
+import os
+import json
+import hashlib
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Protocol, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+import numpy as np
+import openai
+
+from .http_client import get_http_client
+from .paths import data_path
+from .resilience import ResilientCaller
+
+OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+
+
+class Embedder(Protocol):
+    """Anything that embeds a list of texts in one request"""
+    model: str
+
+    async def embed(self, texts: List[str]) -> np.ndarray: ...
+
+
+class OpenAIEmbedder:
+    """
+    Embeds texts with the provider's Embeddings API
+
+    Args:
+        model (str): Embedding model or deployment name
+    """
+    def __init__(self, model: str = OPENAI_EMBEDDING_MODEL):
+        self.logger = logging.getLogger(__name__)
+        self.model = model
+        self.client = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_API_BASE") or None,
+            http_client=get_http_client(),
+            max_retries=0,
+        )
+        self.resilience = ResilientCaller.from_env()
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts in one request
+
+        Returns:
+            np.ndarray: float32 matrix with one row per text
+
+        Raises:
+            LLMError: Typed upstream failure, after retries for transient errors
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        response = await self.resilience.call(
+            self.model, lambda: self.client.embeddings.create(model=self.model, input=texts)
+        )
+        rows = sorted(response.data, key=lambda item: item.index)
+        return np.asarray([row.embedding for row in rows], dtype=np.float32)
+
+
+class EmbeddingStore:
+    """
+    Append-only vector store backed by a memory-mapped float32 file
+
+    `path` holds the vectors back to back; `path + ".idx"` starts with a JSON
+    header ({"model", "dim"}) followed by one content hash per line, so the
+    line number of a hash is its row in the vector file. Writers hold an
+    exclusive lock on `path + ".lock"`, so processes sharing the files append
+    whole rows one after another.
+
+    Args:
+        path (str): Vector file path
+        model (str): Embedding model the vectors come from
+    """
+    def __init__(self, path: str, model: str):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.index_path = path + ".idx"
+        self.model = model
+        self.dim: Optional[int] = None
+        self.offsets: Dict[str, int] = {}
+        self.rows = 0
+        self._index_size = 0
+        self._vectors: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        with self._file_lock():
+            self._load()
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock against other processes using the same store"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self):
+        self.dim, self.offsets, self.rows, self._index_size, self._vectors = None, {}, 0, 0, None
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, encoding="utf-8") as f:
+            header = json.loads(f.readline() or "{}")
+            keys = f.read().split()
+        if header.get("model") != self.model or not header.get("dim"):
+            self.logger.warning(f"Embedding store {self.path} is for another model; starting a new one")
+            os.remove(self.index_path)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+
+        self.dim = int(header["dim"])
+        row_bytes = self.dim * 4
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        rows = min(len(keys), size // row_bytes)
+        if rows != len(keys) or size != rows * row_bytes:
+            # An interrupted append left the files out of step; keep the complete rows
+            self.logger.warning(f"Truncating embedding store {self.path} to {rows} complete rows")
+            with open(self.path, "ab") as f:
+                f.truncate(rows * row_bytes)
+            self._write_index(keys[:rows])
+        self.offsets = {key: row for row, key in enumerate(keys[:rows])}
+        self.rows = rows
+        self._index_size = os.path.getsize(self.index_path)
+        self._remap(rows)
+
+    def _catch_up(self):
+        """Pick up rows other processes appended since this one last looked (file lock held)"""
+        size = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        if size == self._index_size:
+            return
+        if size < self._index_size or self.dim is None:
+            # Rewritten by another process (e.g. a model change); start from the files
+            self._load()
+            return
+        with open(self.index_path, encoding="utf-8") as f:
+            f.seek(self._index_size)
+            keys = f.read().split()
+        for key in keys:
+            self.offsets[key] = self.rows
+            self.rows += 1
+        self._index_size = size
+        self._remap(self.rows)
+
+    def _write_index(self, keys: List[str]):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"model": self.model, "dim": self.dim}) + "\n")
+            f.writelines(key + "\n" for key in keys)
+        os.replace(tmp_path, self.index_path)
+
+    def _remap(self, rows: int):
+        self._vectors = np.memmap(self.path, dtype=np.float32, mode="r", shape=(rows, self.dim)) if rows else None
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Stored vector for a content hash (a read-only view into the mapped file), or None"""
+        row = self.offsets.get(key)
+        if row is None or self._vectors is None or row >= len(self._vectors):
+            return None
+        return self._vectors[row]
+
+    def add(self, keys: List[str], vectors: np.ndarray):
+        """Append vectors; keys already stored are skipped"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock, self._file_lock():
+            self._catch_up()
+            fresh = [i for i, key in enumerate(keys) if key not in self.offsets]
+            if not fresh:
+                return
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._write_index([])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional embeddings, got {vectors.shape[1]}")
+            # Vectors first: rows without an index line are discarded on load
+            with open(self.path, "ab") as f:
+                f.write(vectors[fresh].tobytes())
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.writelines(keys[i] + "\n" for i in fresh)
+            for i in fresh:
+                self.offsets[keys[i]] = self.rows
+                self.rows += 1
+            self._index_size = os.path.getsize(self.index_path)
+            self._remap(self.rows)
+
+
+class EmbeddingService:
+    """
+    Batching, deduplicating and caching front end for an Embedder
+
+    Args:
+        embedder (Embedder): Client that embeds one batch per request
+        store (Optional[EmbeddingStore]): Persistent vector cache; None keeps nothing
+        batch_size (int): Most texts sent in one request
+        batch_wait (float): Seconds to gather texts from concurrent callers before sending
+    """
+    def __init__(self, embedder: Embedder, store: Optional[EmbeddingStore] = None, batch_size: int = 256, batch_wait: float = 0.005):
+        self.logger = logging.getLogger(__name__)
+        self.embedder = embedder
+        self.model = embedder.model
+        self.store = store
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+
+        # key -> (text, future, persist) waiting for the next batch
+        self._pending: Dict[str, Tuple[str, asyncio.Future, bool]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Running batches, referenced until they finish so they are not garbage collected
+        self._batches: Set[asyncio.Task] = set()
+
+        self.requests = 0
+        self.texts_embedded = 0
+        self.store_hits = 0
+        self.deduplicated = 0
+
+    @classmethod
+    def from_env(cls, embedder: Embedder) -> "EmbeddingService":
+        """
+        Build from EMBEDDING_STORE_PATH (default DATA_DIR/embeddings.f32, empty for no
+        store), EMBEDDING_BATCH_SIZE and EMBEDDING_BATCH_WAIT_MS
+        """
+        path = os.getenv("EMBEDDING_STORE_PATH")
+        if path is None:
+            path = data_path("embeddings.f32")
+        return cls(
+            embedder,
+            store=EmbeddingStore(path, embedder.model) if path else None,
+            batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "256")),
+            batch_wait=float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5")) / 1000,
+        )
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\x00{text}".encode("utf-8")).hexdigest()
+
+    async def embed(self, texts: List[str], persist: bool = True) -> np.ndarray:
+        """
+        Embed texts, reusing stored and in-flight work
+
+        Args:
+            texts (List[str]): Texts to embed
+            persist (bool): Keep new vectors in the store. Pass False for one-off
+                texts such as search queries so the store does not grow without bound.
+
+        Returns:
+            np.ndarray: float32 matrix with one row per text
+
+        Raises:
+            LLMError: If the embeddings request failed
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        keys = [self._key(text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+        waiting: Dict[str, asyncio.Future] = {}
+        for key, text in zip(keys, texts):
+            if key in found or key in waiting:
+                self.deduplicated += 1
+                continue
+            vector = self.store.get(key) if self.store is not None else None
+            if vector is not None:
+                self.store_hits += 1
+                found[key] = vector
+                continue
+            future = self._inflight.get(key)
+            if future is not None:
+                self.deduplicated += 1
+                if persist and key in self._pending:
+                    self._pending[key] = (text, future, True)
+            else:
+                future = self._inflight[key] = asyncio.get_running_loop().create_future()
+                self._pending[key] = (text, future, persist)
+            waiting[key] = future
+
+        if self._pending:
+            self._schedule()
+        for key, future in waiting.items():
+            # Shielded: one caller giving up must not fail the batch for the others
+            found[key] = await asyncio.shield(future)
+        return np.stack([found[key] for key in keys])
+
+    def _schedule(self):
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.batch_wait, self._flush)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch = list(self._pending.items())[:self.batch_size]
+            for key, _ in batch:
+                del self._pending[key]
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, Tuple[str, asyncio.Future, bool]]]):
+        keys = [key for key, _ in batch]
+        try:
+            self.requests += 1
+            self.texts_embedded += len(batch)
+            vectors = await self.embedder.embed([text for _, (text, _, _) in batch])
+            persist = [i for i, (_, (_, _, keep)) in enumerate(batch) if keep]
+            if self.store is not None and persist:
+                await asyncio.to_thread(self.store.add, [keys[i] for i in persist], vectors[persist])
+            for (_, (_, future, _)), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+        except Exception as e:
+            for _, (_, future, _) in batch:
+                if not future.done():
+                    future.set_exception(e)
+                    # Mark retrieved in case every caller has gone
+                    future.exception()
+        finally:
+            for key in keys:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "texts_embedded": self.texts_embedded,
+            "store_hits": self.store_hits,
+            "deduplicated": self.deduplicated,
+            "stored": len(self.store) if self.store is not None else 0,
+        }
+
+
+# Singleton instance, created on first use
+_embedding_service: Optional[EmbeddingService] = None
+
+
+def get_embedding_service() -> EmbeddingService:
+    """
+    Get the shared embedding service
+
+    Returns:
+        EmbeddingService: The process-wide service, backed by the provider's Embeddings API
+    """
+    global _embedding_service
+    if _embedding_service is None:
+        _embedding_service = EmbeddingService.from_env(OpenAIEmbedder())
+    return _embedding_service
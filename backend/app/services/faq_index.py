@@ -0,0 +1,95 @@
+"""
+Semantic FAQ retrieval.
+
+FAQ and knowledge entries are embedded once and kept as a normalized
+float32 matrix, so matching a question is one query embedding plus a
+matrix-vector product. Entry embeddings come from the EmbeddingService
+store, so when the entries change only new or edited questions reach the
+embeddings API, and a restart re-embeds nothing.
+"""
+import os
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .embeddings import EmbeddingService
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class FAQIndex:
+    """
+    Embedding index over FAQ entries ({"question": ..., "answer": ...})
+
+    Args:
+        embeddings (EmbeddingService): Source of entry and query embeddings
+        threshold (float): Cosine similarity a question needs to be answered from an entry
+    """
+    def __init__(self, embeddings: EmbeddingService, threshold: float = 0.85):
+        self.logger = logging.getLogger(__name__)
+        self.embeddings = embeddings
+        self.threshold = threshold
+
+        self.entries: List[Dict[str, str]] = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self._questions: Optional[List[str]] = None
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_env(cls, embeddings: EmbeddingService) -> "FAQIndex":
+        """Build an index configured by FAQ_MATCH_THRESHOLD"""
+        return cls(embeddings, threshold=float(os.getenv("FAQ_MATCH_THRESHOLD", "0.85")))
+
+    async def sync(self, entries: List[Dict[str, str]]):
+        """
+        Make the index reflect `entries`
+
+        Cheap when nothing changed, so it can be called before every lookup.
+        """
+        questions = [entry["question"] for entry in entries]
+        if questions == self._questions:
+            self.entries = entries
+            return
+        async with self._lock:
+            if questions == self._questions:
+                self.entries = entries
+                return
+            self.matrix = _normalize(await self.embeddings.embed(questions)) if questions else np.zeros((0, 0), dtype=np.float32)
+            self.entries = entries
+            self._questions = questions
+
+    async def search(self, question: str, k: int = 3) -> List[Tuple[Dict[str, str], float]]:
+        """
+        Find the entries most similar to a question
+
+        Returns:
+            List[Tuple[Dict[str, str], float]]: Up to k (entry, cosine similarity) pairs, best first
+        """
+        if not self.entries or not question.strip():
+            return []
+        query = _normalize((await self.embeddings.embed([question], persist=False))[0])
+        scores = self.matrix @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.entries[i], float(scores[i])) for i in top]
+
+    async def match(self, question: str) -> Optional[Tuple[Dict[str, str], float]]:
+        """
+        Best entry for a question if it clears the similarity threshold
+
+        Returns:
+            Optional[Tuple[Dict[str, str], float]]: (entry, similarity), or None
+        """
+        results = await self.search(question, k=1)
+        if results and results[0][1] >= self.threshold:
+            return results[0]
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self.entries), "threshold": self.threshold}
@@ -0,0 +1,131 @@
+"""
+Shared async HTTP client for outbound LLM calls.
+
+One httpx.AsyncClient (and so one pool of keep-alive connections) is shared
+by every concurrent request instead of each component opening its own.
+Pool size, keep-alive and per-host limits are configured with the
+LLM_HTTP_* environment variables; HTTP/2 is used when the optional `h2`
+package is installed.
+"""
+import os
+import asyncio
+import logging
+import importlib.util
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body stream that frees its per-host slot once the body is closed"""
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self.stream = stream
+        self.release = release
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            if self.release is not None:
+                self.release()
+                self.release = None
+
+
+class PerHostLimitTransport(httpx.AsyncBaseTransport):
+    """
+    Transport wrapper that caps concurrent requests per host.
+
+    httpx only limits the pool as a whole; this keeps one slow upstream from
+    taking every connection.
+    """
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_per_host: int):
+        self.transport = transport
+        self.max_per_host = max_per_host
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.netloc.decode("ascii")
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        await semaphore.acquire()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            semaphore.release()
+            raise
+        # Hold the slot until the body is closed so streaming responses count too
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(response.stream, semaphore.release),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def create_http_client(
+    max_connections: Optional[int] = None,
+    max_keepalive_connections: Optional[int] = None,
+    keepalive_expiry: Optional[float] = None,
+    max_per_host: Optional[int] = None,
+    http2: Optional[bool] = None,
+    timeout: Optional[float] = None,
+) -> httpx.AsyncClient:
+    """
+    Build an AsyncClient; arguments left as None come from the LLM_HTTP_* environment variables
+
+    Returns:
+        httpx.AsyncClient: Client with a bounded, keep-alive connection pool
+    """
+    max_connections = max_connections or int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+    max_keepalive_connections = max_keepalive_connections or int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+    keepalive_expiry = keepalive_expiry or float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "30"))
+    max_per_host = max_per_host or int(os.getenv("LLM_HTTP_MAX_PER_HOST", "50"))
+    timeout = timeout or float(os.getenv("LLM_HTTP_TIMEOUT", "60"))
+    if http2 is None:
+        http2 = os.getenv("LLM_HTTP_HTTP2", "true").lower() not in ("0", "false", "no")
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.info("h2 package not installed; using HTTP/1.1 for LLM calls")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+    transport = PerHostLimitTransport(httpx.AsyncHTTPTransport(limits=limits, http2=http2), max_per_host)
+    return httpx.AsyncClient(transport=transport, timeout=timeout)
+
+
+# Shared client, created on first use
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Get the shared async HTTP client
+
+    Returns:
+        httpx.AsyncClient: The process-wide client
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = create_http_client()
+    return _http_client
+
+
+async def close_http_client():
+    """Close the shared client and its pooled connections"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
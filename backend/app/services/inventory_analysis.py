@@ -0,0 +1,272 @@
+"""
+Inventory analysis engine for the analysis agent.
+
+Takes SKU-day inventory tables (CSV) and computes per-SKU stock
+levels, turnover, days of supply, ABC class, reorder points and anomaly
+flags. Every metric is computed with whole-column NumPy operations over
+integer SKU codes (bincount / ufunc.at) rather than per-row or per-group
+Python, so tens of millions of rows fit in a few seconds on one core.
+
+Expected columns:
+    sku, date, on_hand, units_sold
+Optional columns:
+    unit_cost (defaults to 1, i.e. unit-based ABC), lead_time_days
+
+Every row needs a non-blank sku, a parseable date and finite numbers in the
+numeric columns; tables with gaps are rejected rather than analyzed with
+NaN or infinite results.
+"""
+import io
+import logging
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+REQUIRED_COLUMNS = ("sku", "date", "on_hand", "units_sold")
+
+# Anomaly flag bits
+FLAG_STOCKOUT = 1
+FLAG_BELOW_REORDER_POINT = 2
+FLAG_OVERSTOCK = 4
+FLAG_DEMAND_SPIKE = 8
+
+FLAG_NAMES = {
+    FLAG_STOCKOUT: "stockout",
+    FLAG_BELOW_REORDER_POINT: "below_reorder_point",
+    FLAG_OVERSTOCK: "overstock",
+    FLAG_DEMAND_SPIKE: "demand_spike",
+}
+
+
+class InventoryDataError(ValueError):
+    """Raised when an uploaded table cannot be analyzed"""
+
+
+def _check_rows(invalid: np.ndarray, column: str, problem: str):
+    """
+    Raises:
+        InventoryDataError: If any row is flagged in `invalid`, naming the first one
+    """
+    if invalid.any():
+        first = int(np.argmax(invalid))
+        raise InventoryDataError(
+            f"Inventory table has {int(invalid.sum())} rows with {problem} {column} (first at data row {first + 1})"
+        )
+
+
+def _numeric_column(df: pd.DataFrame, column: str) -> np.ndarray:
+    """
+    A column as float64, requiring a finite number in every row
+
+    Raises:
+        InventoryDataError: If a value is missing, non-numeric or infinite
+    """
+    values = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    _check_rows(~np.isfinite(values), column, "a missing or non-numeric")
+    return values
+
+
+def load_inventory_table(data: bytes, filename: str) -> pd.DataFrame:
+    """
+    Read an uploaded CSV file into a DataFrame
+
+    Args:
+        data (bytes): Raw file contents
+        filename (str): Original file name
+
+    Returns:
+        pd.DataFrame: The table with the required columns present
+
+    Raises:
+        InventoryDataError: If the file is not a CSV, cannot be parsed or lacks required columns
+    """
+    # Parquet would need pyarrow, which is not a dependency
+    if filename.lower().endswith((".parquet", ".pq")):
+        raise InventoryDataError("Parquet files are not supported; upload the table as CSV")
+    try:
+        df = pd.read_csv(io.BytesIO(data), dtype={"sku": "string"})
+    except ValueError as e:
+        # pandas parser errors (empty or malformed files) are ValueErrors
+        raise InventoryDataError(f"Unreadable inventory table: {str(e)}") from e
+
+    missing = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+    if missing:
+        raise InventoryDataError(f"Inventory table is missing required columns: {', '.join(missing)}")
+    return df
+
+
+class InventoryAnalyzer:
+    """
+    Vectorized per-SKU inventory metrics.
+
+    Args:
+        lead_time_days (float): Replenishment lead time used when the table has none
+        service_z (float): Safety-stock z-score (1.645 is a ~95% service level)
+        abc_thresholds (tuple): Cumulative consumption-value shares closing classes A and B
+        overstock_days (float): Days of supply above which a SKU is flagged as overstocked
+        spike_z (float): Daily demand z-score above which a day counts as a demand spike
+    """
+    def __init__(
+        self,
+        lead_time_days: float = 7.0,
+        service_z: float = 1.645,
+        abc_thresholds: tuple = (0.8, 0.95),
+        overstock_days: float = 180.0,
+        spike_z: float = 4.0,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.lead_time_days = lead_time_days
+        self.service_z = service_z
+        self.abc_thresholds = abc_thresholds
+        self.overstock_days = overstock_days
+        self.spike_z = spike_z
+
+    def analyze(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Compute per-SKU metrics for a SKU-day table
+
+        Args:
+            df (pd.DataFrame): Rows of (sku, date, on_hand, units_sold[, unit_cost, lead_time_days])
+
+        Returns:
+            pd.DataFrame: One row per SKU with stock_level, avg_daily_demand, demand_std,
+                turnover, days_of_supply, consumption_value, abc_class, reorder_point,
+                stockout_days, spike_days and flags (bitmask) columns
+
+        Raises:
+            InventoryDataError: If the table is empty, or a row has a blank sku, an
+                unparseable date or a missing or non-numeric value
+        """
+        if df.empty:
+            raise InventoryDataError("Inventory table has no rows")
+
+        codes, skus = pd.factorize(df["sku"], sort=False)
+        # Missing SKUs get code -1; blank ones are checked on the (few) distinct values
+        blank = codes < 0
+        blank_skus = np.array([not str(sku).strip() for sku in skus], dtype=bool)
+        if blank_skus.any():
+            blank |= blank_skus[codes]
+        _check_rows(blank, "sku", "a blank")
+
+        n = len(skus)
+        on_hand = _numeric_column(df, "on_hand")
+        sold = _numeric_column(df, "units_sold")
+        dates = pd.to_datetime(df["date"], errors="coerce")
+        _check_rows(dates.isna().to_numpy(), "date", "a missing or unparseable")
+        day = dates.to_numpy().astype("datetime64[D]").astype(np.int64)
+
+        days = np.bincount(codes, minlength=n).astype(np.float64)
+        total_sold = np.bincount(codes, weights=sold, minlength=n)
+        mean_demand = total_sold / days
+        demand_var = np.bincount(codes, weights=sold * sold, minlength=n) / days - mean_demand ** 2
+        demand_std = np.sqrt(np.clip(demand_var, 0.0, None))
+        mean_on_hand = np.bincount(codes, weights=on_hand, minlength=n) / days
+        stockout_days = np.bincount(codes, weights=(on_hand <= 0), minlength=n)
+
+        # Stock level = on_hand on each SKU's most recent date
+        latest_day = np.full(n, np.iinfo(np.int64).min)
+        np.maximum.at(latest_day, codes, day)
+        is_latest = day == latest_day[codes]
+        stock_level = np.zeros(n)
+        stock_level[codes[is_latest]] = on_hand[is_latest]
+
+        unit_cost = self._per_sku_mean(df, "unit_cost", codes, days, default=1.0)
+        lead_time = self._per_sku_mean(df, "lead_time_days", codes, days, default=self.lead_time_days)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            turnover = np.where(mean_on_hand > 0, total_sold / mean_on_hand, np.inf)
+            days_of_supply = np.where(mean_demand > 0, stock_level / mean_demand, np.inf)
+            # Demand spikes: days far above the SKU's own mean
+            spike = (sold - mean_demand[codes]) > self.spike_z * demand_std[codes]
+        spike_days = np.bincount(codes, weights=spike & (demand_std[codes] > 0), minlength=n)
+
+        reorder_point = mean_demand * lead_time + self.service_z * demand_std * np.sqrt(lead_time)
+
+        consumption_value = total_sold * unit_cost
+        abc_class = self._abc_classes(consumption_value)
+
+        flags = np.zeros(n, dtype=np.int8)
+        flags |= np.where(stock_level <= 0, FLAG_STOCKOUT, 0).astype(np.int8)
+        flags |= np.where(stock_level < reorder_point, FLAG_BELOW_REORDER_POINT, 0).astype(np.int8)
+        flags |= np.where(days_of_supply > self.overstock_days, FLAG_OVERSTOCK, 0).astype(np.int8)
+        flags |= np.where(spike_days > 0, FLAG_DEMAND_SPIKE, 0).astype(np.int8)
+
+        return pd.DataFrame({
+            "sku": np.asarray(skus),
+            "days_observed": days.astype(np.int64),
+            "stock_level": stock_level,
+            "avg_daily_demand": mean_demand,
+            "demand_std": demand_std,
+            "turnover": turnover,
+            "days_of_supply": days_of_supply,
+            "consumption_value": consumption_value,
+            "abc_class": abc_class,
+            "reorder_point": reorder_point,
+            "stockout_days": stockout_days.astype(np.int64),
+            "spike_days": spike_days.astype(np.int64),
+            "flags": flags,
+        })
+
+    def _per_sku_mean(self, df: pd.DataFrame, column: str, codes: np.ndarray, days: np.ndarray, default: float) -> np.ndarray:
+        if column not in df.columns:
+            return np.full(len(days), default)
+        values = _numeric_column(df, column)
+        return np.bincount(codes, weights=values, minlength=len(days)) / days
+
+    def _abc_classes(self, consumption_value: np.ndarray) -> np.ndarray:
+        """Classify SKUs by their cumulative share of total consumption value"""
+        order = np.argsort(-consumption_value, kind="stable")
+        total = consumption_value.sum()
+        share = np.cumsum(consumption_value[order]) / total if total > 0 else np.ones(len(order))
+        # A SKU belongs to the class its cumulative share *starts* in
+        starts = share - consumption_value[order] / (total if total > 0 else 1.0)
+        ranked = np.where(starts < self.abc_thresholds[0], "A", np.where(starts < self.abc_thresholds[1], "B", "C"))
+        classes = np.empty(len(order), dtype="<U1")
+        classes[order] = ranked
+        return classes
+
+    def summarize(self, results: pd.DataFrame, top_n: int = 10) -> Dict[str, Any]:
+        """
+        Reduce per-SKU results to a compact, JSON-serializable summary for the LLM to narrate
+
+        Args:
+            results (pd.DataFrame): Output of analyze()
+            top_n (int): Number of SKUs listed per highlight
+
+        Returns:
+            Dict[str, Any]: Portfolio totals, ABC breakdown, flag counts and highlighted SKUs
+        """
+        flags = results["flags"].to_numpy()
+        finite_dos = results["days_of_supply"].replace(np.inf, np.nan)
+        finite_turnover = results["turnover"].replace(np.inf, np.nan)
+
+        abc = results.groupby("abc_class", sort=True).agg(
+            skus=("sku", "size"), consumption_value=("consumption_value", "sum")
+        )
+
+        def top(mask: np.ndarray, column: str, ascending: bool):
+            subset = results.loc[mask, ["sku", column]].sort_values(column, ascending=ascending).head(top_n)
+            return [
+                {"sku": str(sku), column: round(float(value), 2) if np.isfinite(value) else None}
+                for sku, value in subset.itertuples(index=False)
+            ]
+
+        return {
+            "skus": int(len(results)),
+            "total_stock_units": float(results["stock_level"].sum()),
+            "median_days_of_supply": None if finite_dos.isna().all() else round(float(finite_dos.median()), 1),
+            "median_turnover": None if finite_turnover.isna().all() else round(float(finite_turnover.median()), 2),
+            "abc": {
+                str(cls): {"skus": int(row.skus), "consumption_value": round(float(row.consumption_value), 2)}
+                for cls, row in abc.iterrows()
+            },
+            "flag_counts": {name: int(np.count_nonzero(flags & bit)) for bit, name in FLAG_NAMES.items()},
+            "stockouts": top((flags & FLAG_STOCKOUT) > 0, "avg_daily_demand", ascending=False),
+            "below_reorder_point": top(
+                (flags & (FLAG_BELOW_REORDER_POINT | FLAG_STOCKOUT)) == FLAG_BELOW_REORDER_POINT, "days_of_supply", ascending=True
+            ),
+            "overstocked": top((flags & FLAG_OVERSTOCK) > 0, "days_of_supply", ascending=False),
+            "demand_spikes": top((flags & FLAG_DEMAND_SPIKE) > 0, "spike_days", ascending=False),
+        }
+
@@ -1,67 +1,385 @@
 """
 LLM Service module for connecting to OpenAI's GPT-4o mini model using LangChain
+
+Prompts are lists of {"role", "content"} messages (roles "system", "user" and
+"assistant"), sent to the chat model as LangChain System/Human/AI messages.
+The agents build the whole list themselves, history included (taken from the
+chat's stored messages), and call generate_messages()/stream_messages(). The
+service keeps no conversation state; generate() and stream_response() are the
+single-message convenience API over the same calls.
+
+LangChain and the OpenAI SDK take most of a worker's import time, so they are
+only imported when the chat model is first needed (or by warm_up() at
+startup), and a missing OPENAI_API_KEY is reported then rather than at import.
 """
 import os
-from typing import List, Dict, Any, Optional
+import json
+import time
+import threading
+from functools import lru_cache
+from typing import AsyncIterator, List, Dict, Any, NamedTuple, Optional
 from dotenv import load_dotenv
-from langchain.chains import ConversationChain
-from langchain.chat_models import ChatOpenAI
-from langchain.memory import ConversationBufferMemory
-from langchain.prompts import PromptTemplate
+from .response_cache import ResponseCache, make_cache_key
+from .tokens import MESSAGE_OVERHEAD_TOKENS, get_token_counter, lazy_token_counter
+from .http_client import get_http_client
+from .resilience import ResilientCaller
+from .single_flight import SingleFlight
+from .metrics import LLM_CACHE, LLM_CACHE_HIT_RATIO, LLM_LATENCY, LLM_TTFT, LLM_TOKENS
+from .tracing import get_tracer
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Get API key and model name from environment variables
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY environment variable not set. Please add it to your .env file.")
 
 # Default to gpt-4o-mini if not specified
 OPENAI_MODEL_NAME = os.getenv("OPENAI_MODEL_NAME", "gpt-4o-mini")
 
+
+class Completion(NamedTuple):
+    """
+    A model response with the tokens it cost upstream (zero when served from the cache).
+    cached_prompt_tokens is the part of prompt_tokens the provider served from its
+    prompt prefix cache, as reported by the API.
+    """
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached: bool = False
+    cached_prompt_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+@lru_cache(maxsize=None)
+def _usage_recorder_class():
+    """Callback handler class capturing provider token usage, defined once LangChain is imported"""
+    from langchain.callbacks.base import BaseCallbackHandler
+
+    class UsageRecorder(BaseCallbackHandler):
+        """Captures the token usage the provider reports with a completion"""
+        run_inline = True
+
+        def __init__(self):
+            self.token_usage: Dict[str, int] = {}
+
+        def on_llm_end(self, response, **kwargs):
+            self.token_usage = (response.llm_output or {}).get("token_usage") or {}
+
+    return UsageRecorder
+
+
+def new_usage_recorder():
+    """A fresh callback handler to pass as callbacks=[...] on one model call"""
+    return _usage_recorder_class()()
+
+
+@lru_cache(maxsize=None)
+def _message_classes() -> Dict[str, Any]:
+    """LangChain message class per role, imported on first use"""
+    from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+    return {"system": SystemMessage, "user": HumanMessage, "assistant": AIMessage}
+
+
+def to_langchain_messages(messages: List[Dict[str, str]]) -> List[Any]:
+    """
+    Convert role/content dicts to LangChain chat messages
+    
+    Raises:
+        ValueError: If a message has a role other than system, user or assistant
+    """
+    classes = _message_classes()
+    try:
+        return [classes[message["role"]](content=message["content"]) for message in messages]
+    except KeyError as e:
+        raise ValueError(f"Unsupported message role: {e.args[0]}") from None
+
+
 class LLMService:
     """
     Service for interacting with OpenAI's GPT-4o mini model via LangChain
     """
     def __init__(self):
-        # Initialize the LLM with the model specified in .env
-        self.llm = ChatOpenAI(
-            model=OPENAI_MODEL_NAME,
-            temperature=0.7,
-            api_key=OPENAI_API_KEY,
-        )
+        self.model_name = OPENAI_MODEL_NAME
+        self.temperature = 0.7
         
-        # Default conversation memory
-        self.memory = ConversationBufferMemory()
+        # The chat model is built on first use; see the llm property
+        self._llm = None
+        self._llm_lock = threading.Lock()
         
-        # Default conversation chain
-        self.conversation = ConversationChain(
-            llm=self.llm,
-            memory=self.memory,
-            verbose=True
-        )
+        self.token_counter = lazy_token_counter(self.model_name)
+        
+        # Completion cache for repeated prompts (None when LLM_CACHE_ENABLED=false)
+        self.cache = ResponseCache.from_env()
+        if self.cache is not None:
+            LLM_CACHE.set_function(lambda: {("hit",): self.cache.hits, ("miss",): self.cache.misses})
+            LLM_CACHE_HIT_RATIO.set_function(lambda: {(): self.cache.stats()["hit_ratio"]})
+        
+        # Bounded retries with backoff and a per-model circuit breaker
+        self.resilience = ResilientCaller.from_env()
+        
+        # Identical prompts in flight at the same time share one upstream call
+        self.single_flight = SingleFlight(os.getenv("LLM_COALESCE_ENABLED", "true").lower() not in ("0", "false", "no"))
+        
+        self.tracer = get_tracer()
+        
+    @property
+    def llm(self):
+        """The LangChain chat model, built on first access"""
+        if self._llm is None:
+            with self._llm_lock:
+                if self._llm is None:
+                    self._llm = self._build_llm()
+        return self._llm
+    
+    @llm.setter
+    def llm(self, llm):
+        self._llm = llm
+    
+    def _build_llm(self):
+        """
+        Import LangChain and the OpenAI SDK and build the chat model
+        
+        Raises:
+            ValueError: If OPENAI_API_KEY is not set
+        """
+        if not OPENAI_API_KEY:
+            raise ValueError("OPENAI_API_KEY environment variable not set. Please add it to your .env file.")
+        import openai
+        from langchain.chat_models import ChatOpenAI
         
-    async def generate_response(self, message: str) -> str:
+        # Initialize the LLM with the model specified in .env. Async calls go through
+        # the shared, pooled HTTP client (see http_client.py for the LLM_HTTP_* settings).
+        # The client's own retries are off; self.resilience owns retrying.
+        async_client = openai.AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            base_url=os.getenv("OPENAI_API_BASE") or None,
+            http_client=get_http_client(),
+            max_retries=0,
+        )
+        return ChatOpenAI(
+            model=self.model_name,
+            temperature=self.temperature,
+            api_key=OPENAI_API_KEY,
+            async_client=async_client.chat.completions,
+        )
+    
+    def warm_up(self):
+        """
+        Do the one-off work of the first request ahead of time: import and build
+        the chat model and load the tokenizer. Blocking; run it off the event loop.
+        """
+        self.llm
+        _message_classes()
+        get_token_counter(self.model_name)
+    
+    async def generate_response(self, message: str, system: Optional[str] = None) -> str:
         """
         Generate a response using the GPT-4o mini model
         
         Args:
             message (str): User's message
+            system (Optional[str]): System message sent ahead of it
             
         Returns:
             str: Model's response
+            
+        Raises:
+            LLMError: Typed upstream failure, after retries for transient errors
+        """
+        return (await self.generate(message, system)).text
+
+    async def generate(self, message: str, system: Optional[str] = None) -> Completion:
+        """
+        Generate a response to one user message
+        
+        Args:
+            message (str): User's message
+            system (Optional[str]): System message sent ahead of it
+            
+        Returns:
+            Completion: Response text and token usage
+            
+        Raises:
+            LLMError: Typed upstream failure, after retries for transient errors
+        """
+        return await self.generate_messages(self._single_message(message, system))
+
+    async def generate_messages(self, messages: List[Dict[str, str]]) -> Completion:
         """
-        try:
-            # Simple direct call to the model to test connectivity
-            response = await self.conversation.arun(message)
-            return response
-        except Exception as e:
-            print(f"Error generating response: {e}")
-            return f"Sorry, I encountered an error: {str(e)}"
+        Generate a response to a complete list of chat messages
+        
+        Args:
+            messages (List[Dict[str, str]]): {"role", "content"} messages, oldest
+                first; roles are "system", "user" and "assistant"
+            
+        Returns:
+            Completion: Response text and the token usage reported by the provider
+            
+        Raises:
+            LLMError: Typed upstream failure, after retries for transient errors
+        """
+        with self.tracer.start_as_current_span("llm.generate", {"llm.model": self.model_name, "llm.messages": len(messages)}) as span:
+            prompt = self._cache_prompt(messages)
+            cached = await self._cached(prompt)
+            if cached is not None:
+                span.set_attribute("llm.cache", "hit")
+                return Completion(cached, cached=True)
+            key = self._flight_key(prompt)
+            span.set_attribute("llm.cache", "coalesced" if self.single_flight.in_flight(key) else "miss")
+            completion = await self.single_flight.do(key, lambda: self._complete(messages, prompt))
+            span.set_attributes({
+                "llm.prompt_tokens": completion.prompt_tokens,
+                "llm.cached_prompt_tokens": completion.cached_prompt_tokens,
+                "llm.completion_tokens": completion.completion_tokens,
+            })
+            return completion
+
+    async def stream_response(self, message: str, system: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Stream a response to one user message
+        
+        Args:
+            message (str): User's message
+            system (Optional[str]): System message sent ahead of it
+            
+        Yields:
+            str: Response text chunks as they arrive from the model
+            
+        Raises:
+            LLMError: Typed upstream failure
+        """
+        async for chunk in self.stream_messages(self._single_message(message, system)):
+            yield chunk
+
+    async def stream_messages(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """
+        Stream a response to a complete list of chat messages token by token
+        
+        Transient failures are only retried before the first chunk, since
+        after that part of the answer has already been sent.
+        
+        Args:
+            messages (List[Dict[str, str]]): {"role", "content"} messages, oldest first
+            
+        Yields:
+            str: Response text chunks as they arrive from the model
+            
+        Raises:
+            LLMError: Typed upstream failure
+        """
+        with self.tracer.start_as_current_span("llm.stream", {"llm.model": self.model_name, "llm.messages": len(messages)}) as span:
+            prompt = self._cache_prompt(messages)
+            response = await self._cached(prompt)
+            if response is not None:
+                span.set_attribute("llm.cache", "hit")
+                yield response
+                return
+            chunks = []
+            key = "stream:" + self._flight_key(prompt)
+            span.set_attribute("llm.cache", "coalesced" if self.single_flight.in_flight(key) else "miss")
+            async for chunk in self.single_flight.stream(key, lambda: self._stream_completion(messages, prompt)):
+                chunks.append(chunk)
+                yield chunk
+            span.set_attribute("llm.completion_tokens", self.token_counter("".join(chunks)))
+
+    async def _complete(self, messages: List[Dict[str, str]], prompt: str) -> Completion:
+        """One upstream completion, cached on success"""
+        with self.tracer.start_as_current_span("llm.call", {"llm.model": self.model_name}, kind="client") as span:
+            llm, usage = self.llm, new_usage_recorder()
+            chat_messages = to_langchain_messages(messages)
+            started = time.perf_counter()
+            response = await self.resilience.call(
+                self.model_name, lambda: llm.ainvoke(chat_messages, config={"callbacks": [usage]})
+            )
+            response = response.content
+            LLM_LATENCY.observe(time.perf_counter() - started, (self.model_name, "complete"))
+            await self._remember(prompt, response)
+            if usage.token_usage:
+                # Prompt tokens read from the provider's prefix cache (absent when none were)
+                details = usage.token_usage.get("prompt_tokens_details") or {}
+                completion = Completion(response, usage.token_usage.get("prompt_tokens", 0),
+                                        usage.token_usage.get("completion_tokens", 0),
+                                        cached_prompt_tokens=details.get("cached_tokens") or 0)
+                self._record_tokens(completion, "provider")
+            else:
+                completion = Completion(response, self.count_prompt_tokens(messages), self.token_counter(response))
+                self._record_tokens(completion, "estimate")
+            span.set_attributes({
+                "llm.prompt_tokens": completion.prompt_tokens,
+                "llm.cached_prompt_tokens": completion.cached_prompt_tokens,
+                "llm.completion_tokens": completion.completion_tokens,
+                "llm.token_source": "provider" if usage.token_usage else "estimate",
+            })
+            return completion
+
+    async def _stream_completion(self, messages: List[Dict[str, str]], prompt: str) -> AsyncIterator[str]:
+        """One upstream streamed completion, cached once it has finished"""
+        with self.tracer.start_as_current_span("llm.call", {"llm.model": self.model_name, "llm.stream": True}, kind="client") as span:
+            llm, chunks = self.llm, []
+            chat_messages = to_langchain_messages(messages)
+            started = time.perf_counter()
+            async for chunk in self.resilience.stream(self.model_name, lambda: llm.astream(chat_messages)):
+                if chunk.content:
+                    if not chunks:
+                        ttft = time.perf_counter() - started
+                        LLM_TTFT.observe(ttft, (self.model_name,))
+                        span.set_attribute("llm.time_to_first_token_ms", round(ttft * 1000, 2))
+                    chunks.append(chunk.content)
+                    yield chunk.content
+            LLM_LATENCY.observe(time.perf_counter() - started, (self.model_name, "stream"))
+            response = "".join(chunks)
+            await self._remember(prompt, response)
+            # Streamed chunks carry no usage, so the tokens are counted locally
+            completion = Completion(response, self.count_prompt_tokens(messages), self.token_counter(response))
+            self._record_tokens(completion, "estimate")
+            span.set_attributes({
+                "llm.prompt_tokens": completion.prompt_tokens,
+                "llm.completion_tokens": completion.completion_tokens,
+                "llm.token_source": "estimate",
+            })
+
+    def count_prompt_tokens(self, messages: List[Dict[str, str]]) -> int:
+        """Local estimate of a message list's prompt tokens, per-message overhead included"""
+        return sum(self.token_counter(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+    def _record_tokens(self, completion: Completion, source: str):
+        LLM_TOKENS.inc(completion.prompt_tokens, (self.model_name, "prompt", source))
+        LLM_TOKENS.inc(completion.cached_prompt_tokens, (self.model_name, "cached_prompt", source))
+        LLM_TOKENS.inc(completion.completion_tokens, (self.model_name, "completion", source))
+
+    @staticmethod
+    def _cache_prompt(messages: List[Dict[str, str]]) -> str:
+        """A message list as one string, to key the completion cache and coalesced calls"""
+        return json.dumps([[message["role"], message["content"]] for message in messages], ensure_ascii=False)
+
+    def _flight_key(self, prompt: str) -> str:
+        return make_cache_key(self.model_name, self.temperature, prompt)
+
+    async def _cached(self, prompt: str) -> Optional[str]:
+        """Look up a prompt in the completion cache"""
+        if self.cache is None:
+            return None
+        return await self.cache.get(self.model_name, self.temperature, prompt)
+
+    async def _remember(self, prompt: str, response: str):
+        """Store a successful completion in the cache"""
+        if self.cache is not None:
+            await self.cache.set(self.model_name, self.temperature, prompt, response)
+
+    @staticmethod
+    def _single_message(message: str, system: Optional[str]) -> List[Dict[str, str]]:
+        """The optional system message and the user message"""
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": message})
+        return messages
 
 # Singleton instance of the LLM service
 _llm_service = None
+_llm_service_lock = threading.Lock()
 
 def get_llm_service() -> LLMService:
     """
@@ -72,5 +390,8 @@ def get_llm_service() -> LLMService:
     """
     global _llm_service
     if _llm_service is None:
-        _llm_service = LLMService()
+        # Startup warm-up builds it from a worker thread, possibly while a request does too
+        with _llm_service_lock:
+            if _llm_service is None:
+                _llm_service = LLMService()
     return _llm_service
@@ -0,0 +1,182 @@
+"""
+Prometheus-style metrics.
+
+A small in-process registry of counters and histograms rendered in the
+Prometheus text exposition format at /metrics. Recording is a dict lookup,
+a bisect and a few additions, so the instrumentation on a request's hot
+path stays in the low microseconds (see test/metrics_overhead_benchmark.py).
+Values that already live elsewhere, such as the cache and scheduler
+counters, are read by callbacks at scrape time instead of being recorded
+twice.
+"""
+import math
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+Labels = Tuple[str, ...]
+
+# Seconds; covers sub-millisecond DB writes through multi-second completions
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, labels: Labels = ()):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, labels: Labels = ()) -> float:
+        return self._values.get(labels, 0.0)
+
+    def collect(self) -> Iterable[str]:
+        for labels, value in list(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (+Inf last), sum, count]
+        self._series: Dict[Labels, list] = {}
+
+    def observe(self, value: float, labels: Labels = ()):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0, 0])
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def snapshot(self, labels: Labels = ()) -> Optional[Tuple[List[int], float, int]]:
+        series = self._series.get(labels)
+        return (list(series[0]), series[1], series[2]) if series else None
+
+    def collect(self) -> Iterable[str]:
+        for labels, (counts, total, count) in list(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}"
+
+
+class CallbackMetric:
+    """Counter or gauge whose values are read from a function at scrape time"""
+    def __init__(self, name: str, help: str, type: str = "gauge", labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.labelnames = tuple(labelnames)
+        self._function: Optional[Callable[[], Dict[Labels, float]]] = None
+
+    def set_function(self, function: Callable[[], Dict[Labels, float]]):
+        self._function = function
+
+    def collect(self) -> Iterable[str]:
+        if self._function is None:
+            return
+        for labels, value in self._function().items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text format"""
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "agent_request_duration_seconds", "Agent request latency, queue wait included", ("agent_type",)
+))
+AGENT_ERRORS = REGISTRY.register(Counter(
+    "agent_errors_total", "Agent requests answered with an error message", ("agent_type", "error_type")
+))
+QUEUE_WAIT = REGISTRY.register(Histogram(
+    "scheduler_queue_wait_seconds", "Time agent requests waited for a scheduler slot", ("agent_type",)
+))
+SCHEDULER_LOAD = REGISTRY.register(CallbackMetric(
+    "scheduler_requests", "Agent requests currently running or queued", "gauge", ("state",)
+))
+SCHEDULER_SHED = REGISTRY.register(CallbackMetric(
+    "scheduler_shed_total", "Agent requests rejected because the queue was full", "counter"
+))
+LLM_LATENCY = REGISTRY.register(Histogram(
+    "llm_request_duration_seconds", "Upstream LLM call latency, retries included", ("model", "operation")
+))
+LLM_TTFT = REGISTRY.register(Histogram(
+    "llm_time_to_first_token_seconds", "Time from starting a streamed completion to its first token", ("model",)
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens_total",
+    "Tokens used by upstream LLM calls; source is 'provider' when reported by the API, else 'estimate'. "
+    "kind 'cached_prompt' is the part of 'prompt' served from the provider's prompt prefix cache",
+    ("model", "kind", "source"),
+))
+LLM_CACHE = REGISTRY.register(CallbackMetric(
+    "llm_cache_requests_total", "Completion cache lookups by result", "counter", ("result",)
+))
+LLM_CACHE_HIT_RATIO = REGISTRY.register(CallbackMetric(
+    "llm_cache_hit_ratio", "Share of completion cache lookups served from the cache"
+))
+DB_WRITE_LATENCY = REGISTRY.register(Histogram(
+    "db_write_duration_seconds", "Time to persist one batch of chat messages", ("backend",)
+))
+DB_WRITE_FAILURES = REGISTRY.register(Counter(
+    "db_write_failures_total",
+    "Failed chat message writes; outcome 'retried' or 'dropped' once the last attempt failed",
+    ("backend", "outcome"),
+))
+DB_WRITE_QUEUE = REGISTRY.register(CallbackMetric(
+    "db_write_queue_depth", "Store calls queued for the write-behind writer"
+))
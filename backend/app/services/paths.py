@@ -0,0 +1,20 @@
+"""
+Default locations of the on-disk stores.
+
+Stores whose *_PATH setting is not given (chat history, embeddings, the
+document index, batch results) are created in DATA_DIR. A relative DATA_DIR
+is resolved against the backend directory rather than the working
+directory, so the files end up in the same place however the server is
+started.
+"""
+import os
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+
+def data_path(filename: str) -> str:
+    """Path of `filename` in DATA_DIR (default backend/data), creating the directory if needed"""
+    directory = BACKEND_DIR / os.getenv("DATA_DIR", "data")
+    directory.mkdir(parents=True, exist_ok=True)
+    return str(directory / filename)
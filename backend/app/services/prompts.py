@@ -0,0 +1,179 @@
+"""
+Prompt templates for the agents, compiled once at import.
+
+Each template is split into a static system message, identical on every
+request, and a user message template rendered per request. An agent's
+messages are ordered from the most stable to the least: the system message,
+then the conversation (summary and earlier turns, which only grow within a
+chat), then the new user message with its retrieved excerpts. Every prompt an
+agent sends therefore starts with the same bytes, and providers that cache
+prompt prefixes (OpenAI reuses prefixes of 1024 tokens or more, in 128-token
+steps, at a lower price and latency) can skip re-reading them.
+
+Templates are registered in PROMPTS by agent name, the same way metrics are
+registered in metrics.REGISTRY.
+"""
+import inspect
+from string import Formatter
+from typing import Callable, Dict, Iterator, List, Sequence
+
+
+class PromptTemplate:
+    """
+    A prompt split into a static system message and a user message template
+
+    Both parts are dedented and stripped once, here, and the fields of the
+    template are parsed up front so a missing value fails at render time
+    with a clear error instead of a bare KeyError.
+
+    Args:
+        name (str): Registry name, usually the agent type
+        system (str): System message, identical on every request (no fields)
+        template (str): User message, with str.format fields
+    """
+    def __init__(self, name: str, system: str, template: str):
+        self.name = name
+        self.system = inspect.cleandoc(system)
+        self.template = inspect.cleandoc(template)
+        self.fields = frozenset(field for _, field, _, _ in Formatter().parse(self.template) if field)
+        # Token counts of the system message, per token counter
+        self._system_tokens: Dict[Callable[[str], int], int] = {}
+
+    def render(self, **values: str) -> str:
+        """
+        Fill in the user message
+
+        Raises:
+            ValueError: If a field of the template has no value
+        """
+        missing = self.fields - values.keys()
+        if missing:
+            raise ValueError(f"Prompt {self.name} is missing values for: {', '.join(sorted(missing))}")
+        return self.template.format(**values)
+
+    def messages(self, history: Sequence[Dict[str, str]] = (), **values: str) -> List[Dict[str, str]]:
+        """
+        The messages to send: the system message, then history, then the rendered user message
+
+        Args:
+            history (Sequence[Dict[str, str]]): {"role", "content"} messages that go
+                between the system message and the new user message
+            **values (str): Values for the template's fields
+
+        Raises:
+            ValueError: If a field of the template has no value
+        """
+        return [
+            {"role": "system", "content": self.system},
+            *history,
+            {"role": "user", "content": self.render(**values)},
+        ]
+
+    def system_tokens(self, token_counter: Callable[[str], int]) -> int:
+        """Tokens in the system message, counted once per counter"""
+        if token_counter not in self._system_tokens:
+            self._system_tokens[token_counter] = token_counter(self.system)
+        return self._system_tokens[token_counter]
+
+
+class PromptRegistry:
+    """Prompt templates by name"""
+    def __init__(self):
+        self._templates: Dict[str, PromptTemplate] = {}
+
+    def register(self, template: PromptTemplate) -> PromptTemplate:
+        if template.name in self._templates:
+            raise ValueError(f"Prompt already registered: {template.name}")
+        self._templates[template.name] = template
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        """
+        Raises:
+            KeyError: If no template has that name
+        """
+        return self._templates[name]
+
+    def __iter__(self) -> Iterator[PromptTemplate]:
+        return iter(self._templates.values())
+
+
+PROMPTS = PromptRegistry()
+
+CHATBOT_PROMPT = PROMPTS.register(PromptTemplate(
+    "chatbot",
+    system="""
+        You are a knowledgeable and ethical financial advisor assistant with expertise in:
+        1. Personal finance and budgeting
+        2. Investment strategies and portfolio management
+        3. Retirement planning and savings
+        4. Tax optimization strategies
+        5. Insurance and risk management
+        6. Debt management and credit improvement
+
+        Guidelines:
+        - Provide personalized, actionable financial advice based on the information shared
+        - Always prioritize the client's long-term financial well-being
+        - Explain financial concepts in clear, simple terms while maintaining accuracy
+        - Disclose limitations and uncertainties in your advice
+        - When appropriate, suggest seeking professional advice for complex situations
+        - Do not recommend specific investment products or make promises about returns
+        - Maintain a professional, supportive, and non-judgmental tone
+        - Ask clarifying questions when needed to provide better guidance
+        - When internal document excerpts are provided, base your answer on them and cite them by number
+    """,
+    # The excerpts are empty or end with a blank line
+    template="{documents}{question}",
+))
+
+ANALYSIS_PROMPT = PROMPTS.register(PromptTemplate(
+    "analysis",
+    system="""
+        You are an inventory analyst. The metrics below were computed from the user's
+        inventory data; they are exact, so do not recalculate or invent figures.
+        Explain what they mean and answer the user's question, highlighting risks
+        (stockouts, items below reorder point, overstock, demand spikes) and priorities
+        by ABC class.
+    """,
+    template="""
+        Computed results (JSON):
+        {results}
+
+        User's question: {question}
+    """,
+))
+
+# The summary prompts share one system message, so their prefix is the same too
+SUMMARY_SYSTEM = "You write concise, factual summaries of conversations between a user and a financial advisor assistant."
+
+SUMMARY_PROMPT = PROMPTS.register(PromptTemplate(
+    "summary",
+    system=SUMMARY_SYSTEM,
+    template="""
+        Please provide a concise summary of the following conversation:
+        {text}
+    """,
+))
+
+SUMMARY_UPDATE_PROMPT = PROMPTS.register(PromptTemplate(
+    "summary.update",
+    system=SUMMARY_SYSTEM,
+    template="""
+        Here is a summary of a conversation so far, followed by new messages. Write an updated concise summary that covers both.
+
+        Summary so far:
+        {summary}
+
+        New messages:
+        {text}
+    """,
+))
+
+SUMMARY_CHUNK_PROMPT = PROMPTS.register(PromptTemplate(
+    "summary.chunk",
+    system=SUMMARY_SYSTEM,
+    template="""
+        Summarize this part of a longer conversation in a few sentences:
+        {text}
+    """,
+))
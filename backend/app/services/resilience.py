@@ -0,0 +1,428 @@
+"""
+Retry and circuit breaking for upstream LLM calls.
+
+Provider exceptions are translated into typed LLMError subclasses so callers
+can branch on the failure instead of matching on message text. Transient
+failures (rate limits, connection problems, 5xx) are retried a bounded number
+of times with exponential backoff and full jitter, and a circuit breaker per
+model stops sending traffic to an upstream that keeps failing. With
+SHARED_STATE_PATH set the breakers' state is shared by every worker, so an
+outage seen by one opens the breaker for all of them.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from .shared_state import SharedState, get_shared_state
+
+T = TypeVar("T")
+
+
+class LLMError(Exception):
+    """
+    Base class for failed LLM calls
+
+    Attributes:
+        error_type (str): One of the AIService ErrorType values
+        retryable (bool): Whether repeating the call may succeed
+    """
+    error_type = "unknown_error"
+    retryable = False
+
+    def __init__(self, message: str, original_error: Optional[Exception] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.original_error = original_error
+        self.retry_after = retry_after
+
+
+class LLMRateLimitError(LLMError):
+    """The provider throttled the request"""
+    error_type = "rate_limit_error"
+    retryable = True
+
+
+class LLMQuotaError(LLMError):
+    """The account is out of quota; retrying will not help"""
+    error_type = "rate_limit_error"
+
+
+class LLMConnectionError(LLMError):
+    """The provider could not be reached or did not answer in time"""
+    error_type = "connection_error"
+    retryable = True
+
+
+class LLMServerError(LLMError):
+    """The provider returned a 5xx response"""
+    error_type = "api_error"
+    retryable = True
+
+
+class LLMAuthenticationError(LLMError):
+    """The API key was rejected"""
+    error_type = "api_error"
+
+
+class LLMContextLimitError(LLMError):
+    """The prompt does not fit the model's context window"""
+    error_type = "context_limit_error"
+
+
+class LLMContentFilterError(LLMError):
+    """The provider refused the prompt or completion"""
+    error_type = "content_filter_error"
+
+
+class LLMInvalidRequestError(LLMError):
+    """The provider rejected the request as malformed"""
+    error_type = "invalid_request_error"
+
+
+class CircuitOpenError(LLMError):
+    """The model's circuit breaker is open; the call was not attempted"""
+    error_type = "upstream_unavailable"
+
+
+def _retry_after(response: Optional[httpx.Response]) -> Optional[float]:
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after", ""))
+    except ValueError:
+        return None
+
+
+def translate_error(e: Exception) -> LLMError:
+    """
+    Map a provider or transport exception to a typed LLMError
+
+    Args:
+        e (Exception): Exception raised by the OpenAI client or LangChain
+
+    Returns:
+        LLMError: The typed error (e itself if it already is one)
+    """
+    if isinstance(e, LLMError):
+        return e
+    # Imported here so importing this module does not load the OpenAI SDK
+    import openai
+    message = str(e)
+    code = getattr(e, "code", None) or ""
+
+    if isinstance(e, openai.RateLimitError):
+        if code == "insufficient_quota":
+            return LLMQuotaError(message, e)
+        return LLMRateLimitError(message, e, _retry_after(e.response))
+    if isinstance(e, (openai.APIConnectionError, httpx.TransportError, asyncio.TimeoutError)):
+        # APITimeoutError is a subclass of APIConnectionError
+        return LLMConnectionError(message or type(e).__name__, e)
+    if isinstance(e, openai.InternalServerError):
+        return LLMServerError(message, e, _retry_after(e.response))
+    if isinstance(e, (openai.AuthenticationError, openai.PermissionDeniedError)):
+        return LLMAuthenticationError(message, e)
+    if isinstance(e, openai.BadRequestError):
+        if code == "context_length_exceeded":
+            return LLMContextLimitError(message, e)
+        if code == "content_filter" or "content management policy" in message:
+            return LLMContentFilterError(message, e)
+        return LLMInvalidRequestError(message, e)
+    if isinstance(e, openai.APIStatusError):
+        if e.status_code >= 500:
+            return LLMServerError(message, e, _retry_after(e.response))
+        return LLMInvalidRequestError(message, e)
+    return LLMError(message, e)
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker for one upstream
+
+    After `failure_threshold` consecutive upstream failures the breaker opens
+    and calls fail fast for `reset_timeout` seconds. Then a single probe call
+    is let through: success closes the breaker, failure opens it again.
+
+    Args:
+        failure_threshold (int): Consecutive failures that open the breaker
+        reset_timeout (float): Seconds to stay open before probing
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probing = False
+
+    def before_call(self):
+        """
+        Raises:
+            CircuitOpenError: If the breaker is open, or half-open with a probe in flight
+        """
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit open; retry in {remaining:.1f}s", retry_after=remaining)
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                self.rejected += 1
+                raise CircuitOpenError("Circuit half-open; probe in progress", retry_after=1.0)
+            self._probing = True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self._probing = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """End a call that says nothing about upstream health (e.g. a rejected prompt)"""
+        self._probing = False
+
+
+class SharedCircuitBreaker(CircuitBreaker):
+    """
+    CircuitBreaker whose state lives in the shared state store
+
+    Every worker reads and updates the same entry, so failures seen by any of
+    them count toward opening the breaker and only one worker sends the
+    half-open probe. Times are wall-clock, since they are compared across
+    processes. `state` and `failures` mirror the entry as last seen.
+
+    Args:
+        shared (SharedState): Store shared by the workers
+        key (str): Entry holding this breaker's state
+        failure_threshold (int): Consecutive failures that open the breaker
+        reset_timeout (float): Seconds to stay open before probing
+    """
+    def __init__(self, shared: SharedState, key: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        super().__init__(failure_threshold, reset_timeout)
+        self.shared = shared
+        self.key = key
+
+    def _mirror(self, entry):
+        self.state = entry["state"] if entry else self.CLOSED
+        self.failures = entry["failures"] if entry else 0
+        return entry
+
+    def before_call(self):
+        entry = self._mirror(self.shared.get(self.key))
+        # The common case, a healthy upstream, is a single read
+        if entry is None or entry["state"] == self.CLOSED:
+            return
+
+        now = time.time()
+        rejection = None
+
+        def admit(entry):
+            nonlocal rejection
+            if entry is None or entry["state"] == self.CLOSED:
+                return entry
+            if entry["state"] == self.OPEN:
+                remaining = entry["opened_at"] + self.reset_timeout - now
+                if remaining > 0:
+                    rejection = CircuitOpenError(f"Circuit open; retry in {remaining:.1f}s", retry_after=remaining)
+                    return entry
+            elif entry.get("probe_until", 0) > now:
+                rejection = CircuitOpenError("Circuit half-open; probe in progress", retry_after=1.0)
+                return entry
+            # This worker sends the probe; the lease frees the slot if it never reports back
+            self._probing = True
+            return {**entry, "state": self.HALF_OPEN, "probe_until": now + self.reset_timeout}
+
+        self._mirror(self.shared.update(self.key, admit))
+        if rejection is not None:
+            self.rejected += 1
+            raise rejection
+
+    def record_success(self):
+        self._probing = False
+        if self.state != self.CLOSED or self.failures:
+            self._mirror(self.shared.update(self.key, lambda entry: None))
+
+    def record_failure(self):
+        probing, self._probing = self._probing, False
+
+        def fail(entry):
+            entry = entry or {"state": self.CLOSED, "failures": 0}
+            failures = entry["failures"] + 1
+            if probing or entry["state"] == self.HALF_OPEN or failures >= self.failure_threshold:
+                return {"state": self.OPEN, "failures": failures, "opened_at": time.time()}
+            return {**entry, "failures": failures}
+
+        self._mirror(self.shared.update(self.key, fail))
+
+    def release(self):
+        if self._probing:
+            self._probing = False
+            # Free the probe slot for the next caller
+            self.shared.update(self.key, lambda entry: entry and {**entry, "probe_until": 0})
+
+
+class ResilientCaller:
+    """
+    Bounded retries with exponential backoff and full jitter, plus a circuit breaker per model
+
+    Args:
+        max_attempts (int): Total attempts per call, including the first
+        base_delay (float): Backoff before the first retry, in seconds
+        max_delay (float): Upper bound on any single backoff
+        failure_threshold (int): Consecutive failures that open a model's breaker
+        reset_timeout (float): Seconds a breaker stays open before probing
+        shared_state (Optional[SharedState]): Store that holds the breakers' state
+            for all workers; None keeps it in this process
+    """
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        shared_state: Optional[SharedState] = None,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.shared_state = shared_state
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.retries = 0
+
+    @classmethod
+    def from_env(cls) -> "ResilientCaller":
+        """Build from LLM_RETRY_MAX_ATTEMPTS, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY and LLM_BREAKER_*"""
+        return cls(
+            max_attempts=int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "3")),
+            base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5")),
+            max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", "8")),
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("LLM_BREAKER_RESET_TIMEOUT", "30")),
+            shared_state=get_shared_state(),
+        )
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        if model not in self.breakers:
+            if self.shared_state is not None:
+                self.breakers[model] = SharedCircuitBreaker(
+                    self.shared_state, f"breaker:{model}", self.failure_threshold, self.reset_timeout
+                )
+            else:
+                self.breakers[model] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return self.breakers[model]
+
+    def backoff(self, attempt: int, error: LLMError) -> float:
+        """Seconds to wait before retry number `attempt` (1-based)"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if error.retry_after is not None:
+            # Never retry sooner than the provider asked us to
+            delay = max(delay, min(error.retry_after, self.max_delay))
+        return delay
+
+    async def call(self, model: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run `fn` with retries and the model's circuit breaker
+
+        Raises:
+            LLMError: The typed error of the last attempt, or CircuitOpenError
+        """
+        breaker = self.breaker(model)
+        attempt = 0
+        while True:
+            attempt += 1
+            await self._hook(breaker, breaker.before_call)
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                await self._hook(breaker, breaker.release)
+                raise
+            except Exception as e:
+                error = await self._record(breaker, e)
+                if not error.retryable or attempt >= self.max_attempts:
+                    raise error from e
+                await self._wait(model, attempt, error)
+                continue
+            await self._hook(breaker, breaker.record_success)
+            return result
+
+    async def stream(self, model: str, fn: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """
+        Stream from `fn` with the model's circuit breaker
+
+        Failures before the first chunk are retried like call(); once a chunk
+        has been yielded the error is raised, since the caller already has
+        part of the answer.
+        """
+        breaker = self.breaker(model)
+        attempt = 0
+        while True:
+            attempt += 1
+            await self._hook(breaker, breaker.before_call)
+            started = False
+            try:
+                async for chunk in fn():
+                    started = True
+                    yield chunk
+            except (asyncio.CancelledError, GeneratorExit):
+                await self._hook(breaker, breaker.release)
+                raise
+            except Exception as e:
+                error = await self._record(breaker, e)
+                if started or not error.retryable or attempt >= self.max_attempts:
+                    raise error from e
+                await self._wait(model, attempt, error)
+                continue
+            await self._hook(breaker, breaker.record_success)
+            return
+
+    async def _record(self, breaker: CircuitBreaker, e: Exception) -> LLMError:
+        error = translate_error(e)
+        # Only upstream health problems count toward opening the breaker
+        if error.retryable or isinstance(error, LLMAuthenticationError):
+            await self._hook(breaker, breaker.record_failure)
+        else:
+            await self._hook(breaker, breaker.release)
+        return error
+
+    @staticmethod
+    async def _hook(breaker: CircuitBreaker, hook: Callable[[], None]):
+        """Run a breaker hook; a shared breaker's hooks read and write SQLite, so they run off the event loop"""
+        if isinstance(breaker, SharedCircuitBreaker):
+            await asyncio.to_thread(hook)
+        else:
+            hook()
+
+    async def _wait(self, model: str, attempt: int, error: LLMError):
+        delay = self.backoff(attempt, error)
+        self.retries += 1
+        self.logger.warning(f"{model} call failed ({error.error_type}); retry {attempt} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, object]:
+        """Retry count and breaker state per model"""
+        return {
+            "retries": self.retries,
+            "breakers": {
+                model: {"state": b.state, "consecutive_failures": b.failures, "rejected": b.rejected}
+                for model, b in self.breakers.items()
+            },
+        }
@@ -0,0 +1,198 @@
+"""
+Completion cache for the LLM service.
+
+Responses are keyed by model, temperature and a hash of the prompt. Lookups
+try the exact prompt first and then a normalized form (whitespace collapsed,
+case folded) so trivially different repeats of the same question still hit.
+Entries expire after a TTL and the in-process tier is a size-bounded LRU;
+an optional SQLite file gives a second tier that survives restarts. With
+SHARED_STATE_PATH set and no LLM_CACHE_PATH, that tier lives in the shared
+state file, so a completion cached by one worker is a hit on the others.
+Disk reads and writes run in a worker thread, off the event loop; expired
+rows are purged and the oldest rows beyond max_disk_entries dropped at most
+once per purge_interval.
+"""
+import os
+import re
+import time
+import asyncio
+import sqlite3
+import threading
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace and case-fold a prompt for fuzzy-exact matching"""
+    return _WHITESPACE.sub(" ", prompt).strip().casefold()
+
+
+def make_cache_key(model: str, temperature: float, prompt: str) -> str:
+    """Build a cache key from the model settings and a SHA-256 of the prompt"""
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    return f"{model}:{temperature:g}:{digest}"
+
+
+class ResponseCache:
+    """
+    TTL + LRU cache of model completions with an optional on-disk tier.
+
+    Args:
+        max_entries (int): Maximum number of entries kept in memory
+        ttl (float): Seconds an entry stays valid
+        disk_path (Optional[str]): SQLite file for the persistent tier, or None
+        max_disk_entries (int): Rows kept in the persistent tier (two per completion)
+        purge_interval (float): Least seconds between two purges of the persistent tier
+    """
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, disk_path: Optional[str] = None,
+                 max_disk_entries: int = 100_000, purge_interval: float = 60.0):
+        self.logger = logging.getLogger(__name__)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self.purge_interval = purge_interval
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+        self.hits = 0
+        self.normalized_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._last_purge = 0.0
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            # WAL lets other worker processes read while one writes
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, expires_at REAL, response TEXT)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_completions_expires_at ON completions (expires_at)")
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """Build a cache from the LLM_CACHE_* environment variables, or None if disabled"""
+        if os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("0", "false", "no"):
+            return None
+        return cls(
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+            ttl=float(os.getenv("LLM_CACHE_TTL", "3600")),
+            disk_path=os.getenv("LLM_CACHE_PATH") or os.getenv("SHARED_STATE_PATH") or None,
+            max_disk_entries=int(os.getenv("LLM_CACHE_MAX_DISK_ENTRIES", "100000")),
+        )
+
+    async def get(self, model: str, temperature: float, prompt: str) -> Optional[str]:
+        """Return a cached completion for the prompt, or None"""
+        keys = [make_cache_key(model, temperature, prompt),
+                make_cache_key(model, temperature, normalize_prompt(prompt))]
+        for i, key in enumerate(keys):
+            response = self._lookup(key)
+            if response is not None:
+                return self._hit(response, normalized=i > 0)
+
+        if self._db is not None:
+            found = await asyncio.to_thread(self._read_disk, keys)
+            for i, key in enumerate(keys):
+                if key in found:
+                    # Promote to the in-memory tier
+                    expires_at, response = found[key]
+                    self._remember(key, expires_at, response)
+                    return self._hit(response, normalized=i > 0)
+
+        self.misses += 1
+        return None
+
+    async def set(self, model: str, temperature: float, prompt: str, response: str):
+        """Store a completion under both the exact and normalized prompt keys"""
+        expires_at = time.time() + self.ttl
+        rows = [
+            (make_cache_key(model, temperature, prompt), expires_at, response),
+            (make_cache_key(model, temperature, normalize_prompt(prompt)), expires_at, response),
+        ]
+        for key, _, _ in rows:
+            self._remember(key, expires_at, response)
+        if self._db is not None:
+            await asyncio.to_thread(self._write_disk, rows)
+
+    async def clear(self):
+        """Drop every entry from both tiers"""
+        self._entries.clear()
+        if self._db is not None:
+            await asyncio.to_thread(self._execute, "DELETE FROM completions")
+
+    def _hit(self, response: str, normalized: bool) -> str:
+        self.hits += 1
+        self.normalized_hits += normalized
+        return response
+
+    def _lookup(self, key: str) -> Optional[str]:
+        """Look a key up in the in-memory tier"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, response = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                return response
+            del self._entries[key]
+        return None
+
+    def _read_disk(self, keys: List[str]) -> Dict[str, Tuple[float, str]]:
+        """Unexpired persistent entries for the keys. Blocking; runs in a worker thread."""
+        with self._db_lock:
+            rows = self._db.execute(
+                f"SELECT key, expires_at, response FROM completions WHERE key IN ({', '.join('?' * len(keys))}) AND expires_at > ?",
+                (*keys, time.time()),
+            ).fetchall()
+        return {key: (expires_at, response) for key, expires_at, response in rows}
+
+    def _write_disk(self, rows: List[Tuple[str, float, str]]):
+        """Write entries to the persistent tier, purging it when due. Blocking; runs in a worker thread."""
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO completions (key, expires_at, response) VALUES (?, ?, ?)", rows
+            )
+            now = time.time()
+            if now - self._last_purge >= self.purge_interval:
+                self._last_purge = now
+                self._purge(now)
+            self._db.commit()
+
+    def _purge(self, now: float):
+        """Delete expired rows, then the soonest-expiring rows beyond max_disk_entries"""
+        self._db.execute("DELETE FROM completions WHERE expires_at <= ?", (now,))
+        excess = self._db.execute("SELECT COUNT(*) FROM completions").fetchone()[0] - self.max_disk_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM completions WHERE key IN (SELECT key FROM completions ORDER BY expires_at LIMIT ?)",
+                (excess,),
+            )
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._db_lock:
+            self._db.execute(sql, params)
+            self._db.commit()
+
+    def _remember(self, key: str, expires_at: float, response: str):
+        self._entries[key] = (expires_at, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters for diagnostics"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "normalized_hits": self.normalized_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,323 @@
+"""
+Admission control and priority scheduling for LLM-bound requests.
+
+A global cap limits how many agent requests run against the model at once.
+Requests beyond the cap wait in per-priority queues (interactive chatbot
+ahead of summaries, by default); inside a priority level, clients are
+served round-robin so one busy client cannot starve the others. When the
+queue is full new requests are shed immediately with a Retry-After hint
+instead of piling up until the upstream rate limit trips.
+
+With a shared state store the cap and the queue depth are counters in the
+store (SharedState.incr), so they hold across all workers together. Each
+worker still queues and orders its own waiters, and polls the store for
+slots freed by other workers. The counters carry a lease that every change
+renews: slots held by a worker that died are only given back once the
+counters have gone unchanged for that long.
+"""
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional, Set, Tuple
+from .metrics import QUEUE_WAIT
+from .shared_state import SharedState
+
+DEFAULT_PRIORITIES = {
+    "chatbot": 0,
+    "analysis": 1,
+    "summary": 2,
+}
+
+# Number of recent queue waits kept per agent type for percentiles
+WAIT_SAMPLES = 1000
+
+# Shared-store counters of running and waiting requests, across workers
+ACTIVE_KEY = "scheduler:active"
+QUEUED_KEY = "scheduler:queued"
+
+# Seconds between checks of the shared cap while requests wait
+POLL_INTERVAL = 0.05
+
+RUN, QUEUE, SHED = "run", "queue", "shed"
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when the request queue is full; the request should be retried later"""
+    def __init__(self, retry_after: int, queue_depth: int):
+        super().__init__(f"Request queue is full ({queue_depth} waiting); retry after {retry_after}s")
+        self.retry_after = retry_after
+        self.queue_depth = queue_depth
+
+
+class RequestScheduler:
+    """
+    Concurrency limiter with priority queues and per-client fair sharing.
+
+    Args:
+        max_concurrent (int): Requests allowed to run at once
+        max_queue_depth (int): Waiting requests allowed before new ones are shed
+        priorities (Optional[Dict[str, int]]): Priority per agent type, lower runs first
+        state (Optional[SharedState]): Store holding the cap and queue depth
+            shared by every worker; without it the limits are per process
+        lease (float): Seconds the shared counters outlive their last change
+    """
+    def __init__(self, max_concurrent: int = 16, max_queue_depth: int = 256, priorities: Optional[Dict[str, int]] = None,
+                 state: Optional[SharedState] = None, lease: float = 300.0):
+        self.logger = logging.getLogger(__name__)
+        self.max_concurrent = max_concurrent
+        self.max_queue_depth = max_queue_depth
+        self.priorities = priorities or dict(DEFAULT_PRIORITIES)
+        self.shared_state = state
+        self.lease = lease
+        self._tasks: Set[asyncio.Task] = set()
+        self._poller: Optional[asyncio.Task] = None
+        self._filling = False
+
+        # Requests running and waiting in this process
+        self._active = 0
+        self._queued = 0
+        # priority -> client_id -> waiters, clients kept in round-robin order
+        self._queues: Dict[int, "OrderedDict[str, Deque[asyncio.Future]]"] = {}
+
+        self.shed = 0
+        self._service_time = 1.0  # EWMA of seconds a request holds its slot
+        self._waits: Dict[str, Deque[float]] = {}
+
+    @classmethod
+    def from_env(cls, state: Optional[SharedState] = None) -> "RequestScheduler":
+        """Build a scheduler from SCHEDULER_MAX_CONCURRENT, SCHEDULER_MAX_QUEUE_DEPTH, SCHEDULER_PRIORITY_<AGENT> and SCHEDULER_LEASE"""
+        priorities = {
+            agent: int(os.getenv(f"SCHEDULER_PRIORITY_{agent.upper()}", str(default)))
+            for agent, default in DEFAULT_PRIORITIES.items()
+        }
+        return cls(
+            max_concurrent=int(os.getenv("SCHEDULER_MAX_CONCURRENT", "16")),
+            max_queue_depth=int(os.getenv("SCHEDULER_MAX_QUEUE_DEPTH", "256")),
+            priorities=priorities,
+            state=state,
+            lease=float(os.getenv("SCHEDULER_LEASE", "300")),
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    @asynccontextmanager
+    async def slot(self, agent_type: str, client_id: Optional[str] = None):
+        """
+        Hold a run slot for the duration of the block
+
+        Yields:
+            float: Seconds spent waiting in the queue
+
+        Raises:
+            SchedulerOverloaded: If the queue is full
+        """
+        wait = await self.acquire(agent_type, client_id)
+        started = time.monotonic()
+        try:
+            yield wait
+        finally:
+            self.release(time.monotonic() - started)
+
+    async def acquire(self, agent_type: str, client_id: Optional[str] = None) -> float:
+        """
+        Wait for a run slot. Every successful acquire must be paired with release().
+
+        Returns:
+            float: Seconds spent waiting in the queue
+        """
+        started = time.monotonic()
+        decision, queued = await self._admit(self._queued == 0 and self._active < self.max_concurrent)
+        if decision == RUN:
+            self._active += 1
+            self._record_wait(agent_type, 0.0)
+            return 0.0
+
+        if decision == SHED:
+            self.shed += 1
+            retry_after = max(1, math.ceil(self._service_time * queued / self.max_concurrent))
+            raise SchedulerOverloaded(retry_after, queued)
+
+        priority = self.priorities.get(agent_type, max(self.priorities.values(), default=0))
+        clients = self._queues.setdefault(priority, OrderedDict())
+        waiters = clients.setdefault(client_id or "anonymous", deque())
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        self._queued += 1
+        if self.shared_state is not None and (self._poller is None or self._poller.done()):
+            self._poller = self._spawn(self._poll())
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted just as we were cancelled; hand it on
+                self.release()
+            elif self._discard(priority, client_id or "anonymous", waiter) and self.shared_state is not None:
+                self._spawn(self._shared_add(QUEUED_KEY, -1))
+            raise
+
+        wait = time.monotonic() - started
+        self._record_wait(agent_type, wait)
+        return wait
+
+    def release(self, held_seconds: Optional[float] = None):
+        """Give a run slot back and wake the next waiter"""
+        if held_seconds is not None:
+            self._service_time = 0.9 * self._service_time + 0.1 * held_seconds
+        self._active -= 1
+        if self.shared_state is None:
+            self._dispatch()
+        else:
+            self._spawn(self._return_slot())
+
+    async def _admit(self, may_run: bool) -> Tuple[str, int]:
+        """
+        Decide whether a new request runs now, waits or is shed
+
+        Args:
+            may_run (bool): Whether this process has a free slot and nobody waiting
+
+        Returns:
+            Tuple[str, int]: RUN, QUEUE or SHED, and the number of requests already waiting
+        """
+        if self.shared_state is None:
+            if may_run:
+                return RUN, 0
+            return (SHED if self._queued >= self.max_queue_depth else QUEUE), self._queued
+        task = self._spawn(asyncio.to_thread(self._admit_shared, may_run))
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # The store is still updated; take the slot or queue place back once it is
+            task.add_done_callback(self._undo_admission)
+            raise
+
+    def _admit_shared(self, may_run: bool) -> Tuple[str, int]:
+        if may_run and self._claim_shared():
+            return RUN, 0
+        queued = self.shared_state.incr(QUEUED_KEY, 1, self.lease)
+        if queued > self.max_queue_depth:
+            self.shared_state.incr(QUEUED_KEY, -1, self.lease)
+            return SHED, queued - 1
+        return QUEUE, queued - 1
+
+    def _undo_admission(self, task: asyncio.Task):
+        if task.cancelled() or task.exception() is not None:
+            return
+        decision, _ = task.result()
+        if decision == RUN:
+            self._spawn(self._return_slot())
+        elif decision == QUEUE:
+            self._spawn(self._shared_add(QUEUED_KEY, -1))
+
+    def _claim_shared(self) -> bool:
+        """Take a slot under the cap shared by every worker, if one is free"""
+        if self.shared_state.incr(ACTIVE_KEY, 1, self.lease) <= self.max_concurrent:
+            return True
+        self.shared_state.incr(ACTIVE_KEY, -1, self.lease)
+        return False
+
+    async def _shared_add(self, key: str, amount: int) -> int:
+        return await asyncio.to_thread(self.shared_state.incr, key, amount, self.lease)
+
+    async def _return_slot(self):
+        await self._shared_add(ACTIVE_KEY, -1)
+        await self._fill()
+
+    async def _fill(self):
+        """Hand slots of the shared cap to this process's waiters while there are both"""
+        if self._filling:
+            return
+        self._filling = True
+        try:
+            while self._queued and self._active < self.max_concurrent:
+                if not await asyncio.to_thread(self._claim_shared):
+                    break
+                if not self._queued:
+                    await self._shared_add(ACTIVE_KEY, -1)
+                    break
+                waiter = self._next_waiter()
+                self._queued -= 1
+                self._spawn(self._shared_add(QUEUED_KEY, -1))
+                if waiter.done():
+                    self._spawn(self._shared_add(ACTIVE_KEY, -1))
+                    continue
+                self._active += 1
+                waiter.set_result(None)
+        finally:
+            self._filling = False
+
+    async def _poll(self):
+        # Slots freed by other workers wake nobody here, so check for them
+        while self._queued:
+            await asyncio.sleep(POLL_INTERVAL)
+            await self._fill()
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _dispatch(self):
+        while self._active < self.max_concurrent and self._queued:
+            waiter = self._next_waiter()
+            self._queued -= 1
+            if waiter.done():
+                continue
+            self._active += 1
+            waiter.set_result(None)
+
+    def _next_waiter(self) -> asyncio.Future:
+        priority = min(p for p, clients in self._queues.items() if clients)
+        clients = self._queues[priority]
+        client_id, waiters = next(iter(clients.items()))
+        waiter = waiters.popleft()
+        # Round-robin: the client goes to the back of its priority level
+        if waiters:
+            clients.move_to_end(client_id)
+        else:
+            del clients[client_id]
+        return waiter
+
+    def _discard(self, priority: int, client_id: str, waiter: asyncio.Future) -> bool:
+        """Remove a waiter from its queue. Returns False if it had already been taken off."""
+        waiters = self._queues.get(priority, {}).get(client_id)
+        if waiters is None or waiter not in waiters:
+            return False
+        waiters.remove(waiter)
+        self._queued -= 1
+        if not waiters:
+            del self._queues[priority][client_id]
+        return True
+
+    def _record_wait(self, agent_type: str, seconds: float):
+        self._waits.setdefault(agent_type, deque(maxlen=WAIT_SAMPLES)).append(seconds)
+        QUEUE_WAIT.observe(seconds, (agent_type,))
+
+    def stats(self) -> Dict[str, object]:
+        """Current load and queue-wait percentiles per agent type"""
+        waits = {}
+        for agent_type, samples in self._waits.items():
+            ordered = sorted(samples)
+            waits[agent_type] = {
+                "samples": len(ordered),
+                "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+                "p95_ms": round(ordered[int(len(ordered) * 0.95)] * 1000, 2),
+                "max_ms": round(ordered[-1] * 1000, 2),
+            }
+        return {
+            "active": self._active,
+            "queued": self._queued,
+            "max_concurrent": self.max_concurrent,
+            "max_queue_depth": self.max_queue_depth,
+            "shed": self.shed,
+            "shared": self.shared_state is not None,
+            "queue_wait": waits,
+        }
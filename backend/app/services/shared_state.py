@@ -0,0 +1,164 @@
+"""
+State shared between worker processes.
+
+By default every uvicorn worker keeps its conversation summaries,
+uploaded-inventory analyses and circuit breakers in its own memory, which is
+only correct with a single worker. With SHARED_STATE_PATH set, that state
+lives in one SQLite file (WAL mode, so readers never block the writer) that
+every worker on the host opens, and the services read and update it there
+instead.
+
+SharedState is a small Redis-style key-value API (get, set with a TTL,
+delete, atomic read-modify-write, incr, prefix scan) over a single table, so a network
+store can replace it later without touching the services that use it.
+Values are JSON-encoded.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Callable, List, Optional, Tuple
+
+# Expired rows are purged once every this many writes
+PURGE_EVERY_WRITES = 1000
+
+# Lifetime of entries that replace a per-process LRU (summaries, analyses)
+DEFAULT_TTL = 86400.0
+
+
+class SharedState:
+    """
+    Key-value store with TTLs in a SQLite file shared by worker processes
+
+    Every method blocks on SQLite, and update() can wait up to `timeout` for
+    another worker's write lock, so async code calls them through
+    asyncio.to_thread.
+
+    Args:
+        path (str): Database file path; every worker must use the same one
+        timeout (float): Seconds to wait for another process's write lock
+        clock (Callable[[], float]): Time source for TTLs (wall clock, so workers agree)
+    """
+    def __init__(self, path: str, timeout: float = 10.0, clock: Callable[[], float] = time.time):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.clock = clock
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["SharedState"]:
+        """Open the store at SHARED_STATE_PATH, or None when state is per process"""
+        path = os.getenv("SHARED_STATE_PATH") or None
+        return cls(path) if path else None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """The value stored under key, or default if it is missing or expired"""
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM state WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= self.clock()):
+            return default
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store a value, expiring after ttl seconds (never when None)"""
+        expires_at = self.clock() + ttl if ttl is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            self._wrote()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE key = ?", (key,))
+
+    def update(self, key: str, fn: Callable[[Any], Any], ttl: Optional[float] = None) -> Any:
+        """
+        Atomically replace a value with fn(current value), across processes
+
+        Args:
+            key (str): Key to update
+            fn (Callable[[Any], Any]): Receives the current value (None if missing
+                or expired) and returns the new one; returning None deletes the key
+            ttl (Optional[float]): Expiry for the new value, in seconds
+
+        Returns:
+            Any: The new value
+        """
+        now = self.clock()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so no other worker can
+            # change the row between the read and the write
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT value, expires_at FROM state WHERE key = ?", (key,)).fetchone()
+                current = json.loads(row[0]) if row and (row[1] is None or row[1] > now) else None
+                value = fn(current)
+                if value is None:
+                    self._conn.execute("DELETE FROM state WHERE key = ?", (key,))
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(value), now + ttl if ttl is not None else None),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._wrote()
+        return value
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Add to an integer counter, starting from 0, and return the new count"""
+        return self.update(key, lambda current: (current or 0) + amount, ttl)
+
+    def scan(self, prefix: str) -> List[Tuple[str, Any]]:
+        """Live (key, value) pairs whose key starts with prefix, in key order"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM state WHERE key >= ? AND key < ? AND (expires_at IS NULL OR expires_at > ?) ORDER BY key",
+                (prefix, prefix + "\U0010ffff", self.clock()),
+            ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def _wrote(self):
+        # Called with the lock held
+        self._writes += 1
+        if self._writes % PURGE_EVERY_WRITES == 0:
+            self._conn.execute("DELETE FROM state WHERE expires_at <= ?", (self.clock(),))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Singleton instance; stays None unless SHARED_STATE_PATH is set
+_shared_state: Optional[SharedState] = None
+_shared_state_loaded = False
+_shared_state_lock = threading.Lock()
+
+
+def get_shared_state() -> Optional[SharedState]:
+    """
+    Get the process's handle on the shared state store
+
+    Returns:
+        Optional[SharedState]: The store, or None when each worker keeps its own state
+    """
+    global _shared_state, _shared_state_loaded
+    if not _shared_state_loaded:
+        with _shared_state_lock:
+            if not _shared_state_loaded:
+                _shared_state = SharedState.from_env()
+                _shared_state_loaded = True
+    return _shared_state
@@ -0,0 +1,139 @@
+"""
+In-flight deduplication ("single flight") for identical LLM calls.
+
+Concurrent callers asking for the same key share one upstream call: the
+first caller starts it and everyone else awaits the same result. Streams are
+fanned out the same way, with callers that join late replaying the chunks
+already received before following the live stream.
+"""
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _Broadcast:
+    """Chunks of one upstream stream, readable by any number of subscribers"""
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk: Optional[str] = None, error: Optional[BaseException] = None, done: bool = False):
+        if chunk is not None:
+            self.chunks.append(chunk)
+        if error is not None:
+            self.error = error
+        self.done = self.done or done
+        # Wake current readers; later waits use a fresh event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def read(self) -> AsyncIterator[str]:
+        position = 0
+        while True:
+            if position < len(self.chunks):
+                position += 1
+                yield self.chunks[position - 1]
+            elif self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                await self._changed.wait()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one execution
+
+    Args:
+        enabled (bool): When False every call runs on its own
+    """
+    def __init__(self, enabled: bool = True):
+        self.logger = logging.getLogger(__name__)
+        self.enabled = enabled
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run `fn`, or wait for the identical call already in flight
+
+        The shared call runs as its own task, so one caller giving up does not
+        cancel it for the others.
+        """
+        if not self.enabled:
+            return await fn()
+        future = self._calls.get(key)
+        if future is None:
+            self.executions += 1
+            future = self._calls[key] = asyncio.ensure_future(fn())
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+            # Retrieve the exception so an unawaited failure is not logged as lost
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(future)
+
+    async def stream(self, key: str, fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Stream from `fn`, or subscribe to the identical stream already in flight
+
+        The upstream stream is cancelled once every subscriber has gone.
+        """
+        if not self.enabled:
+            async for chunk in fn():
+                yield chunk
+            return
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            self.executions += 1
+            broadcast = self._streams[key] = _Broadcast()
+            broadcast.task = asyncio.ensure_future(self._pump(key, broadcast, fn))
+        else:
+            self.coalesced += 1
+
+        broadcast.subscribers += 1
+        try:
+            async for chunk in broadcast.read():
+                yield chunk
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.done:
+                # Unlist it first, so a caller arriving before the pump has
+                # stopped starts a fresh stream instead of joining a dead one
+                if self._streams.get(key) is broadcast:
+                    del self._streams[key]
+                broadcast.task.cancel()
+
+    async def _pump(self, key: str, broadcast: _Broadcast, fn: Callable[[], AsyncIterator[str]]):
+        try:
+            async for chunk in fn():
+                broadcast.publish(chunk)
+            broadcast.publish(done=True)
+        except asyncio.CancelledError:
+            broadcast.publish(error=RuntimeError("stream abandoned"), done=True)
+        except Exception as e:
+            broadcast.publish(error=e, done=True)
+        finally:
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+
+    def in_flight(self, key: str) -> bool:
+        """Whether a call or stream with this key is running, so a new caller would join it"""
+        return key in self._calls or key in self._streams
+
+    def stats(self) -> Dict[str, int]:
+        """Upstream executions versus calls that joined one already in flight"""
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,295 @@
+"""
+Storage backends for DatabaseService.
+
+InMemoryStorage keeps chats in a process-local dict (the default).
+SQLiteStorage persists them to a WAL-mode SQLite file, writing each
+append_messages call in one transaction off the event loop. Grouping
+concurrent store calls into those calls is left to DatabaseService's writer
+task, so there is a single write queue and flush policy.
+"""
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+from .paths import data_path
+
+# Length of the last-message preview kept in the chat index
+PREVIEW_CHARS = 120
+
+
+def _preview(message: Dict[str, Any]) -> str:
+    return str(message.get("content", ""))[:PREVIEW_CHARS]
+
+
+class InvalidCursorError(ValueError):
+    """A pagination cursor that no page returned"""
+
+
+def _check_cursor(cursor: Optional[int], upper: Optional[int] = None):
+    """
+    Raises:
+        InvalidCursorError: If the cursor is not positive, or above `upper` when given
+    """
+    if cursor is not None and (cursor < 1 or (upper is not None and cursor > upper)):
+        raise InvalidCursorError(f"Invalid cursor: {cursor}")
+
+
+class StorageBackend(ABC):
+    """Interface every chat storage backend implements"""
+
+    @abstractmethod
+    async def append_message(self, chat_id: str, message: Dict[str, Any]):
+        """Durably append a message to a chat"""
+
+    async def append_messages(self, rows: List[Tuple[str, Dict[str, Any]]]):
+        """Durably append (chat_id, message) pairs in order; backends may group them into one write"""
+        for chat_id, message in rows:
+            await self.append_message(chat_id, message)
+
+    @abstractmethod
+    async def get_recent_messages(self, chat_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Return the last `limit` messages of a chat, oldest first"""
+
+    @abstractmethod
+    async def get_messages_page(self, chat_id: str, limit: int, after: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Return up to `limit` messages of a chat, oldest first, starting after cursor `after`.
+
+        Returns:
+            Tuple[List[Dict[str, Any]], Optional[int]]: The page and the cursor for the next one
+
+        Raises:
+            InvalidCursorError: If `after` is not a cursor this backend could have returned
+        """
+
+    @abstractmethod
+    async def list_chats(self, limit: int, before: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Return up to `limit` chat summaries, newest chat first, starting before cursor `before`.
+
+        Each summary has chat_id, message_count, last_role, last_message (a preview)
+        and updated_at.
+
+        Returns:
+            Tuple[List[Dict[str, Any]], Optional[int]]: The page and the cursor for the next one
+
+        Raises:
+            InvalidCursorError: If `before` is not a cursor this backend could have returned
+        """
+
+    async def close(self):
+        """Flush pending writes and release resources"""
+
+
+class InMemoryStorage(StorageBackend):
+    """Process-local dict of chats. Fast, but lost on restart and not shared between workers."""
+
+    def __init__(self):
+        self.chats: Dict[str, List[Dict[str, Any]]] = {}
+        # Lightweight index: chat_ids in creation order plus a summary per chat
+        self.chat_order: List[str] = []
+        self.summaries: Dict[str, Dict[str, Any]] = {}
+
+    async def append_message(self, chat_id: str, message: Dict[str, Any]):
+        if chat_id not in self.chats:
+            self.chats[chat_id] = []
+            self.chat_order.append(chat_id)
+            self.summaries[chat_id] = {"chat_id": chat_id, "message_count": 0}
+        self.chats[chat_id].append(message)
+        self.summaries[chat_id].update(
+            message_count=len(self.chats[chat_id]),
+            last_role=message.get("role"),
+            last_message=_preview(message),
+            updated_at=time.time(),
+        )
+
+    async def get_recent_messages(self, chat_id: str, limit: int) -> List[Dict[str, Any]]:
+        return self.chats.get(chat_id, [])[-limit:]
+
+    async def get_messages_page(self, chat_id: str, limit: int, after: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        messages = self.chats.get(chat_id, [])
+        # Chats only grow, so a cursor handed out earlier never points past the end
+        _check_cursor(after, len(messages))
+        start = 0 if after is None else after
+        page = messages[start:start + limit]
+        end = start + len(page)
+        return page, end if end < len(messages) else None
+
+    async def list_chats(self, limit: int, before: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        # Cursors are positions in chat_order; pages walk it backwards (newest first)
+        _check_cursor(before, len(self.chat_order))
+        end = len(self.chat_order) if before is None else before
+        start = max(0, end - limit)
+        page = [dict(self.summaries[chat_id]) for chat_id in reversed(self.chat_order[start:end])]
+        return page, start if start > 0 else None
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    SQLite-backed chat storage.
+
+    Args:
+        path (str): Database file path
+    """
+
+    def __init__(self, path: str = "chat_history.db"):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+
+        self._write_conn = self._connect()
+        self._write_lock = threading.Lock()
+        self._write_conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages (chat_id, id);
+            CREATE TABLE IF NOT EXISTS chats (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id TEXT NOT NULL UNIQUE,
+                message_count INTEGER NOT NULL,
+                last_role TEXT,
+                last_message TEXT,
+                updated_at REAL NOT NULL
+            );
+            """
+        )
+        self._backfill_chat_index()
+        self._read_conn = self._connect()
+        self._read_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _backfill_chat_index(self):
+        # Databases written before the chats index existed only have messages
+        if self._write_conn.execute("SELECT 1 FROM chats LIMIT 1").fetchone():
+            return
+        self._write_conn.execute(
+            """
+            INSERT INTO chats (chat_id, message_count, last_role, last_message, updated_at)
+            SELECT m.chat_id, c.n, json_extract(m.data, '$.role'),
+                   substr(json_extract(m.data, '$.content'), 1, ?), m.created_at
+            FROM messages m
+            JOIN (
+                SELECT chat_id, COUNT(*) AS n, MIN(id) AS first_id, MAX(id) AS last_id
+                FROM messages GROUP BY chat_id
+            ) c ON m.id = c.last_id
+            ORDER BY c.first_id
+            """,
+            (PREVIEW_CHARS,),
+        )
+
+    async def append_message(self, chat_id: str, message: Dict[str, Any]):
+        await self.append_messages([(chat_id, message)])
+
+    async def append_messages(self, rows: List[Tuple[str, Dict[str, Any]]]):
+        records = [
+            (chat_id, time.time(), json.dumps(message), message.get("role"), _preview(message))
+            for chat_id, message in rows
+        ]
+        await asyncio.to_thread(self._write_batch, records)
+
+    def _write_batch(self, rows: List[Tuple[str, float, str, Optional[str], str]]):
+        with self._write_lock, self._write_conn:
+            self._write_conn.execute("BEGIN")
+            self._write_conn.executemany(
+                "INSERT INTO messages (chat_id, created_at, data) VALUES (?, ?, ?)",
+                [row[:3] for row in rows],
+            )
+            self._write_conn.executemany(
+                """
+                INSERT INTO chats (chat_id, message_count, last_role, last_message, updated_at)
+                VALUES (?, 1, ?, ?, ?)
+                ON CONFLICT (chat_id) DO UPDATE SET
+                    message_count = message_count + 1,
+                    last_role = excluded.last_role,
+                    last_message = excluded.last_message,
+                    updated_at = excluded.updated_at
+                """,
+                [(chat_id, role, preview, created_at) for chat_id, created_at, _, role, preview in rows],
+            )
+
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._read_lock:
+            return self._read_conn.execute(sql, params).fetchall()
+
+    async def get_recent_messages(self, chat_id: str, limit: int) -> List[Dict[str, Any]]:
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT data FROM messages WHERE chat_id = ? ORDER BY id DESC LIMIT ?",
+            (chat_id, limit),
+        )
+        return [json.loads(data) for (data,) in reversed(rows)]
+
+    async def get_messages_page(self, chat_id: str, limit: int, after: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        # Row ids start at 1; larger ids are only known to be invalid after the query
+        _check_cursor(after)
+        # Fetch one extra row to know whether another page exists
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT id, data FROM messages WHERE chat_id = ? AND id > ? ORDER BY id LIMIT ?",
+            (chat_id, after or 0, limit + 1),
+        )
+        page = [json.loads(data) for _, data in rows[:limit]]
+        return page, rows[limit - 1][0] if len(rows) > limit else None
+
+    async def list_chats(self, limit: int, before: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        _check_cursor(before)
+        rows = await asyncio.to_thread(
+            self._query,
+            """
+            SELECT seq, chat_id, message_count, last_role, last_message, updated_at
+            FROM chats WHERE seq < ? ORDER BY seq DESC LIMIT ?
+            """,
+            (before if before is not None else 2 ** 63 - 1, limit + 1),
+        )
+        page = [
+            {
+                "chat_id": chat_id,
+                "message_count": count,
+                "last_role": role,
+                "last_message": preview,
+                "updated_at": updated_at,
+            }
+            for _, chat_id, count, role, preview, updated_at in rows[:limit]
+        ]
+        return page, rows[limit - 1][0] if len(rows) > limit else None
+
+    async def close(self):
+        with self._write_lock:
+            self._write_conn.close()
+        with self._read_lock:
+            self._read_conn.close()
+
+
+def create_storage_backend() -> StorageBackend:
+    """
+    Build the backend selected by DATABASE_BACKEND (memory or sqlite)
+
+    The default is sqlite when SHARED_STATE_PATH is set, since the workers
+    sharing state must also share their chats.
+    """
+    shared = bool(os.getenv("SHARED_STATE_PATH"))
+    backend = os.getenv("DATABASE_BACKEND", "sqlite" if shared else "memory").lower()
+    if shared and backend == "memory":
+        logging.getLogger(__name__).warning(
+            "DATABASE_BACKEND=memory with SHARED_STATE_PATH set: each worker keeps its own chats"
+        )
+    if backend == "sqlite":
+        return SQLiteStorage(os.getenv("DATABASE_PATH") or data_path("chat_history.db"))
+    if backend != "memory":
+        raise ValueError(f"Unknown DATABASE_BACKEND '{backend}'. Use 'memory' or 'sqlite'.")
+    return InMemoryStorage()
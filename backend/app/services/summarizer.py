@@ -0,0 +1,188 @@
+"""
+Incremental conversation summarizer.
+
+The latest summary of each chat is kept together with a high-water mark: a
+fingerprint of the last messages already folded into it. The next request
+only sends the messages after that mark to the model, together with the
+previous summary, so cost stays flat as a conversation grows. Inputs too
+large for one call are summarized map-reduce style in chunks first. With a
+shared state store the summaries are kept there, so every worker can extend
+them.
+"""
+import os
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .prompts import SUMMARY_CHUNK_PROMPT, SUMMARY_PROMPT, SUMMARY_UPDATE_PROMPT
+from .shared_state import DEFAULT_TTL, SharedState
+
+# Number of trailing messages hashed into the high-water mark
+WATERMARK_MESSAGES = 3
+
+
+def _fingerprint(texts: List[str]) -> str:
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class IncrementalSummarizer:
+    """
+    Rolling per-chat summaries that only fold in new messages.
+
+    Args:
+        generate (Callable): Async function that sends a list of {"role", "content"}
+            messages to the model and returns its Completion
+        token_counter (Callable[[str], int]): Function used to size prompts
+        chunk_tokens (int): Largest input folded in a single call before switching to map-reduce
+        max_chats (int): Number of per-chat summaries kept in memory (LRU)
+        state (Optional[SharedState]): Store to keep the summaries in instead,
+            shared with the other workers
+    """
+    def __init__(
+        self,
+        generate: Callable,
+        token_counter: Callable[[str], int],
+        chunk_tokens: int = 6000,
+        max_chats: int = 1000,
+        state: Optional[SharedState] = None,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.generate = generate
+        self.token_counter = token_counter
+        self.chunk_tokens = chunk_tokens
+        self.max_chats = max_chats
+        self.shared_state = state
+        # key -> (high-water fingerprint, summary)
+        self._state: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+
+    @classmethod
+    def from_env(cls, generate: Callable, token_counter: Callable[[str], int],
+                 state: Optional[SharedState] = None) -> "IncrementalSummarizer":
+        """Build a summarizer from SUMMARY_CHUNK_TOKENS and SUMMARY_MAX_CHATS"""
+        return cls(
+            generate=generate,
+            token_counter=token_counter,
+            chunk_tokens=int(os.getenv("SUMMARY_CHUNK_TOKENS", "6000")),
+            max_chats=int(os.getenv("SUMMARY_MAX_CHATS", "1000")),
+            state=state,
+        )
+
+    async def summarize(self, texts: List[str], key: Optional[str] = None) -> Tuple[str, Dict[str, int]]:
+        """
+        Summarize a list of messages, reusing the stored summary for `key` when possible
+
+        Args:
+            texts (List[str]): Messages to summarize, oldest first
+            key (Optional[str]): Identifier of the conversation; without it nothing is reused
+
+        Returns:
+            Tuple[str, Dict[str, int]]: The summary and usage metrics (llm_calls,
+                new_messages, and the prompt_tokens, cached_prompt_tokens and
+                completion_tokens the calls cost upstream)
+        """
+        metrics = {
+            "llm_calls": 0,
+            "prompt_tokens": 0,
+            "cached_prompt_tokens": 0,
+            "completion_tokens": 0,
+            "new_messages": len(texts),
+        }
+        previous, start = "", 0
+
+        state = await self._load(key) if key else None
+        if state is not None:
+            mark, summary = state
+            position = self._find_mark(texts, mark)
+            if position is not None:
+                previous, start = summary, position
+
+        new_texts = texts[start:]
+        metrics["new_messages"] = len(new_texts)
+        if not new_texts:
+            return previous, metrics
+
+        text = "\n".join(new_texts)
+        if self.token_counter(text) > self.chunk_tokens:
+            text = await self._map_chunks(new_texts, metrics)
+
+        if previous:
+            summary = await self._call(SUMMARY_UPDATE_PROMPT.messages(summary=previous, text=text), metrics)
+        else:
+            summary = await self._call(SUMMARY_PROMPT.messages(text=text), metrics)
+
+        if key:
+            await self._save(key, _fingerprint(texts[-WATERMARK_MESSAGES:]), summary)
+        return summary, metrics
+
+    async def _load(self, key: str) -> Optional[Tuple[str, str]]:
+        """The (high-water mark, summary) stored for a conversation"""
+        if self.shared_state is not None:
+            state = await asyncio.to_thread(self.shared_state.get, f"summary:{key}")
+            return tuple(state) if state else None
+        state = self._state.get(key)
+        if state is not None:
+            self._state.move_to_end(key)
+        return state
+
+    async def _save(self, key: str, mark: str, summary: str):
+        if self.shared_state is not None:
+            await asyncio.to_thread(self.shared_state.set, f"summary:{key}", [mark, summary], DEFAULT_TTL)
+            return
+        self._state[key] = (mark, summary)
+        self._state.move_to_end(key)
+        while len(self._state) > self.max_chats:
+            self._state.popitem(last=False)
+
+    def _find_mark(self, texts: List[str], mark: str) -> Optional[int]:
+        # Search from the end: the mark is usually just behind the newest messages
+        for end in range(len(texts), 0, -1):
+            if _fingerprint(texts[max(0, end - WATERMARK_MESSAGES):end]) == mark:
+                return end
+        return None
+
+    def _chunks(self, texts: List[str]) -> List[str]:
+        """Group messages into chunks of at most chunk_tokens, splitting oversized messages"""
+        chunks, current, size = [], [], 0
+        for text in texts:
+            tokens = self.token_counter(text)
+            if tokens > self.chunk_tokens:
+                # Split very long messages by characters, proportionally to their token count
+                step = max(1, len(text) * self.chunk_tokens // tokens)
+                pieces = [text[i:i + step] for i in range(0, len(text), step)]
+            else:
+                pieces = [text]
+            for piece in pieces:
+                piece_tokens = self.token_counter(piece)
+                if current and size + piece_tokens > self.chunk_tokens:
+                    chunks.append("\n".join(current))
+                    current, size = [], 0
+                current.append(piece)
+                size += piece_tokens
+        if current:
+            chunks.append("\n".join(current))
+        return chunks
+
+    async def _map_chunks(self, texts: List[str], metrics: Dict[str, int]) -> str:
+        """Summarize each chunk concurrently and return the partial summaries joined in order"""
+        partials = await asyncio.gather(
+            *(self._call(SUMMARY_CHUNK_PROMPT.messages(text=chunk), metrics) for chunk in self._chunks(texts))
+        )
+        combined = "\n".join(partials)
+        # Partial summaries can themselves be too long for one call on huge inputs
+        if self.token_counter(combined) > self.chunk_tokens and len(partials) > 1:
+            return await self._map_chunks(partials, metrics)
+        return combined
+
+    async def _call(self, messages: List[Dict[str, str]], metrics: Dict[str, int]) -> str:
+        completion = await self.generate(messages)
+        metrics["llm_calls"] += 1
+        metrics["prompt_tokens"] += completion.prompt_tokens
+        metrics["cached_prompt_tokens"] += completion.cached_prompt_tokens
+        metrics["completion_tokens"] += completion.completion_tokens
+        return completion.text
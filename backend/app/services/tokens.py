@@ -0,0 +1,65 @@
+"""
+Token counting helpers.
+
+Uses tiktoken when it is installed and has an encoding for the model, and
+falls back to a character-based estimate otherwise.
+"""
+import logging
+from functools import lru_cache
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Per-message overhead of the OpenAI chat format (role markers and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)"""
+    return max(1, len(text) // 4) if text else 0
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(model: Optional[str] = None) -> Callable[[str], int]:
+    """
+    Return a function that counts tokens for the given model
+
+    Args:
+        model (Optional[str]): Model name used to pick the tokenizer
+
+    Returns:
+        Callable[[str], int]: tiktoken-based counter, or estimate_tokens if unavailable
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        logger.info("tiktoken not installed; using estimated token counts")
+        return estimate_tokens
+
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # Encodings are downloaded on first use, which fails on offline hosts
+        logger.warning(f"Could not load tokenizer for {model}: {str(e)}; using estimated token counts")
+        return estimate_tokens
+
+    def count(text: str) -> int:
+        return len(encoding.encode(text, disallowed_special=())) if text else 0
+
+    return count
+
+
+def lazy_token_counter(model: Optional[str] = None) -> Callable[[str], int]:
+    """
+    Like get_token_counter, but the tokenizer is only loaded on the first count
+
+    Keeps importing tiktoken and loading its encoding out of service construction.
+    """
+    def count(text: str) -> int:
+        return get_token_counter(model)(text)
+
+    return count
+
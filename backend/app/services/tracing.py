@@ -0,0 +1,396 @@
+"""
+Request tracing.
+
+Spans follow the OpenTelemetry data model: 128-bit trace ids, 64-bit span
+ids, parent links, attributes, a status and nanosecond timestamps. An
+incoming W3C `traceparent` header continues the caller's trace, including
+its sampling decision, and every response carries a `traceparent` header
+for the server span. Spans of unsampled traces still get ids, so the trace
+context propagates, but they are neither kept nor exported.
+
+No collector is needed. Finished spans are kept in a bounded in-memory
+buffer that GET /traces reads, and with TRACING_FILE set they are also
+appended to a JSON lines file in the OTLP/JSON span encoding, one span per
+line, for loading into any OTLP-aware tool later. The file is written by a
+background thread, so encoding and disk I/O stay off the event loop. opentelemetry-sdk is not
+a dependency; the few pieces needed here are implemented directly.
+"""
+import os
+import json
+import time
+import queue
+import random
+import logging
+import threading
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, NamedTuple, Optional, Union
+
+# OTLP span kinds and status codes
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+STATUS_CODES = {"unset": 0, "ok": 1, "error": 2}
+
+
+class SpanContext(NamedTuple):
+    """The identity of a span, as propagated between processes"""
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """
+    Parse a W3C traceparent header ("00-<trace id>-<span id>-<flags>")
+
+    Returns:
+        Optional[SpanContext]: The remote parent, or None if the header is missing or malformed
+    """
+    if not value:
+        return None
+    parts = value.strip().lower().split("-")
+    if len(parts) < 4 or parts[0] == "ff" or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        trace_id, span_id, flags = int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    if not trace_id or not span_id:
+        return None
+    return SpanContext(parts[1], parts[2], bool(flags & 1))
+
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    """Encode an attribute value as an OTLP AnyValue"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """One timed operation within a trace"""
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "remote_parent", "sampled", "kind",
+                 "start_ns", "end_ns", "attributes", "status", "status_message", "events")
+
+    def __init__(self, name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None,
+                 remote_parent: bool = False, kind: str = "internal", attributes: Optional[Dict[str, Any]] = None,
+                 sampled: bool = True):
+        self.name = name
+        self.trace_id = trace_id or f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.remote_parent = remote_parent
+        self.sampled = sampled
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes) if attributes else {}
+        self.status = "unset"
+        self.status_message = ""
+        self.events: List[Dict[str, Any]] = []
+
+    @property
+    def context(self) -> SpanContext:
+        return SpanContext(self.trace_id, self.span_id, self.sampled)
+
+    @property
+    def is_local_root(self) -> bool:
+        """True for the first span of a trace in this process"""
+        return self.parent_id is None or self.remote_parent
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        self.attributes.update(attributes)
+
+    def set_status(self, status: str, message: str = ""):
+        self.status = status
+        self.status_message = message
+
+    def record_exception(self, e: BaseException):
+        self.events.append({
+            "name": "exception",
+            "timeUnixNano": time.time_ns(),
+            "attributes": {"exception.type": type(e).__name__, "exception.message": str(e)},
+        })
+        self.set_status("error", str(e))
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """The span in the OTLP/JSON encoding"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KINDS[self.kind],
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [{"key": k, "value": _attribute_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": STATUS_CODES[self.status], **({"message": self.status_message} if self.status_message else {})},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.events:
+            span["events"] = [
+                {"name": event["name"], "timeUnixNano": str(event["timeUnixNano"]),
+                 "attributes": [{"key": k, "value": _attribute_value(v)} for k, v in event["attributes"].items()]}
+                for event in self.events
+            ]
+        return span
+
+
+class _NonRecordingSpan:
+    """Stands in for a span while tracing is disabled"""
+    traceparent = None
+    attributes: Dict[str, Any] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        pass
+
+    def set_status(self, status: str, message: str = ""):
+        pass
+
+    def record_exception(self, e: BaseException):
+        pass
+
+
+NON_RECORDING_SPAN = _NonRecordingSpan()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span():
+    """The active span, or a no-op span outside of any trace"""
+    return _current_span.get() or NON_RECORDING_SPAN
+
+
+class _ActiveSpan:
+    """Makes a span current for a `with` block and finishes it on exit"""
+    __slots__ = ("tracer", "span", "token")
+
+    def __init__(self, tracer: "Tracer", span: Span):
+        self.tracer = tracer
+        self.span = span
+        self.token = None
+
+    def __enter__(self) -> Span:
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if isinstance(exc, Exception):
+            self.span.record_exception(exc)
+        try:
+            _current_span.reset(self.token)
+        except ValueError:
+            # Ended from another context, e.g. an abandoned stream finalized later
+            pass
+        self.tracer._finish(self.span)
+        return False
+
+
+class Tracer:
+    """
+    Creates spans and exports them when they end
+
+    Args:
+        enabled (bool): When False spans are not recorded
+        buffer_spans (int): Finished spans kept in memory for GET /traces
+        path (Optional[str]): JSON lines file that finished spans are appended to
+    """
+    def __init__(self, enabled: bool = True, buffer_spans: int = 5000, path: Optional[str] = None):
+        self.logger = logging.getLogger(__name__)
+        self.enabled = enabled
+        self.finished: deque = deque(maxlen=buffer_spans)
+        self.path = path
+        # Finished spans waiting for the writer thread; None asks it to stop
+        self._exports: Optional[queue.SimpleQueue] = None
+        self._writer: Optional[threading.Thread] = None
+        if enabled and path:
+            self._exports = queue.SimpleQueue()
+            self._writer = threading.Thread(
+                target=self._write_spans, args=(open(path, "a", encoding="utf-8"),), name="span-writer", daemon=True
+            )
+            self._writer.start()
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        return cls(
+            enabled=os.getenv("TRACING_ENABLED", "true").lower() not in ("0", "false", "no"),
+            buffer_spans=int(os.getenv("TRACING_BUFFER_SPANS", "5000")),
+            path=os.getenv("TRACING_FILE") or None,
+        )
+
+    def start_as_current_span(self, name: str, attributes: Optional[Dict[str, Any]] = None,
+                              parent: Optional[SpanContext] = None, kind: str = "internal") -> Union[_ActiveSpan, _NonRecordingSpan]:
+        """
+        Time a `with` block as a child of the active span
+
+        Args:
+            name (str): Operation name
+            attributes (Optional[Dict[str, Any]]): Initial span attributes
+            parent (Optional[SpanContext]): Remote parent from an incoming request,
+                used instead of the active span
+            kind (str): "internal", "server" or "client"
+
+        Returns:
+            Context manager yielding the new span, active until the block exits
+        """
+        if not self.enabled:
+            return NON_RECORDING_SPAN
+        if parent is not None:
+            span = Span(name, parent.trace_id, parent.span_id, True, kind, attributes, parent.sampled)
+        else:
+            current = _current_span.get()
+            if current is not None:
+                span = Span(name, current.trace_id, current.span_id, False, kind, attributes, current.sampled)
+            else:
+                span = Span(name, None, None, False, kind, attributes)
+        return _ActiveSpan(self, span)
+
+    def _finish(self, span: Span):
+        span.end_ns = time.time_ns()
+        if not span.sampled:
+            return
+        self.finished.append(span)
+        exports = self._exports
+        if exports is not None:
+            exports.put(span)
+
+    def _write_spans(self, file):
+        """Writer thread: append queued spans to the trace file, flushing whenever the queue runs dry"""
+        with file:
+            while True:
+                span = self._exports.get()
+                if span is None:
+                    return
+                try:
+                    file.write(json.dumps(span.to_otlp()) + "\n")
+                    if self._exports.empty():
+                        file.flush()
+                except (OSError, TypeError, ValueError) as e:
+                    self.logger.warning(f"Could not export span {span.name}: {str(e)}")
+
+    def recent_traces(self, limit: int = 20, min_ms: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        Finished traces from the in-memory buffer, slowest first
+
+        Args:
+            limit (int): Maximum traces to return
+            min_ms (float): Only traces whose root span took at least this long
+
+        Returns:
+            List[Dict[str, Any]]: Each trace with its spans in start order,
+                timed relative to the trace's first span
+        """
+        traces: Dict[str, List[Span]] = {}
+        for span in list(self.finished):
+            traces.setdefault(span.trace_id, []).append(span)
+
+        results = []
+        for trace_id, spans in traces.items():
+            roots = [span for span in spans if span.is_local_root]
+            if not roots:
+                continue
+            root = max(roots, key=lambda span: span.duration_ms)
+            if root.duration_ms < min_ms:
+                continue
+            spans.sort(key=lambda span: span.start_ns)
+            started = spans[0].start_ns
+            results.append({
+                "trace_id": trace_id,
+                "name": root.name,
+                "duration_ms": round(root.duration_ms, 3),
+                "spans": [
+                    {
+                        "name": span.name,
+                        "span_id": span.span_id,
+                        "parent_id": span.parent_id,
+                        "offset_ms": round((span.start_ns - started) / 1e6, 3),
+                        "duration_ms": round(span.duration_ms, 3),
+                        "status": span.status,
+                        "attributes": span.attributes,
+                    }
+                    for span in spans
+                ],
+            })
+        results.sort(key=lambda trace: trace["duration_ms"], reverse=True)
+        return results[:limit]
+
+    def close(self):
+        """Write the spans still queued for the trace file, then close it"""
+        if self._writer is not None:
+            self._exports.put(None)
+            self._writer.join()
+            self._writer = None
+            self._exports = None
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that wraps each HTTP request in a server span
+
+    The span continues the trace from an incoming traceparent header, ends
+    once the response body has been sent (so streamed responses are timed in
+    full) and is echoed back in the response's traceparent header.
+    """
+    def __init__(self, app, tracer: Optional[Tracer] = None):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        tracer = self.tracer or get_tracer()
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        header = next((value for name, value in scope["headers"] if name == b"traceparent"), None)
+        parent = parse_traceparent(header.decode("latin-1")) if header else None
+        attributes = {"http.method": scope["method"], "http.target": scope["path"]}
+        with tracer.start_as_current_span(f"{scope['method']} {scope['path']}", attributes, parent=parent, kind="server") as span:
+            async def send_with_traceparent(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.set_status("error")
+                    message["headers"] = list(message.get("headers", [])) + [(b"traceparent", span.traceparent.encode("latin-1"))]
+                await send(message)
+
+            await self.app(scope, receive, send_with_traceparent)
+
+
+# Singleton instance of the tracer
+_tracer = None
+
+def get_tracer() -> Tracer:
+    """
+    Get the singleton tracer, configured from TRACING_* settings
+
+    Returns:
+        Tracer: The tracer instance
+    """
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer.from_env()
+    return _tracer
@@ -1,17 +1,30 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from typing import List, Optional, Dict, Any
+import os
+import json
+import time
+import asyncio
 import logging
 import uvicorn
 import uuid
 
 # Import models from the models package
-from app.models import Message, TestLLMRequest, ChatRequest, ChatResponse
+from app.models import Message, TestLLMRequest, ChatRequest, BatchChatRequest, ChatResponse
 
 # Import services for dependency injection
 from app.services import get_database_service, DatabaseService
 from app.services import get_ai_service, AIService
 from app.services.llm_service import get_llm_service, LLMService
+from app.services.http_client import close_http_client
+from app.services.scheduler import SchedulerOverloaded
+from app.services.resilience import CircuitOpenError
+from app.services.batch import BatchConflictError
+from app.services.storage import InvalidCursorError
+from app.services.metrics import REGISTRY
+from app.services.tracing import TracingMiddleware, get_tracer
+from app.services.shared_state import get_shared_state
 
 # Configure logging
 logging.basicConfig(
@@ -36,59 +49,278 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Time every request as a trace span, continuing the caller's traceparent
+app.add_middleware(TracingMiddleware)
+
 # Models are now imported from app.models
 
+async def _index_documents():
+    try:
+        await get_ai_service().reindex_documents()
+    except Exception as e:
+        logger.error(f"Error indexing documents: {str(e)}")
+
+async def _warm_up():
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(get_ai_service().warm_up)
+        logger.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        logger.error(f"Error warming up: {str(e)}")
+
+@app.on_event("startup")
+async def startup():
+    # Each worker process has its own services; only shared state keeps them consistent
+    if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 and get_shared_state() is None:
+        logger.warning("Running several workers without SHARED_STATE_PATH: chats, summaries and caches are per worker")
+    # Heavy imports and client construction were deferred to keep worker boot fast;
+    # load them now in the background so the first request does not pay for them
+    if os.getenv("WARMUP_ON_STARTUP", "true").lower() not in ("0", "false", "no"):
+        app.state.warmup = asyncio.create_task(_warm_up())
+    # Bring the RAG document index up to date without delaying startup
+    app.state.indexing = asyncio.create_task(_index_documents())
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Flush writes still queued for the write-behind writer and the storage backend
+    await get_database_service().close()
+    # Close pooled keep-alive connections to the LLM provider
+    await close_http_client()
+    # Flush spans still buffered for the trace file
+    get_tracer().close()
+    if get_shared_state() is not None:
+        get_shared_state().close()
+
 # Routes
 @app.get("/")
 async def root():
     return {"message": "Welcome to Inventory Analyzer AI API"}
 
+async def _prepare_chat(request: ChatRequest, db_service: DatabaseService):
+    """
+    Resolve the chat_id and the full message list for a chat request.
+    
+    When the request continues an existing chat, the earlier turns are read
+    back from storage so the client only has to send the new message(s).
+    """
+    new_messages = [msg.dict() for msg in request.messages]
+    if request.chat_id:
+        history = await db_service.get_conversation(request.chat_id)
+        return request.chat_id, history + new_messages
+    # Generate a new chat ID if one doesn't exist
+    return str(uuid.uuid4()), new_messages
+
+def _client_id(http_request: Request) -> Optional[str]:
+    """Identify the caller for fair scheduling: X-Client-ID header, else the peer address"""
+    client_id = http_request.headers.get("X-Client-ID")
+    if client_id:
+        return client_id
+    return http_request.client.host if http_request.client else None
+
+def _overloaded(e: SchedulerOverloaded) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
+    http_request: Request,
     ai_service: AIService = Depends(get_ai_service),
     db_service: DatabaseService = Depends(get_database_service)
 ):
     try:
         logger.info(f"Received chat request with agent type: {request.agent_type}")
         
-        # Generate a new chat ID if one doesn't exist
-        chat_id = str(uuid.uuid4())
+        chat_id, messages = await _prepare_chat(request, db_service)
         
         # Process request through AI service
-        messages = [msg.dict() for msg in request.messages]
-        response = await ai_service.process_request(messages, request.agent_type)
-        
-        # Store the message in the database
-        message_to_store = {
-            "content": request.messages[-1].content,
-            "role": request.messages[-1].role
-        }
-        await db_service.store_message(chat_id, message_to_store)
+        response = await ai_service.process_request(messages, request.agent_type, chat_id, _client_id(http_request))
         
-        # Store the AI response
-        await db_service.store_message(chat_id, response)
+        # Queue the new client messages and the AI response for storage; with
+        # write-behind this returns without waiting for the database
+        await db_service.store_messages(chat_id, [msg.dict() for msg in request.messages] + [response])
         
         return ChatResponse(
             message=Message(**response),
             chat_id=chat_id
         )
+    except SchedulerOverloaded as e:
+        logger.warning(f"Shedding chat request: {str(e)}")
+        raise _overloaded(e)
     except Exception as e:
         logger.error(f"Error processing chat request: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _encode_stream_event(event: Dict[str, Any], stream_format: str) -> str:
+    """Encode a stream event as a Server-Sent Event or a newline-delimited JSON line"""
+    if stream_format == "sse":
+        payload = {k: v for k, v in event.items() if k != "type"}
+        return f"event: {event['type']}\ndata: {json.dumps(payload)}\n\n"
+    return json.dumps(event) + "\n"
+
+@app.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    http_request: Request,
+    stream_format: str = Query("sse", alias="format", pattern="^(sse|ndjson)$"),
+    ai_service: AIService = Depends(get_ai_service),
+    db_service: DatabaseService = Depends(get_database_service)
+):
+    """Stream the agent's answer token by token as SSE (default) or chunked NDJSON"""
+    logger.info(f"Received streaming chat request with agent type: {request.agent_type}")
+    
+    try:
+        chat_id, messages = await _prepare_chat(request, db_service)
+        events = await ai_service.stream_request(messages, request.agent_type, chat_id, _client_id(http_request))
+    except SchedulerOverloaded as e:
+        logger.warning(f"Shedding streaming chat request: {str(e)}")
+        raise _overloaded(e)
+    except Exception as e:
+        logger.error(f"Error starting streaming chat request: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def event_stream():
+        try:
+            async for event in events:
+                if event["type"] == "done":
+                    # Queue the exchange before telling the client the stream is complete, so a follow-up turn reads it
+                    try:
+                        await db_service.store_messages(chat_id, [msg.dict() for msg in request.messages] + [event["message"]])
+                    except Exception as e:
+                        logger.error(f"Error storing streamed chat {chat_id}: {str(e)}")
+                    event = {**event, "chat_id": chat_id}
+                yield _encode_stream_event(event, stream_format)
+        finally:
+            # Gives the scheduler slot back as soon as the client goes away
+            await events.aclose()
+    
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        event_stream(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/chat/batch")
+async def chat_batch(
+    request: BatchChatRequest,
+    http_request: Request,
+    ai_service: AIService = Depends(get_ai_service)
+):
+    """
+    Run many chat requests with bounded concurrency and stream one NDJSON line
+    per item as it finishes. Resubmit with the returned batch_id to resume.
+    """
+    try:
+        batch_id, events = await ai_service.process_batch(
+            [item.dict() for item in request.requests],
+            request.batch_id,
+            request.concurrency,
+            http_request.headers.get("X-Client-ID"),
+        )
+    except BatchConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    async def lines():
+        async for event in events:
+            yield json.dumps(event) + "\n"
+    
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Batch-ID": batch_id}
+    )
+
+@app.get("/chat/batch/{batch_id}")
+async def chat_batch_results(batch_id: str, ai_service: AIService = Depends(get_ai_service)):
+    """The saved results of a batch as NDJSON: a header line, then one line per finished item"""
+    found = await asyncio.to_thread(ai_service.batch_results, batch_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"Unknown batch {batch_id}")
+    info, results = found
+    
+    def lines():
+        yield json.dumps({"type": "batch", **info}) + "\n"
+        for result in results:
+            yield json.dumps({"type": "result", **result}) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def _stream_json_page(fields: Dict[str, Any], key: str, items: List[Dict[str, Any]]):
+    """Encode {**fields, key: items} one item at a time so large pages never exist as one string"""
+    head = json.dumps(fields)[:-1]
+    yield head + (", " if fields else "") + json.dumps(key) + ": ["
+    for i, item in enumerate(items):
+        yield ("," if i else "") + json.dumps(item)
+    yield "]}"
+
+@app.post("/analysis/upload", response_model=ChatResponse)
+async def upload_inventory(
+    http_request: Request,
+    file: UploadFile = File(...),
+    question: Optional[str] = Form(None),
+    chat_id: Optional[str] = Form(None),
+    ai_service: AIService = Depends(get_ai_service),
+    db_service: DatabaseService = Depends(get_database_service)
+):
+    """Upload an inventory table (CSV) for the analysis agent to analyze"""
+    chat_id = chat_id or str(uuid.uuid4())
+    try:
+        data = await file.read()
+        response = await ai_service.analyze_inventory(data, file.filename or "", chat_id, question, _client_id(http_request))
+    except SchedulerOverloaded as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        # Unreadable tables and missing columns (InventoryDataError) are client errors
+        raise HTTPException(status_code=400, detail=f"Could not analyze {file.filename}: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error analyzing inventory upload: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    await db_service.store_messages(chat_id, [
+        {"content": f"Uploaded {file.filename}" + (f": {question}" if question else ""), "role": "user"},
+        response,
+    ])
+    return ChatResponse(message=Message(**response), chat_id=chat_id)
+
 @app.get("/history")
-async def get_history(chat_id: Optional[str] = None, db_service: DatabaseService = Depends(get_database_service)):
+async def get_history(
+    chat_id: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=1000),
+    cursor: Optional[int] = None,
+    db_service: DatabaseService = Depends(get_database_service)
+):
+    """
+    Without chat_id, page through chats (newest first) with a last-message preview.
+    With chat_id, page through that chat's messages (oldest first).
+    Pass the returned next_cursor as `cursor` to fetch the following page.
+    """
     try:
-        history = await db_service.get_chat_history(chat_id)
-        return {"history": history}
+        if chat_id:
+            messages, next_cursor = await db_service.get_messages_page(chat_id, limit, cursor)
+            body = _stream_json_page({"chat_id": chat_id, "next_cursor": next_cursor}, "messages", messages)
+        else:
+            chats, next_cursor = await db_service.list_chats(limit, cursor)
+            body = _stream_json_page({"next_cursor": next_cursor}, "chats", chats)
+        return StreamingResponse(body, media_type="application/json")
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error retrieving chat history: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/faq")
-async def get_faq(db_service: DatabaseService = Depends(get_database_service)):
+async def get_faq(
+    q: Optional[str] = None,
+    k: int = Query(3, ge=1, le=20),
+    ai_service: AIService = Depends(get_ai_service),
+    db_service: DatabaseService = Depends(get_database_service)
+):
+    """All FAQs, or with `q` the k entries most similar to that question"""
     try:
+        if q:
+            return {"faqs": await ai_service.search_faqs(q, k)}
         faqs = await db_service.get_faqs()
         return {"faqs": faqs}
     except Exception as e:
@@ -106,6 +338,12 @@ async def test_llm(request: TestLLMRequest, llm_service: LLMService = Depends(ge
             "response": response,
             "status": "success"
         }
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"LLM temporarily unavailable: {str(e)}",
+            headers={"Retry-After": str(max(1, round(e.retry_after or 1)))}
+        )
     except Exception as e:
         logger.error(f"Error testing LLM: {str(e)}")
         raise HTTPException(
@@ -113,6 +351,46 @@ async def test_llm(request: TestLLMRequest, llm_service: LLMService = Depends(ge
             detail=f"Error connecting to LLM: {str(e)}"
         )
 
+@app.get("/cache-stats")
+async def cache_stats(llm_service: LLMService = Depends(get_llm_service)):
+    """Hit/miss counters for the LLM completion cache and in-flight request coalescing"""
+    stats = {"enabled": llm_service.cache is not None, "coalescing": llm_service.single_flight.stats()}
+    if llm_service.cache is not None:
+        stats.update(llm_service.cache.stats())
+    return stats
+
+@app.post("/documents/reindex")
+async def reindex_documents(ai_service: AIService = Depends(get_ai_service)):
+    """Re-index the RAG corpus; only new and changed files are re-read"""
+    try:
+        return await ai_service.reindex_documents()
+    except Exception as e:
+        logger.error(f"Error re-indexing documents: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/scheduler-stats")
+async def scheduler_stats(ai_service: AIService = Depends(get_ai_service)):
+    """Active and queued agent requests, shed count and queue-wait percentiles"""
+    return ai_service.scheduler.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Latency histograms, token and cache counters in the Prometheus text format"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces")
+async def traces(
+    limit: int = Query(20, ge=1, le=200),
+    min_ms: float = Query(0.0, ge=0),
+):
+    """Recent request traces from the in-memory span buffer, slowest first"""
+    return {"traces": get_tracer().recent_traces(limit, min_ms)}
+
+@app.get("/resilience-stats")
+async def resilience_stats(llm_service: LLMService = Depends(get_llm_service)):
+    """Retry count and circuit breaker state per model"""
+    return llm_service.resilience.stats()
+
 # Run the application
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
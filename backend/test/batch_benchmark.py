@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Batch Chat Benchmark
+
+Starts the local OpenAI-compatible mock server and the backend, then runs the
+same set of chat requests three ways:
+- one /chat request at a time, as the nightly jobs do today
+- /chat from --concurrency parallel clients
+- one POST /chat/batch call with the same concurrency
+
+and reports items per second against the ceiling the mock model allows:
+every item waits for its model round trips (the FAQ-match embedding and the
+completion) one after another, so at most concurrency / (round trips x
+latency) items finish per second. Round trips per item are measured in the
+sequential mode; in the parallel modes concurrent embeddings are coalesced,
+so fewer calls reach the model but each item still waits for both. The gap to that ceiling is the overhead
+each approach adds on top of the upstream model.
+
+Usage:
+    python batch_benchmark.py [--items 400] [--concurrency 16] [--latency 0.2] [--tokens 50]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+import httpx
+
+from load_benchmark import BACKEND, QUESTIONS, free_port, wait_for
+
+
+def chat_request(i: int):
+    question = f"{QUESTIONS[i % len(QUESTIONS)]} (item {i})"
+    return {"messages": [{"role": "user", "content": question}], "agent_type": "chatbot"}
+
+
+async def chat_one_by_one(client: httpx.AsyncClient, items: range, concurrency: int) -> int:
+    """Send each item as its own /chat request from `concurrency` clients; return the failures"""
+    failed = 0
+    next_item = iter(items)
+
+    async def worker():
+        nonlocal failed
+        for i in next_item:
+            response = await client.post("/chat", json=chat_request(i))
+            failed += response.status_code >= 400 or bool(response.json().get("metadata", {}).get("error"))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return failed
+
+
+async def chat_batch(client: httpx.AsyncClient, items: range, concurrency: int) -> int:
+    """Send all items in one /chat/batch call; return the failures"""
+    body = {"requests": [chat_request(i) for i in items], "concurrency": concurrency}
+    async with client.stream("POST", "/chat/batch", json=body) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line:
+                event = json.loads(line)
+                if event["type"] == "done":
+                    return event["failed"]
+    raise RuntimeError("batch stream ended without a done event")
+
+
+async def model_calls(mock_port: int) -> int:
+    async with httpx.AsyncClient() as client:
+        return (await client.get(f"http://127.0.0.1:{mock_port}/stats")).json()["requests"]
+
+
+async def run(args) -> int:
+    mock_port, backend_port = free_port(), free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        mock = subprocess.Popen([
+            sys.executable, str(Path(__file__).parent / "mock_openai_server.py"), "--port", str(mock_port),
+            "--latency", str(args.latency), "--tokens", str(args.tokens),
+        ])
+        env = {
+            **os.environ,
+            "OPENAI_API_KEY": "sk-benchmark",
+            "OPENAI_API_BASE": f"http://127.0.0.1:{mock_port}/v1",
+            "LLM_HTTP_HTTP2": "false",
+            "LLM_CACHE_ENABLED": "false",
+            "EMBEDDING_STORE_PATH": os.path.join(tmp, "embeddings.f32"),
+            "DOCUMENT_INDEX_PATH": os.path.join(tmp, "documents.db"),
+            "DATABASE_PATH": os.path.join(tmp, "chat_history.db"),
+            "BATCH_STORE_PATH": os.path.join(tmp, "batches.db"),
+            "BATCH_MAX_CONCURRENCY": str(args.concurrency),
+            "SCHEDULER_MAX_CONCURRENT": str(args.concurrency),
+            "PYTHONWARNINGS": "ignore",
+        }
+        log = open(os.path.join(tmp, "backend.log"), "w", encoding="utf-8")
+        backend = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(backend_port),
+             "--log-level", "warning"],
+            cwd=BACKEND, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        try:
+            await wait_for(f"http://127.0.0.1:{mock_port}/stats", mock, "mock server")
+            await wait_for(f"http://127.0.0.1:{backend_port}/", backend, "backend")
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{backend_port}", limits=limits, timeout=600) as client:
+                await chat_one_by_one(client, range(10**6, 10**6 + 3), 1)
+
+                print(f"{args.items} items, mock model {args.latency * 1000:.0f}ms + {args.tokens} tokens, "
+                      f"concurrency {args.concurrency}")
+                print(f"{'mode':<24} {'seconds':>8} {'items/s':>8} {'calls/item':>11} {'ceiling':>8} {'of ceiling':>11} {'failed':>7}")
+                # Every mode gets its own items so none of them is answered from memory
+                modes = [
+                    ("/chat sequential", chat_one_by_one, 1),
+                    (f"/chat x{args.concurrency} clients", chat_one_by_one, args.concurrency),
+                    (f"/chat/batch x{args.concurrency}", chat_batch, args.concurrency),
+                ]
+                round_trips = None
+                for n, (name, send, concurrency) in enumerate(modes):
+                    items = range(n * args.items, (n + 1) * args.items)
+                    calls_before = await model_calls(mock_port)
+                    started = time.perf_counter()
+                    failed = await send(client, items, concurrency)
+                    seconds = time.perf_counter() - started
+                    calls = await model_calls(mock_port) - calls_before
+                    round_trips = round_trips or calls / args.items
+                    ceiling = concurrency / (args.latency * round_trips)
+                    print(f"{name:<24} {seconds:>8.2f} {args.items / seconds:>8.1f} {calls / args.items:>11.2f} "
+                          f"{ceiling:>8.1f} {args.items / seconds / ceiling:>10.0%} {failed:>7}")
+        finally:
+            for process in (backend, mock):
+                process.terminate()
+                process.wait()
+            log.close()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare /chat one at a time, in parallel and as a batch")
+    parser.add_argument("--items", type=int, default=400, help="Chat requests per mode")
+    parser.add_argument("--concurrency", type=int, default=16, help="Parallel clients, and batch concurrency")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock model latency in seconds")
+    parser.add_argument("--tokens", type=int, default=50, help="Tokens per mock completion")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Batch Chat Test
+
+Runs AIService.process_batch and POST /chat/batch against a stand-in model
+and checks that:
+- no more than the requested number of items are in flight at once
+- results stream back as items finish, not in submission order
+- failed items are reported and not saved
+- resubmitting a batch replays saved results and only runs the rest
+- reusing a batch_id for different requests is refused
+- the HTTP endpoint streams NDJSON and stores each exchange in its chat
+
+Usage:
+    python batch_test.py
+"""
+
+import os
+import sys
+import re
+import json
+import asyncio
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ["BATCH_STORE_PATH"] = os.path.join(tempfile.mkdtemp(), "batches.db")
+os.environ["BATCH_MAX_CONCURRENCY"] = "4"
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ["FAQ_MATCH_ENABLED"] = "false"
+os.environ["TRACING_ENABLED"] = "false"
+os.environ["DATABASE_BACKEND"] = "memory"
+
+import httpx
+from langchain.schema.messages import AIMessage
+
+from main import app
+from app.services.ai_service import get_ai_service
+from app.services.batch import BatchConflictError
+from app.services.database import get_database_service
+from app.services.llm_service import get_llm_service
+from app.services.resilience import LLMInvalidRequestError
+
+
+class StandInLLM:
+    """
+    Answers after a delay taken from the prompt ("item <n> wait <ms>"), counting
+    calls and the most calls in flight at once; prompts containing "reject" fail
+    """
+    def __init__(self):
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+
+    async def ainvoke(self, messages, **kwargs) -> AIMessage:
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            match = re.search(r"item (\d+) wait (\d+)( reject)?", messages[-1].content)
+            await asyncio.sleep(int(match.group(2)) / 1000)
+            if match.group(3):
+                raise LLMInvalidRequestError("rejected by stand-in")
+            return AIMessage(content=f"answer to item {match.group(1)}")
+        finally:
+            self.active -= 1
+
+
+def item(n: int, wait_ms: int = 10, extra: str = ""):
+    return {"messages": [{"role": "user", "content": f"item {n} wait {wait_ms} {extra}".strip()}], "agent_type": "chatbot", "chat_id": None}
+
+
+async def collect(events, stop_after_results=None):
+    collected = []
+    async for event in events:
+        collected.append(event)
+        if stop_after_results is not None and sum(e["type"] == "result" for e in collected) >= stop_after_results:
+            await events.aclose()
+            break
+    return collected
+
+
+def fresh_llm() -> StandInLLM:
+    llm = StandInLLM()
+    get_llm_service().llm = llm
+    return llm
+
+
+async def test_concurrency_is_bounded():
+    llm = fresh_llm()
+    _, events = await get_ai_service().process_batch([item(i) for i in range(20)], concurrency=3)
+    collected = await collect(events)
+    assert llm.peak == 3, llm.peak
+    assert collected[-1] == {"type": "done", "batch_id": collected[0]["batch_id"], "completed": 20, "failed": 0, "resumed": 0}
+
+
+async def test_concurrency_is_capped_by_server():
+    llm = fresh_llm()
+    _, events = await get_ai_service().process_batch([item(i) for i in range(20)], concurrency=100)
+    await collect(events)
+    assert llm.peak == 4, llm.peak
+
+
+async def test_results_stream_as_items_finish():
+    fresh_llm()
+    # The first item is the slowest, so it must come back last
+    requests = [item(0, wait_ms=200)] + [item(i, wait_ms=10) for i in range(1, 4)]
+    _, events = await get_ai_service().process_batch(requests, concurrency=4)
+    results = [e for e in await collect(events) if e["type"] == "result"]
+    assert results[-1]["index"] == 0 and sorted(r["index"] for r in results) == [0, 1, 2, 3]
+    assert all(r["message"]["content"] == f"answer to item {r['index']}" for r in results)
+
+
+async def test_failed_items_are_reported():
+    fresh_llm()
+    _, events = await get_ai_service().process_batch([item(0), item(1, extra="reject"), item(2)])
+    collected = await collect(events)
+    errors = [e for e in collected if e["type"] == "error"]
+    assert [e["index"] for e in errors] == [1]
+    assert errors[0]["message"]["metadata"]["error_type"] == "invalid_request_error"
+    assert collected[-1]["completed"] == 2 and collected[-1]["failed"] == 1
+
+
+async def test_resume_runs_only_unfinished_items():
+    llm = fresh_llm()
+    requests = [item(i, wait_ms=20) for i in range(12)]
+    batch_id, events = await get_ai_service().process_batch(requests, concurrency=2)
+    first = await collect(events, stop_after_results=5)
+    done_first = {e["index"] for e in first if e["type"] == "result"}
+    await asyncio.sleep(0.05)
+    calls_before = llm.calls
+
+    _, events = await get_ai_service().process_batch(requests, batch_id=batch_id, concurrency=2)
+    second = await collect(events)
+    resumed = [e for e in second if e.get("resumed") is True]
+    assert second[0]["resumed"] == len(resumed) >= len(done_first), (second[0], done_first)
+    assert {e["index"] for e in second if e["type"] == "result"} == set(range(12))
+    # Items saved before the interruption were not sent to the model again
+    assert llm.calls - calls_before == 12 - len(resumed)
+    assert second[-1]["completed"] == 12
+
+
+async def test_batch_id_reuse_with_other_requests_is_refused():
+    fresh_llm()
+    batch_id, events = await get_ai_service().process_batch([item(0)])
+    await collect(events)
+    try:
+        await get_ai_service().process_batch([item(1)], batch_id=batch_id)
+        raise AssertionError("conflicting batch accepted")
+    except BatchConflictError:
+        pass
+
+
+async def test_http_endpoint_streams_ndjson():
+    fresh_llm()
+    body = {"requests": [item(i) for i in range(5)], "concurrency": 2}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test", timeout=30) as client:
+        async with client.stream("POST", "/chat/batch", json=body) as response:
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("application/x-ndjson")
+            lines = [json.loads(line) async for line in response.aiter_lines() if line]
+        batch_id = response.headers["x-batch-id"]
+        assert lines[0]["type"] == "batch" and lines[0]["batch_id"] == batch_id
+        assert sum(line["type"] == "result" for line in lines) == 5 and lines[-1]["type"] == "done"
+
+        # Each exchange was stored in its own chat
+        chat_id = next(line["chat_id"] for line in lines if line["type"] == "result")
+        conversation = await get_database_service().get_conversation(chat_id)
+        assert [m["role"] for m in conversation] == ["user", "assistant"]
+
+        saved = (await client.get(f"/chat/batch/{batch_id}")).text.splitlines()
+        assert json.loads(saved[0])["completed"] == 5 and len(saved) == 6
+        assert (await client.get("/chat/batch/unknown")).status_code == 404
+        conflict = await client.post("/chat/batch", json={"requests": [item(9)], "batch_id": batch_id})
+        assert conflict.status_code == 409
+        assert (await client.post("/chat/batch", json={"requests": []})).status_code == 400
+
+
+TESTS = [
+    test_concurrency_is_bounded,
+    test_concurrency_is_capped_by_server,
+    test_results_stream_as_items_finish,
+    test_failed_items_are_reported,
+    test_resume_runs_only_unfinished_items,
+    test_batch_id_reuse_with_other_requests_is_refused,
+    test_http_endpoint_streams_ndjson,
+]
+
+
+async def run() -> int:
+    failed = 0
+    for test in TESTS:
+        try:
+            await test()
+            print(f"PASS {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"FAIL {test.__name__}: {type(e).__name__}: {e}")
+    print(f"{len(TESTS) - failed}/{len(TESTS)} passed")
+    return failed
+
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(description="Check the batch chat API").parse_args()
+    logging.disable(logging.CRITICAL)
+    sys.exit(1 if asyncio.run(run()) else 0)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Request Coalescing Test
+
+Fires bursts of identical concurrent requests at LLMService (and at the
+/test-llm endpoint) with a counting stand-in model behind it, and checks that
+each burst makes exactly one upstream call while every caller still gets the
+full answer. Covers plain calls, streamed fan-out, late joiners, errors,
+cancelled callers and callers arriving just after a stream was abandoned. The response cache is disabled so only coalescing can
+dedupe.
+
+Usage:
+    python coalescing_test.py [--requests 100]
+"""
+
+import os
+import sys
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+
+import httpx
+from langchain.schema.messages import AIMessage, AIMessageChunk
+
+import main
+from app.services.llm_service import LLMService, get_llm_service
+from app.services.resilience import ResilientCaller, LLMConnectionError
+from app.services.single_flight import SingleFlight
+
+WORDS = ["Pay ", "yourself ", "first."]
+
+
+class CountingLLM:
+    """Stand-in for ChatOpenAI that counts upstream calls and answers slowly"""
+    def __init__(self, delay: float = 0.05, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    async def ainvoke(self, messages, **kwargs) -> AIMessage:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise httpx.ConnectError("upstream down")
+        return AIMessage(content="".join(WORDS))
+
+    async def astream(self, messages):
+        self.calls += 1
+        for word in WORDS:
+            await asyncio.sleep(self.delay / len(WORDS))
+            yield AIMessageChunk(content=word)
+
+
+def service(llm: CountingLLM) -> LLMService:
+    llm_service = LLMService()
+    llm_service.llm = llm
+    llm_service.resilience = ResilientCaller(max_attempts=1)
+    return llm_service
+
+
+async def collect(stream) -> str:
+    return "".join([chunk async for chunk in stream])
+
+
+async def test_identical_calls_share_one_upstream_call(n: int):
+    llm = CountingLLM()
+    llm_service = service(llm)
+    results = await asyncio.gather(*(llm_service.generate_response("How do I budget?") for _ in range(n)))
+    assert llm.calls == 1, f"{llm.calls} upstream calls"
+    assert set(results) == {"".join(WORDS)}
+    assert llm_service.single_flight.stats()["coalesced"] == n - 1
+
+
+async def test_distinct_prompts_are_not_coalesced(n: int):
+    llm = CountingLLM()
+    llm_service = service(llm)
+    await asyncio.gather(*(llm_service.generate_response(f"Question {i}") for i in range(n)))
+    assert llm.calls == n, f"{llm.calls} upstream calls"
+
+
+async def test_sequential_calls_are_not_coalesced(n: int):
+    llm = CountingLLM(delay=0)
+    llm_service = service(llm)
+    for _ in range(3):
+        await llm_service.generate_response("How do I budget?")
+    assert llm.calls == 3
+
+
+async def test_streams_fan_out(n: int):
+    llm = CountingLLM()
+    llm_service = service(llm)
+    results = await asyncio.gather(*(collect(llm_service.stream_response("How do I budget?")) for _ in range(n)))
+    assert llm.calls == 1, f"{llm.calls} upstream calls"
+    assert set(results) == {"".join(WORDS)}
+
+
+async def test_late_stream_joiner_replays_earlier_chunks(n: int):
+    llm = CountingLLM(delay=0.15)
+    llm_service = service(llm)
+    first = asyncio.ensure_future(collect(llm_service.stream_response("How do I budget?")))
+    await asyncio.sleep(0.07)  # the upstream has produced some chunks by now
+    late = await collect(llm_service.stream_response("How do I budget?"))
+    assert late == await first == "".join(WORDS)
+    assert llm.calls == 1
+
+
+async def test_errors_reach_every_caller(n: int):
+    llm = CountingLLM(fail=True)
+    llm_service = service(llm)
+    results = await asyncio.gather(
+        *(llm_service.generate_response("How do I budget?") for _ in range(n)), return_exceptions=True
+    )
+    assert llm.calls == 1
+    assert all(isinstance(r, LLMConnectionError) for r in results)
+
+
+async def test_cancelled_caller_does_not_cancel_others(n: int):
+    llm = CountingLLM()
+    llm_service = service(llm)
+    tasks = [asyncio.ensure_future(llm_service.generate_response("How do I budget?")) for _ in range(n)]
+    await asyncio.sleep(0.01)
+    tasks[0].cancel()
+    results = await asyncio.gather(*tasks[1:])
+    assert set(results) == {"".join(WORDS)} and llm.calls == 1
+
+
+async def test_caller_after_abandoned_stream_starts_afresh(n: int):
+    llm = CountingLLM()
+    single_flight = SingleFlight()
+
+    def upstream():
+        return (chunk.content async for chunk in llm.astream([]))
+
+    abandoned = single_flight.stream("key", upstream)
+    await abandoned.__anext__()
+    await abandoned.aclose()
+    # The upstream is still being cancelled; the next caller must not join it
+    assert not single_flight.in_flight("key")
+    assert await collect(single_flight.stream("key", upstream)) == "".join(WORDS)
+    assert llm.calls == 2
+
+
+async def test_test_llm_endpoint(n: int):
+    llm = CountingLLM()
+    llm_service = service(llm)
+    main.app.dependency_overrides[get_llm_service] = lambda: llm_service
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = await asyncio.gather(
+                *(client.post("/test-llm", json={"prompt": "Health check"}) for _ in range(n))
+            )
+    finally:
+        main.app.dependency_overrides.clear()
+    assert all(r.status_code == 200 for r in responses)
+    assert llm.calls == 1, f"{llm.calls} upstream calls for {n} requests"
+
+
+TESTS = [
+    test_identical_calls_share_one_upstream_call,
+    test_distinct_prompts_are_not_coalesced,
+    test_sequential_calls_are_not_coalesced,
+    test_streams_fan_out,
+    test_late_stream_joiner_replays_earlier_chunks,
+    test_errors_reach_every_caller,
+    test_cancelled_caller_does_not_cancel_others,
+    test_caller_after_abandoned_stream_starts_afresh,
+    test_test_llm_endpoint,
+]
+
+
+async def run(n: int) -> int:
+    failed = 0
+    for test in TESTS:
+        try:
+            await test(n)
+            print(f"PASS {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"FAIL {test.__name__}: {type(e).__name__}: {e}")
+    print(f"{len(TESTS) - failed}/{len(TESTS)} passed")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that identical concurrent LLM requests share one upstream call")
+    parser.add_argument("--requests", type=int, default=100, help="Concurrent identical requests per burst")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    sys.exit(1 if asyncio.run(run(args.requests)) else 0)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Context Window Test
+
+Checks ContextWindowManager.fit:
+- a transcript within budget is kept whole
+- "trim" keeps the newest turns that fit next to the reserved tokens
+- "summarize" keeps the summary and the kept turns together within the
+  budget, folding more turns into the summary when it does not fit
+- the rolling summary only sends newly dropped turns to the model
+
+Usage:
+    python context_window_test.py
+"""
+
+import os
+import sys
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from app.services.context_window import ContextWindowManager
+from app.services.llm_service import Completion
+from app.services.summarizer import IncrementalSummarizer
+from app.services.tokens import MESSAGE_OVERHEAD_TOKENS
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def transcript(turns: int, words: int = 20, first: int = 0):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"message{i} " + "word " * (words - 1)}
+        for i in range(first, first + turns)
+    ]
+
+
+def window_tokens(kept, summary) -> int:
+    tokens = sum(count_words(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in kept)
+    return tokens + (count_words(summary) + MESSAGE_OVERHEAD_TOKENS if summary else 0)
+
+
+class StandInModel:
+    """Writes a summary of `words` words and records the messages it was asked to fold in"""
+    def __init__(self, words: int):
+        self.words = words
+        self.prompts = []
+
+    async def __call__(self, messages) -> Completion:
+        self.prompts.append(messages[-1]["content"])
+        return Completion(" ".join(["summary"] * self.words))
+
+
+def manager(strategy: str, model=None, budget: int = 200) -> ContextWindowManager:
+    summarizer = IncrementalSummarizer(model, count_words) if model else None
+    return ContextWindowManager(count_words, {"chatbot": budget}, strategy=strategy, summarizer=summarizer)
+
+
+async def test_short_transcript_is_kept():
+    history = transcript(4)
+    kept, summary, metrics = await manager("summarize", StandInModel(10)).fit("chatbot", history, reserved_tokens=50)
+    assert kept == history and summary is None and metrics["messages_trimmed"] == 0
+
+
+async def test_trim_keeps_newest_turns_within_budget():
+    history = transcript(20)
+    kept, summary, metrics = await manager("trim").fit("chatbot", history, reserved_tokens=50)
+    # 24 tokens per message, 150 available
+    assert kept == history[-6:] and summary is None
+    assert metrics["history_tokens_after"] == window_tokens(kept, None) <= 150
+    assert metrics["messages_trimmed"] == 14
+
+
+async def test_summary_counts_against_the_budget():
+    history = transcript(20)
+    model = StandInModel(words=40)
+    kept, summary, metrics = await manager("summarize", model).fit("chatbot", history, reserved_tokens=50, chat_id="chat")
+    assert summary is not None
+    # Without the summary six turns fit; with its 44 tokens only four do
+    assert kept == history[-4:], len(kept)
+    assert metrics["history_tokens_after"] == window_tokens(kept, summary) <= 150
+    # The second call only folded in the two turns dropped to make room
+    assert len(model.prompts) == 2 and "message14 " in model.prompts[-1] and "message13 " not in model.prompts[-1]
+
+
+async def test_summary_is_extended_incrementally():
+    model = StandInModel(words=10)
+    window = manager("summarize", model)
+    history = transcript(20)
+    await window.fit("chatbot", history, reserved_tokens=50, chat_id="chat")
+    calls = len(model.prompts)
+    kept, summary, _ = await window.fit("chatbot", history + transcript(2, first=20), reserved_tokens=50, chat_id="chat")
+    assert window_tokens(kept, summary) <= 150
+    # Messages summarized by the first request are not sent again
+    assert len(model.prompts) > calls
+    assert all("message0 " not in prompt and "message14 " not in prompt for prompt in model.prompts[calls:])
+
+
+TESTS = [
+    test_short_transcript_is_kept,
+    test_trim_keeps_newest_turns_within_budget,
+    test_summary_counts_against_the_budget,
+    test_summary_is_extended_incrementally,
+]
+
+
+async def run() -> int:
+    failed = 0
+    for test in TESTS:
+        try:
+            await test()
+            print(f"PASS {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"FAIL {test.__name__}: {type(e).__name__}: {e}")
+    print(f"{len(TESTS) - failed}/{len(TESTS)} passed")
+    return failed
+
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(description="Check the token-budgeted context window").parse_args()
+    logging.disable(logging.CRITICAL)
+    sys.exit(1 if asyncio.run(run()) else 0)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Embedding Throughput Benchmark
+
+Embeds a corpus with EmbeddingService in front of the FakeEmbedder, which
+simulates a fixed round trip per API request plus a small per-text cost and
+serves a limited number of requests at once, like a rate-limited provider.
+Reports texts embedded per second for one text per request (no batching),
+for batched requests at several batch sizes, and for a restarted service
+that finds every vector in the memory-mapped store.
+
+Usage:
+    python embedding_benchmark.py [--texts 5000] [--concurrency 64] [--request-latency 0.05] [--upstream-concurrency 8]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from app.services.embeddings import EmbeddingService, EmbeddingStore
+from fake_embedder import FakeEmbedder
+
+
+async def drive(service: EmbeddingService, corpus, concurrency: int) -> float:
+    """Embed the corpus one text per call from `concurrency` workers and return texts/second"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(text):
+        async with semaphore:
+            await service.embed([text])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(text) for text in corpus))
+    return len(corpus) / (time.perf_counter() - started)
+
+
+async def run(n: int, concurrency: int, request_latency: float, text_latency: float, upstream: int, batch_sizes):
+    corpus = [f"Policy paragraph {i}: emergency funds, budgeting and retirement savings rules" for i in range(n)]
+    print(f"{'setup':<28} {'texts/sec':>10} {'requests':>9}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for batch_size in [1] + list(batch_sizes):
+            embedder = FakeEmbedder(request_latency=request_latency, text_latency=text_latency, max_concurrency=upstream)
+            service = EmbeddingService(embedder, batch_size=batch_size)
+            rate = await drive(service, corpus, concurrency)
+            label = "no batching" if batch_size == 1 else f"batched ({batch_size}/request)"
+            print(f"{label:<28} {rate:>10.0f} {embedder.requests:>9}")
+
+        path = os.path.join(tmp, "bench.f32")
+        embedder = FakeEmbedder(request_latency=request_latency, text_latency=text_latency, max_concurrency=upstream)
+        await drive(EmbeddingService(embedder, EmbeddingStore(path, embedder.model)), corpus, concurrency)
+        embedder = FakeEmbedder(request_latency=request_latency, text_latency=text_latency, max_concurrency=upstream)
+        started = time.perf_counter()
+        store = EmbeddingStore(path, embedder.model)
+        load_ms = (time.perf_counter() - started) * 1000
+        rate = await drive(EmbeddingService(embedder, store), corpus, concurrency)
+        print(f"{'restart, all stored':<28} {rate:>10.0f} {embedder.requests:>9}")
+        print(f"store load: {load_ms:.1f}ms for {len(store):,} vectors ({os.path.getsize(path) / 1e6:.1f} MB mapped)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark embedding throughput with and without batching")
+    parser.add_argument("--texts", type=int, default=5000, help="Distinct texts to embed")
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent callers")
+    parser.add_argument("--request-latency", type=float, default=0.05, help="Simulated seconds per API request")
+    parser.add_argument("--text-latency", type=float, default=0.0002, help="Simulated extra seconds per text")
+    parser.add_argument("--upstream-concurrency", type=int, default=8, help="Requests the fake provider serves at once")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[32, 256], help="Batch sizes to test")
+    args = parser.parse_args()
+    asyncio.run(run(args.texts, args.concurrency, args.request_latency, args.text_latency, args.upstream_concurrency, args.batch_sizes))
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Embedding Service Test
+
+Checks EmbeddingService against the deterministic FakeEmbedder: concurrent
+callers share batched requests, duplicate texts are embedded once, stored
+vectors survive a restart (and come back as memory-mapped views), torn
+writes are repaired on load, and FAQ entries re-embed only what changed.
+
+Usage:
+    python embedding_test.py
+"""
+
+import os
+import sys
+import asyncio
+import logging
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import numpy as np
+
+from app.services.embeddings import EmbeddingService, EmbeddingStore
+from app.services.faq_index import FAQIndex
+from fake_embedder import FakeEmbedder
+
+
+def texts(n: int, prefix: str = "text"):
+    return [f"{prefix} number {i}" for i in range(n)]
+
+
+async def test_vectors_match_embedder(tmp: str):
+    embedder = FakeEmbedder()
+    service = EmbeddingService(embedder)
+    vectors = await service.embed(["alpha beta", "gamma"])
+    assert np.allclose(vectors, np.stack([embedder.vector("alpha beta"), embedder.vector("gamma")]))
+
+
+async def test_concurrent_callers_share_batches(tmp: str):
+    embedder = FakeEmbedder()
+    service = EmbeddingService(embedder, batch_size=64, batch_wait=0.01)
+    await asyncio.gather(*(service.embed([text]) for text in texts(200)))
+    assert embedder.texts == 200
+    assert embedder.requests == 4, f"{embedder.requests} requests"
+
+
+async def test_duplicates_embedded_once(tmp: str):
+    embedder = FakeEmbedder()
+    service = EmbeddingService(embedder)
+    batch = texts(10) * 5
+    results = await asyncio.gather(service.embed(batch), service.embed(batch))
+    assert embedder.texts == 10
+    assert np.allclose(results[0], results[1]) and results[0].shape == (50, embedder.dim)
+
+
+async def test_store_survives_restart(tmp: str):
+    path = os.path.join(tmp, "restart.f32")
+    embedder = FakeEmbedder()
+    first = await EmbeddingService(embedder, EmbeddingStore(path, embedder.model)).embed(texts(100))
+
+    embedder = FakeEmbedder()
+    store = EmbeddingStore(path, embedder.model)
+    # Zero-copy: stored rows are views into the mapped file
+    assert isinstance(store.get(next(iter(store.offsets))), np.memmap)
+    service = EmbeddingService(embedder, store)
+    again = await service.embed(texts(100) + texts(10, "fresh"))
+    assert embedder.texts == 10, f"{embedder.texts} texts re-embedded"
+    assert np.array_equal(again[:100], first)
+    assert len(EmbeddingStore(path, embedder.model)) == 110
+
+
+async def test_query_embeddings_not_persisted(tmp: str):
+    path = os.path.join(tmp, "query.f32")
+    embedder = FakeEmbedder()
+    service = EmbeddingService(embedder, EmbeddingStore(path, embedder.model))
+    await service.embed(["one off question"], persist=False)
+    assert len(service.store) == 0
+
+
+async def test_torn_write_is_repaired(tmp: str):
+    path = os.path.join(tmp, "torn.f32")
+    embedder = FakeEmbedder(dim=8)
+    await EmbeddingService(embedder, EmbeddingStore(path, embedder.model)).embed(texts(5))
+    with open(path, "ab") as f:
+        f.write(b"\x00" * 10)  # half of an interrupted row
+    store = EmbeddingStore(path, embedder.model)
+    assert len(store) == 5 and os.path.getsize(path) == 5 * 8 * 4
+    await EmbeddingService(embedder, store).embed(texts(6))
+    assert np.allclose(EmbeddingStore(path, embedder.model).get(EmbeddingService(embedder)._key("text number 5")),
+                       embedder.vector("text number 5"))
+
+
+async def test_model_change_resets_store(tmp: str):
+    path = os.path.join(tmp, "model.f32")
+    embedder = FakeEmbedder(dim=8)
+    await EmbeddingService(embedder, EmbeddingStore(path, embedder.model)).embed(texts(3))
+    assert len(EmbeddingStore(path, "another-model")) == 0
+
+
+async def test_faq_index_reembeds_only_changes(tmp: str):
+    embedder = FakeEmbedder()
+    index = FAQIndex(EmbeddingService(embedder, EmbeddingStore(os.path.join(tmp, "faq.f32"), embedder.model)), threshold=0.9)
+    entries = [{"question": q, "answer": f"answer {i}"} for i, q in enumerate(texts(20, "faq"))]
+    await index.sync(entries)
+    await index.sync(entries + [{"question": "How do I open an account?", "answer": "Online."}])
+    assert embedder.texts == 21
+    entry, score = await index.match("how do i open an account")
+    assert entry["answer"] == "Online." and score > 0.99
+
+
+TESTS = [
+    test_vectors_match_embedder,
+    test_concurrent_callers_share_batches,
+    test_duplicates_embedded_once,
+    test_store_survives_restart,
+    test_query_embeddings_not_persisted,
+    test_torn_write_is_repaired,
+    test_model_change_resets_store,
+    test_faq_index_reembeds_only_changes,
+]
+
+
+async def run() -> int:
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for test in TESTS:
+            try:
+                await test(tmp)
+                print(f"PASS {test.__name__}")
+            except Exception as e:
+                failed += 1
+                print(f"FAIL {test.__name__}: {type(e).__name__}: {e}")
+    print(f"{len(TESTS) - failed}/{len(TESTS)} passed")
+    return failed
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    sys.exit(1 if asyncio.run(run()) else 0)
@@ -0,0 +1,55 @@
+"""
+Deterministic local stand-in for the embeddings API.
+
+Vectors are unit-length hashed bags of words, so identical texts always get
+identical vectors and texts sharing words come out similar. Each call can
+simulate a fixed per-request round trip plus a per-text cost, with a cap on
+requests in flight like a provider's connection and rate limits, and counts
+the requests and texts it served.
+"""
+
+import re
+import asyncio
+import hashlib
+from typing import List
+
+import numpy as np
+
+
+class FakeEmbedder:
+    """
+    Args:
+        dim (int): Embedding dimensions
+        request_latency (float): Seconds per request, regardless of size
+        text_latency (float): Extra seconds per text in a request
+        max_concurrency (int): Requests served at once; 0 for no limit
+        model (str): Model name reported to EmbeddingService
+    """
+    def __init__(self, dim: int = 256, request_latency: float = 0.0, text_latency: float = 0.0,
+                 max_concurrency: int = 0, model: str = "fake-embedding"):
+        self.dim = dim
+        self.request_latency = request_latency
+        self.text_latency = text_latency
+        self.semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.model = model
+        self.requests = 0
+        self.texts = 0
+
+    def vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        self.requests += 1
+        self.texts += len(texts)
+        delay = self.request_latency + self.text_latency * len(texts)
+        if self.semaphore is not None:
+            async with self.semaphore:
+                await asyncio.sleep(delay)
+        elif delay:
+            await asyncio.sleep(delay)
+        return np.stack([self.vector(text) for text in texts])
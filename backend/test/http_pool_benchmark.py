@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+HTTP Connection Pool Load Test
+
+Starts the local mock OpenAI server in a subprocess and fires concurrent
+chat completions at it, comparing a fresh HTTP client per request (no
+connection reuse) with the shared pooled client from app.services.http_client
+at several pool sizes.
+
+Usage:
+    python http_pool_benchmark.py [--requests 500] [--concurrency 50] [--latency 0.02]
+"""
+
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+import httpx
+import openai
+
+from app.services.http_client import create_http_client
+
+MESSAGES = [{"role": "user", "content": "How should I build an emergency fund?"}]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_server(base_url: str):
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.get(base_url.replace("/v1", "/docs"))
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError("mock server did not start")
+
+
+async def drive(make_client, requests: int, concurrency: int, close_each: bool = False) -> float:
+    """Run `requests` completions with `concurrency` workers and return requests/second"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            client = make_client()
+            await client.chat.completions.create(model="gpt-4o-mini", messages=MESSAGES)
+            if close_each:
+                await client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return requests / (time.perf_counter() - started)
+
+
+async def run(requests: int, concurrency: int, latency: float, pools):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}/v1"
+    server = subprocess.Popen(
+        [sys.executable, str(Path(__file__).parent / "mock_openai_server.py"), "--port", str(port), "--latency", str(latency)]
+    )
+    try:
+        await wait_for_server(base_url)
+        print(f"{'client':<28} {'req/sec':>10}")
+
+        # Baseline: every request opens (and tears down) its own connection
+        def fresh_client():
+            return openai.AsyncOpenAI(
+                api_key="sk-benchmark", base_url=base_url,
+                http_client=httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=0)),
+            )
+        print(f"{'fresh client per request':<28} {await drive(fresh_client, requests, concurrency, close_each=True):>10.1f}")
+
+        for pool_size in pools:
+            shared = openai.AsyncOpenAI(
+                api_key="sk-benchmark", base_url=base_url,
+                http_client=create_http_client(
+                    max_connections=pool_size, max_keepalive_connections=pool_size, max_per_host=pool_size
+                ),
+            )
+            rate = await drive(lambda: shared, requests, concurrency)
+            print(f"{f'shared pool ({pool_size} conns)':<28} {rate:>10.1f}")
+            await shared.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the shared LLM HTTP client against a mock server")
+    parser.add_argument("--requests", type=int, default=500, help="Total completions per client setup")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent in-flight requests")
+    parser.add_argument("--latency", type=float, default=0.02, help="Mock server latency in seconds")
+    parser.add_argument("--pools", type=int, nargs="+", default=[5, 20, 50], help="Pool sizes to test")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency, args.latency, args.pools))
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Inventory Analysis Test
+
+Checks the vectorized InventoryAnalyzer against a straightforward per-SKU
+groupby computation of the same metrics on a small synthetic table, and
+that tables with gaps are rejected:
+- every per-SKU metric, ABC class and flag matches the reference
+- blank or missing SKUs, blank or non-numeric quantities, infinite values and
+  unparseable dates raise InventoryDataError
+- CSV uploads load; Parquet uploads, unreadable files and missing columns
+  are reported
+
+Usage:
+    python inventory_analysis_test.py
+"""
+
+import os
+import sys
+import math
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import numpy as np
+import pandas as pd
+
+from app.services.inventory_analysis import (
+    FLAG_BELOW_REORDER_POINT, FLAG_DEMAND_SPIKE, FLAG_OVERSTOCK, FLAG_STOCKOUT,
+    InventoryAnalyzer, InventoryDataError, load_inventory_table,
+)
+
+
+def fixture(skus: int = 12, days: int = 60, seed: int = 3) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    rows = []
+    for s in range(skus):
+        rate = rng.gamma(2.0, 4.0)
+        cost = round(float(rng.lognormal(1.5, 0.8)), 2)
+        for d in range(days):
+            sold = int(rng.poisson(rate))
+            if s % 4 == 0 and d == days // 2:
+                sold = int(rate * 20) + 30  # a promotion spike
+            on_hand = 0 if s % 5 == 1 and d == days - 1 else int(max(0, rng.normal(rate * 15, rate * 5)))
+            if s == 7:
+                on_hand = 5000  # overstocked
+            rows.append({
+                "sku": f"SKU-{s:03d}",
+                "date": (pd.Timestamp("2024-01-01") + pd.Timedelta(days=d)).strftime("%Y-%m-%d"),
+                "on_hand": on_hand,
+                "units_sold": 0 if s == 11 else sold,
+                "unit_cost": cost,
+                "lead_time_days": 3 + s % 5,
+            })
+    # Rows arrive out of date order
+    return pd.DataFrame(rows).sample(frac=1.0, random_state=seed).reset_index(drop=True)
+
+
+def reference(df: pd.DataFrame, analyzer: InventoryAnalyzer) -> pd.DataFrame:
+    """The same metrics computed one SKU at a time"""
+    rows = []
+    for sku, group in df.groupby("sku", sort=False):
+        sold = group["units_sold"].astype(float)
+        on_hand = group["on_hand"].astype(float)
+        days = len(group)
+        total_sold = sold.sum()
+        mean_demand = total_sold / days
+        demand_std = sold.std(ddof=0)
+        mean_on_hand = on_hand.mean()
+        stock_level = float(group.loc[pd.to_datetime(group["date"]).idxmax(), "on_hand"])
+        lead_time = group["lead_time_days"].mean()
+        spike_days = int(((sold - mean_demand) > analyzer.spike_z * demand_std).sum()) if demand_std > 0 else 0
+        rows.append({
+            "sku": sku,
+            "days_observed": days,
+            "stock_level": stock_level,
+            "avg_daily_demand": mean_demand,
+            "demand_std": demand_std,
+            "turnover": total_sold / mean_on_hand if mean_on_hand > 0 else math.inf,
+            "days_of_supply": stock_level / mean_demand if mean_demand > 0 else math.inf,
+            "consumption_value": total_sold * group["unit_cost"].mean(),
+            "reorder_point": mean_demand * lead_time + analyzer.service_z * demand_std * math.sqrt(lead_time),
+            "stockout_days": int((on_hand <= 0).sum()),
+            "spike_days": spike_days,
+        })
+
+    total = sum(row["consumption_value"] for row in rows)
+    cumulative = 0.0
+    for row in sorted(rows, key=lambda row: -row["consumption_value"]):
+        start = cumulative / total
+        row["abc_class"] = "A" if start < analyzer.abc_thresholds[0] else "B" if start < analyzer.abc_thresholds[1] else "C"
+        cumulative += row["consumption_value"]
+
+    for row in rows:
+        row["flags"] = (
+            (FLAG_STOCKOUT if row["stock_level"] <= 0 else 0)
+            | (FLAG_BELOW_REORDER_POINT if row["stock_level"] < row["reorder_point"] else 0)
+            | (FLAG_OVERSTOCK if row["days_of_supply"] > analyzer.overstock_days else 0)
+            | (FLAG_DEMAND_SPIKE if row["spike_days"] > 0 else 0)
+        )
+    return pd.DataFrame(rows)
+
+
+def expect_error(df: pd.DataFrame, fragment: str):
+    try:
+        InventoryAnalyzer().analyze(df)
+    except InventoryDataError as e:
+        assert fragment in str(e), str(e)
+        return
+    raise AssertionError(f"no InventoryDataError for {fragment}")
+
+
+async def test_matches_per_sku_reference():
+    df = fixture()
+    analyzer = InventoryAnalyzer()
+    results = analyzer.analyze(df).set_index("sku").sort_index()
+    expected = reference(df, analyzer).set_index("sku").sort_index()
+    assert list(results.index) == list(expected.index)
+    for column in ("stock_level", "avg_daily_demand", "demand_std", "turnover", "days_of_supply",
+                   "consumption_value", "reorder_point"):
+        assert np.allclose(results[column], expected[column], rtol=1e-9, atol=1e-9), column
+    for column in ("days_observed", "stockout_days", "spike_days", "abc_class", "flags"):
+        assert (results[column].to_numpy() == expected[column].to_numpy()).all(), column
+    # The fixture exercises every flag and class
+    flags = np.bitwise_or.reduce(results["flags"].to_numpy())
+    assert flags == FLAG_STOCKOUT | FLAG_BELOW_REORDER_POINT | FLAG_OVERSTOCK | FLAG_DEMAND_SPIKE, flags
+    assert set(results["abc_class"]) == {"A", "B", "C"}
+
+
+async def test_blank_and_missing_skus_are_rejected():
+    df = fixture(skus=3, days=5)
+    blank = df.copy()
+    blank.loc[4, "sku"] = "  "
+    expect_error(blank, "1 rows with a blank sku (first at data row 5)")
+    missing = df.copy()
+    missing["sku"] = missing["sku"].astype("string")
+    missing.loc[[2, 6], "sku"] = pd.NA
+    expect_error(missing, "2 rows with a blank sku (first at data row 3)")
+
+
+async def test_bad_quantities_are_rejected():
+    df = fixture(skus=3, days=5)
+    blank = df.copy()
+    blank["on_hand"] = blank["on_hand"].astype(float)
+    blank.loc[1, "on_hand"] = np.nan
+    expect_error(blank, "missing or non-numeric on_hand")
+    text = df.copy().astype({"units_sold": object})
+    text.loc[0, "units_sold"] = "twelve"
+    expect_error(text, "missing or non-numeric units_sold")
+    infinite = df.copy()
+    infinite["unit_cost"] = infinite["unit_cost"].replace(infinite.loc[3, "unit_cost"], np.inf)
+    expect_error(infinite, "unit_cost")
+    dates = df.copy()
+    dates.loc[2, "date"] = "not a date"
+    expect_error(dates, "missing or unparseable date")
+
+
+async def test_uploads():
+    df = fixture(skus=3, days=5)
+    results = InventoryAnalyzer().analyze(df).set_index("sku").sort_index()
+
+    csv = load_inventory_table(df.to_csv(index=False).encode(), "stock.csv")
+    assert np.allclose(InventoryAnalyzer().analyze(csv).set_index("sku").sort_index()["reorder_point"], results["reorder_point"])
+
+    # A blank cell in the upload is reported, not analyzed as NaN
+    gap = df.to_csv(index=False).replace(f",{df.loc[0, 'on_hand']},", ",,", 1).encode()
+    try:
+        InventoryAnalyzer().analyze(load_inventory_table(gap, "stock.csv"))
+        raise AssertionError("blank on_hand accepted")
+    except InventoryDataError as e:
+        assert "on_hand" in str(e), str(e)
+    for data, filename, fragment in (
+        (df.drop(columns=["units_sold"]).to_csv(index=False).encode(), "stock.csv", "missing required columns: units_sold"),
+        (b"PAR1", "stock.parquet", "Parquet files are not supported"),
+        (b"", "stock.csv", "Unreadable inventory table"),
+    ):
+        try:
+            load_inventory_table(data, filename)
+            raise AssertionError(f"{filename} accepted")
+        except InventoryDataError as e:
+            assert fragment in str(e), str(e)
+
+
+TESTS = [
+    test_matches_per_sku_reference,
+    test_blank_and_missing_skus_are_rejected,
+    test_bad_quantities_are_rejected,
+    test_uploads,
+]
+
+
+async def run() -> int:
+    failed = 0
+    for test in TESTS:
+        try:
+            await test()
+            print(f"PASS {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"FAIL {test.__name__}: {type(e).__name__}: {e}")
+    print(f"{len(TESTS) - failed}/{len(TESTS)} passed")
+    return failed
+
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(description="Check the inventory analysis engine against a per-SKU reference").parse_args()
+    logging.disable(logging.CRITICAL)
+    sys.exit(1 if asyncio.run(run()) else 0)
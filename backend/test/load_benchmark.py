@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Backend Load Benchmark
+
+Starts the local OpenAI-compatible mock server and the backend (uvicorn with
+--workers N, pointed at the mock through OPENAI_API_BASE) as separate processes,
+then drives /chat, /history, /faq and /test-llm in turn at each concurrency
+level. Every stage sends a fixed number of requests from closed-loop
+workers and reports throughput, p50/p95/p99 latency, failed requests and the
+backend's resident memory before and after, summed over its worker
+processes. With more than one worker the backend runs in multi-worker mode
+(SHARED_STATE_PATH set), so runs at different --workers show how throughput
+scales with cores.
+
+Each run is appended as one JSON line to the results file together with the
+git commit it ran on, and compared with the most recent earlier run that used
+the same settings: a stage whose p95 latency or throughput got worse by more
+than --threshold is flagged as a regression.
+
+Usage:
+    python load_benchmark.py [--workers 1] [--endpoints chat history faq test-llm] [--concurrency 1 8 32]
+                             [--requests 200] [--latency 0.05] [--token-rate 0] [--error-rate 0]
+                             [--results results/load_benchmark.jsonl] [--no-save] [--threshold 0.2]
+                             [--fail-on-regression]
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+BACKEND = Path(__file__).resolve().parent.parent
+DEFAULT_RESULTS = Path(__file__).resolve().parent / "results" / "load_benchmark.jsonl"
+
+QUESTIONS = [
+    "How big should my emergency fund be?",
+    "What is diversification?",
+    "Should I pay off debt or invest first?",
+    "How does compound interest work?",
+    "What is a reasonable savings rate?",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for(url: str, process: subprocess.Popen, name: str):
+    async with httpx.AsyncClient() as client:
+        for _ in range(300):
+            if process.poll() is not None:
+                raise RuntimeError(f"{name} exited with code {process.returncode}")
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{name} did not start")
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """Resident set size of a process and its children in MB, read from /proc (None where unavailable)"""
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as status:
+            rss = next(int(line.split()[1]) / 1024 for line in status if line.startswith("VmRSS:"))
+        with open(f"/proc/{pid}/task/{pid}/children", encoding="ascii") as f:
+            children = [int(child) for child in f.read().split()]
+    except (OSError, StopIteration):
+        return None
+    return rss + sum(rss_mb(child) or 0.0 for child in children)
+
+
+def git_commit():
+    """(commit hash, whether the working tree has uncommitted changes), or (None, None) outside git"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BACKEND,
+                               capture_output=True, text=True, check=True).stdout.strip() != ""
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def make_request(endpoint: str, i: int):
+    """(method, path, keyword arguments) for the i-th request to an endpoint"""
+    question = f"{QUESTIONS[i % len(QUESTIONS)]} (request {i})"
+    if endpoint == "chat":
+        return "POST", "/chat", {"json": {"messages": [{"role": "user", "content": question}], "agent_type": "chatbot"}}
+    if endpoint == "history":
+        return "GET", "/history", {"params": {"limit": 50}}
+    if endpoint == "faq":
+        return "GET", "/faq", {"params": {"q": question}}
+    if endpoint == "test-llm":
+        return "POST", "/test-llm", {"json": {"prompt": question}}
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+async def run_stage(client: httpx.AsyncClient, endpoint: str, concurrency: int, requests: int, offset: int):
+    """Send `requests` requests from `concurrency` workers; return (latencies in ms, errors, seconds)"""
+    latencies: List[float] = []
+    errors = 0
+    next_request = iter(range(offset, offset + requests))
+
+    async def worker():
+        nonlocal errors
+        for i in next_request:
+            method, path, kwargs = make_request(endpoint, i)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                await response.aread()
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return np.array(latencies), errors, time.perf_counter() - started
+
+
+def previous_run(path: Path, config: Dict) -> Optional[Dict]:
+    """The most recent stored run made with the same settings"""
+    if not path.exists():
+        return None
+    match = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record.get("config") == config:
+                    match = record
+    return match
+
+
+def compare(results: List[Dict], baseline: Dict, threshold: float) -> List[str]:
+    """Print each stage against the baseline run; return the stages that regressed"""
+    before = {(r["endpoint"], r["concurrency"]): r for r in baseline["results"]}
+    label = baseline.get("commit") or "previous run"
+    print(f"\ncompared with {label}{' (dirty)' if baseline.get('dirty') else ''} from {baseline['timestamp']}:")
+    print(f"{'endpoint':<10} {'conc':>5} {'req/s':>16} {'p95 ms':>18}")
+    regressions = []
+    for r in results:
+        old = before.get((r["endpoint"], r["concurrency"]))
+        if old is None:
+            continue
+        throughput_change = r["throughput"] / old["throughput"] - 1 if old["throughput"] else 0.0
+        p95_change = r["p95_ms"] / old["p95_ms"] - 1 if old["p95_ms"] else 0.0
+        regressed = throughput_change < -threshold or p95_change > threshold
+        if regressed:
+            regressions.append(f"{r['endpoint']}@{r['concurrency']}")
+        print(f"{r['endpoint']:<10} {r['concurrency']:>5} {r['throughput']:>8.1f} ({throughput_change:+6.1%}) "
+              f"{r['p95_ms']:>9.1f} ({p95_change:+6.1%}){'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+async def run(args) -> int:
+    mock_port, backend_port = free_port(), free_port()
+    config = {
+        "workers": args.workers, "endpoints": args.endpoints, "concurrency": args.concurrency, "requests": args.requests,
+        "latency": args.latency, "tokens": args.tokens, "token_rate": args.token_rate,
+        "error_rate": args.error_rate, "seed": args.seed,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        mock = subprocess.Popen([
+            sys.executable, str(Path(__file__).parent / "mock_openai_server.py"), "--port", str(mock_port),
+            "--latency", str(args.latency), "--tokens", str(args.tokens), "--token-rate", str(args.token_rate),
+            "--error-rate", str(args.error_rate), "--seed", str(args.seed),
+        ])
+        env = {
+            **os.environ,
+            "OPENAI_API_KEY": "sk-benchmark",
+            "OPENAI_API_BASE": f"http://127.0.0.1:{mock_port}/v1",
+            "LLM_HTTP_HTTP2": "false",
+            "EMBEDDING_STORE_PATH": os.path.join(tmp, "embeddings.f32"),
+            "DOCUMENT_INDEX_PATH": os.path.join(tmp, "documents.db"),
+            "DATABASE_PATH": os.path.join(tmp, "chat_history.db"),
+            "PYTHONWARNINGS": "ignore",
+        }
+        if args.workers > 1:
+            env["SHARED_STATE_PATH"] = os.path.join(tmp, "shared_state.db")
+        # The backend logs every request; keep that out of the report
+        log_path = os.path.join(tmp, "backend.log")
+        log = open(log_path, "w", encoding="utf-8")
+        backend = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(backend_port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=BACKEND, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        try:
+            await wait_for(f"http://127.0.0.1:{mock_port}/stats", mock, "mock server")
+            try:
+                await wait_for(f"http://127.0.0.1:{backend_port}/", backend, "backend")
+            except RuntimeError:
+                log.flush()
+                print(Path(log_path).read_text(encoding="utf-8")[-3000:], file=sys.stderr)
+                raise
+
+            limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{backend_port}", limits=limits, timeout=120) as client:
+                # Warm up each endpoint so the first stage does not pay for lazy initialization
+                for endpoint in args.endpoints:
+                    await run_stage(client, endpoint, 1, 3, 10**6)
+                rss_start = rss_mb(backend.pid)
+
+                print(f"{args.workers} worker(s), mock model {args.latency * 1000:.0f}ms + {args.tokens} tokens"
+                      f"{f' at {args.token_rate:.0f}/s' if args.token_rate else ''}, "
+                      f"error rate {args.error_rate:.0%}, {args.requests} requests per stage")
+                print(f"{'endpoint':<10} {'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                      f"{'errors':>7} {'rss MB':>8} {'growth':>7}")
+                results = []
+                offset = 0
+                for endpoint in args.endpoints:
+                    for concurrency in args.concurrency:
+                        before = rss_mb(backend.pid)
+                        latencies, errors, seconds = await run_stage(client, endpoint, concurrency, args.requests, offset)
+                        offset += args.requests
+                        after = rss_mb(backend.pid)
+                        result = {
+                            "endpoint": endpoint, "concurrency": concurrency, "requests": len(latencies),
+                            "errors": errors, "throughput": round(len(latencies) / seconds, 2),
+                            "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                            "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+                            "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+                            "rss_mb": round(after, 1) if after is not None else None,
+                            "rss_growth_mb": round(after - before, 1) if after is not None and before is not None else None,
+                        }
+                        results.append(result)
+                        rss = f"{result['rss_mb']:>8.1f} {result['rss_growth_mb']:>+7.1f}" if after is not None else f"{'n/a':>8} {'n/a':>7}"
+                        print(f"{endpoint:<10} {concurrency:>5} {result['throughput']:>8.1f} {result['p50_ms']:>8.1f} "
+                              f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {errors:>7} {rss}")
+
+            rss_end = rss_mb(backend.pid)
+            if rss_start is not None and rss_end is not None:
+                print(f"\nbackend memory: {rss_start:.1f}MB after warm-up, {rss_end:.1f}MB at the end "
+                      f"({rss_end - rss_start:+.1f}MB)")
+            async with httpx.AsyncClient() as client:
+                mock_stats = (await client.get(f"http://127.0.0.1:{mock_port}/stats")).json()
+            print(f"mock server: {mock_stats['requests']} requests, {mock_stats['errors']} injected errors")
+        finally:
+            for process in (backend, mock):
+                process.terminate()
+                process.wait()
+            log.close()
+
+    commit, dirty = git_commit()
+    record = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "dirty": dirty,
+        "config": config,
+        "rss_start_mb": round(rss_start, 1) if rss_start is not None else None,
+        "rss_end_mb": round(rss_end, 1) if rss_end is not None else None,
+        "results": results,
+    }
+
+    results_path = Path(args.results)
+    regressions = []
+    baseline = previous_run(results_path, config)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+    if not args.no_save:
+        results_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(results_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"\nresults appended to {results_path}")
+
+    if regressions:
+        print(f"regressions beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1 if args.fail_on_regression else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the backend endpoints against a local mock model")
+    parser.add_argument("--workers", type=int, default=1, help="Backend worker processes")
+    parser.add_argument("--endpoints", nargs="+", default=["chat", "history", "faq", "test-llm"],
+                        choices=["chat", "history", "faq", "test-llm"], help="Endpoints to drive, in order")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Concurrency levels per endpoint")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock model latency in seconds")
+    parser.add_argument("--tokens", type=int, default=50, help="Tokens per mock completion")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Mock completion tokens per second, 0 for no pacing")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock requests that fail")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the mock server's injected errors")
+    parser.add_argument("--results", default=str(DEFAULT_RESULTS), help="JSON lines file runs are appended to")
+    parser.add_argument("--no-save", action="store_true", help="Compare with earlier runs without storing this one")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative change in p95 or throughput flagged as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 when a stage regressed")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
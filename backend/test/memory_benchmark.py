@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Conversation Memory Benchmark
+
+Drives AIService.process_request with a stand-in model over many synthetic
+turns spread across many chat sessions. Each request carries the session's
+whole transcript, the way a stateless client resends it, and sessions are
+picked with a skewed distribution so a few of them run to hundreds of turns.
+Reports per block of turns the transcript length sent, the prompt tokens the
+model received, request latency and process RSS. With the turn window and
+token budget of the context manager the prompt, latency and RSS should stay
+flat while the transcripts keep growing.
+
+Usage:
+    python memory_benchmark.py [--turns 10000] [--sessions 1000] [--buckets 10] [--strategy trim]
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+import resource
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ["FAQ_MATCH_ENABLED"] = "false"
+os.environ["TRACING_ENABLED"] = "false"
+
+from langchain.schema.messages import AIMessage
+
+from app.services.ai_service import AIService
+from app.services.llm_service import get_llm_service
+from app.services.tokens import estimate_tokens
+
+QUESTION = "Turn {turn}: I earn 3,200 a month; how should I split my savings between an ISA and a pension?"
+ANSWER = "Here is some considered advice about your finances and how to balance the two. " * 3
+
+
+class StandInLLM:
+    """Records prompt sizes and returns a fixed-length answer without any I/O"""
+    def __init__(self):
+        self.prompt_tokens = []
+
+    async def ainvoke(self, messages, **kwargs) -> AIMessage:
+        self.prompt_tokens.append(sum(estimate_tokens(message.content) for message in messages))
+        return AIMessage(content=ANSWER)
+
+
+def transcript(turns: int):
+    """The messages a client resends after `turns` earlier turns, plus the new question"""
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": QUESTION.format(turn=turn)})
+        messages.append({"role": "assistant", "content": ANSWER})
+    messages.append({"role": "user", "content": QUESTION.format(turn=turns)})
+    return messages
+
+
+def rss_mb() -> float:
+    """Current resident set size (peak where /proc is not available)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+async def run(turns: int, sessions: int, buckets: int):
+    llm = StandInLLM()
+    get_llm_service().llm = llm
+    service = AIService()
+    rng = random.Random(42)
+    weights = [1 / (rank + 1) for rank in range(sessions)]
+    session_turns = [0] * sessions
+    sent, latencies, rss = [], [], []
+
+    for _ in range(turns):
+        session = rng.choices(range(sessions), weights)[0]
+        messages = transcript(session_turns[session])
+        session_turns[session] += 1
+        started = time.perf_counter()
+        await service.process_request(messages, "chatbot", chat_id=f"session-{session}")
+        latencies.append((time.perf_counter() - started) * 1e3)
+        sent.append(len(messages))
+        rss.append(rss_mb())
+
+    size = max(1, turns // buckets)
+    print(f"{'turns':>14} {'max msgs sent':>14} {'avg prompt tok':>15} {'max prompt tok':>15} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>8}")
+    for start in range(0, turns, size):
+        end = min(start + size, turns)
+        lat = sorted(latencies[start:end])
+        tokens = llm.prompt_tokens[start:end]
+        print(
+            f"{start:>6}-{end - 1:<7} {max(sent[start:end]):>14} {statistics.mean(tokens):>15.1f} {max(tokens):>15}"
+            f" {lat[len(lat) // 2]:>8.2f} {lat[int(len(lat) * 0.95)]:>8.2f} {rss[end - 1]:>8.1f}"
+        )
+    print(f"longest session: {max(session_turns)} turns, "
+          f"window: {service.context_window.max_turns} turns / {service.context_window.budgets['chatbot']} tokens, "
+          f"summaries kept: {len(service.summarizer._state)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark prompt size and memory as conversations grow")
+    parser.add_argument("--turns", type=int, default=10000, help="Total synthetic turns")
+    parser.add_argument("--sessions", type=int, default=1000, help="Number of distinct chat sessions")
+    parser.add_argument("--buckets", type=int, default=10, help="Number of report rows")
+    parser.add_argument("--strategy", choices=("trim", "summarize"), default="trim",
+                        help="What to do with turns that do not fit the budget")
+    args = parser.parse_args()
+    os.environ["CONTEXT_TRIM_STRATEGY"] = args.strategy
+    logging.disable(logging.CRITICAL)
+    asyncio.run(run(args.turns, args.sessions, args.buckets))
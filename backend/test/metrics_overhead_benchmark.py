@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Metrics Overhead Benchmark
+
+Measures what the /metrics instrumentation adds to one chat request:
+
+- the recordings a request makes (request latency, queue wait, LLM latency,
+  token counters and two DB writes), timestamps included
+- capturing the provider's token usage with a callback, dispatched through
+  LangChain's callback manager the way a chat model call does
+- rendering /metrics once many label combinations exist
+
+The per-request budget is 50 microseconds.
+
+Usage:
+    python metrics_overhead_benchmark.py [--requests 100000] [--calls 5000]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import warnings
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from langchain_core.callbacks.manager import AsyncCallbackManager
+from langchain_core.messages import HumanMessage
+from langchain_core.outputs import LLMResult
+
+from app.services.llm_service import new_usage_recorder
+from app.services.metrics import (
+    REGISTRY, REQUEST_LATENCY, QUEUE_WAIT, LLM_LATENCY, LLM_TOKENS, DB_WRITE_LATENCY
+)
+
+BUDGET_US = 50.0
+
+
+def record_request():
+    """The metric calls made while serving one non-streamed chat request"""
+    started = time.perf_counter()
+    QUEUE_WAIT.observe(0.0, ("chatbot",))
+    llm_started = time.perf_counter()
+    LLM_LATENCY.observe(time.perf_counter() - llm_started, ("gpt-4o-mini", "complete"))
+    LLM_TOKENS.inc(412, ("gpt-4o-mini", "prompt", "provider"))
+    LLM_TOKENS.inc(57, ("gpt-4o-mini", "completion", "provider"))
+    REQUEST_LATENCY.observe(time.perf_counter() - started, ("chatbot",))
+    for _ in range(2):
+        write_started = time.perf_counter()
+        DB_WRITE_LATENCY.observe(time.perf_counter() - write_started, ("SQLiteStorage",))
+
+
+async def callback_overhead(calls: int) -> float:
+    """Extra microseconds per completion for the usage callback"""
+    result = LLMResult(generations=[[]], llm_output={"token_usage": {"prompt_tokens": 412, "completion_tokens": 57}})
+    messages = [[HumanMessage(content="What is diversification?")]]
+
+    async def timed(with_callback: bool) -> float:
+        started = time.perf_counter()
+        for _ in range(calls):
+            manager = AsyncCallbackManager.configure(inheritable_callbacks=[new_usage_recorder()] if with_callback else None)
+            run_managers = await manager.on_chat_model_start({}, messages)
+            await run_managers[0].on_llm_end(result)
+        return (time.perf_counter() - started) / calls
+
+    await timed(True)  # warm up
+    # Interleave the runs so drift in machine load affects both sides alike
+    deltas = [await timed(True) - await timed(False) for _ in range(5)]
+    return max(0.0, statistics.median(deltas)) * 1e6
+
+
+def run(requests: int, calls: int):
+    logging.disable(logging.WARNING)
+    warnings.filterwarnings("ignore")
+
+    for _ in range(1000):
+        record_request()
+    started = time.perf_counter()
+    for _ in range(requests):
+        record_request()
+    recording_us = (time.perf_counter() - started) / requests * 1e6
+    print(f"metric recordings per request:   {recording_us:6.2f}us")
+
+    usage_us = asyncio.run(callback_overhead(calls))
+    print(f"usage callback per completion:   {usage_us:6.2f}us")
+
+    total = recording_us + usage_us
+    print(f"total per request:               {total:6.2f}us (budget {BUDGET_US:.0f}us) "
+          f"{'OK' if total < BUDGET_US else 'OVER BUDGET'}")
+
+    # A realistic scrape: every agent type, a few error types and both storage backends
+    for agent_type in ("chatbot", "summary", "analysis"):
+        REQUEST_LATENCY.observe(0.8, (agent_type,))
+        QUEUE_WAIT.observe(0.01, (agent_type,))
+    for backend in ("InMemoryStorage", "SQLiteStorage"):
+        DB_WRITE_LATENCY.observe(0.001, (backend,))
+    started = time.perf_counter()
+    body = REGISTRY.render()
+    render_ms = (time.perf_counter() - started) * 1000
+    print(f"/metrics render:                 {render_ms:6.2f}ms ({len(body.splitlines())} lines)")
+    return total < BUDGET_US
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the overhead of the metrics instrumentation")
+    parser.add_argument("--requests", type=int, default=100000, help="Simulated requests to record")
+    parser.add_argument("--calls", type=int, default=5000, help="Callback dispatches per timing run")
+    args = parser.parse_args()
+    sys.exit(0 if run(args.requests, args.calls) else 1)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-Compatible Mock Server
+
+Serves /v1/chat/completions (plain and streaming) and /v1/embeddings with a
+configurable response latency so the backend and its benchmarks can run
+without calling the real API. Responses are deterministic; embeddings are
+hashed bags of words, so texts sharing words come out similar.
+
+- `--token-rate` paces completion tokens like a real model: streamed chunks
+  arrive that many per second, and plain completions take as long in total
+- `--error-rate` answers that fraction of requests with an OpenAI-style
+  error, cycling through `--error-status` codes; the sequence of failures is
+  fixed by `--seed`, so runs are repeatable
+- prompt prefix caching is emulated like OpenAI's: once a prompt of 1024
+  tokens or more has been seen, later prompts starting with the same text
+  report the shared part, in 128-token steps, as
+  usage.prompt_tokens_details.cached_tokens (`--no-prompt-cache` turns it off)
+- GET /stats reports requests served, errors injected, and prompt and
+  cached prompt tokens
+
+Usage:
+    python mock_openai_server.py [--port 8001] [--latency 0.05] [--tokens 50] [--token-rate 0]
+                                 [--error-rate 0] [--error-status 429 500 503] [--seed 0] [--no-prompt-cache]
+
+Point the backend at it with OPENAI_API_BASE=http://127.0.0.1:8001/v1
+"""
+
+import re
+import time
+import json
+import random
+import hashlib
+import asyncio
+import argparse
+from itertools import cycle
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+ERROR_TYPES = {
+    400: "invalid_request_error",
+    401: "authentication_error",
+    429: "rate_limit_exceeded",
+    500: "server_error",
+    503: "service_unavailable",
+}
+
+# Emulated provider prompt cache: prefixes of at least this many tokens are
+# cached, in steps of PROMPT_CACHE_STEP_TOKENS; tokens are estimated as 4 characters
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_STEP_TOKENS = 128
+PROMPT_CACHE_MAX_ENTRIES = 100_000
+
+
+def create_mock_app(latency: float = 0.05, tokens: int = 50, token_rate: float = 0.0, error_rate: float = 0.0,
+                    error_status: Sequence[int] = (429, 500, 503), seed: int = 0, prompt_cache: bool = True) -> FastAPI:
+    """
+    Build the mock API app
+
+    Args:
+        latency (float): Seconds to wait before responding
+        tokens (int): Number of tokens in each completion
+        token_rate (float): Completion tokens per second, 0 for all at once
+        error_rate (float): Fraction of requests answered with an error
+        error_status (Sequence[int]): HTTP status codes the injected errors cycle through
+        seed (int): Seed for choosing which requests fail
+        prompt_cache (bool): Report cached prompt tokens for repeated prompt prefixes
+    """
+    app = FastAPI(title="Mock OpenAI API")
+    rng = random.Random(seed)
+    statuses = cycle(error_status)
+    stats = {"requests": 0, "errors": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0}
+    token_delay = 1.0 / token_rate if token_rate > 0 else 0.0
+    # Hashes of the cached prompt prefixes, least recently used first
+    prefixes: "OrderedDict[bytes, None]" = OrderedDict()
+
+    def cached_tokens(messages) -> int:
+        """Tokens at the start of the prompt already seen in an earlier prompt, and remember this one"""
+        if not prompt_cache:
+            return 0
+        text = "".join(f"{m.get('role')}:{m.get('content', '')}\n" for m in messages)
+        digest, start, cached, hit = hashlib.sha1(), 0, 0, True
+        for end in range(PROMPT_CACHE_MIN_TOKENS * 4, len(text) + 1, PROMPT_CACHE_STEP_TOKENS * 4):
+            digest.update(text[start:end].encode("utf-8"))
+            start, key = end, digest.digest()
+            # Only a run of matching prefixes from the start counts, as with a real cache
+            hit = hit and key in prefixes
+            if hit:
+                cached = end // 4
+            prefixes[key] = None
+            prefixes.move_to_end(key)
+        while len(prefixes) > PROMPT_CACHE_MAX_ENTRIES:
+            prefixes.popitem(last=False)
+        return cached
+
+    def injected_error() -> Optional[JSONResponse]:
+        """Count the request and, at the configured rate, return an error response for it"""
+        stats["requests"] += 1
+        if error_rate <= 0 or rng.random() >= error_rate:
+            return None
+        stats["errors"] += 1
+        status = next(statuses)
+        error_type = ERROR_TYPES.get(status, "server_error")
+        return JSONResponse(
+            {"error": {"message": f"Injected {status} from the mock server", "type": error_type, "code": error_type}},
+            status_code=status,
+            headers={"retry-after": "1"} if status == 429 else None,
+        )
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        error = injected_error()
+        if error is not None:
+            await asyncio.sleep(latency)
+            return error
+        model = body.get("model", "gpt-4o-mini")
+        prompt_tokens = sum(len(str(m.get("content", ""))) // 4 for m in body.get("messages", []))
+        cached = min(cached_tokens(body.get("messages", [])), prompt_tokens)
+        stats["prompt_tokens"] += prompt_tokens
+        stats["cached_prompt_tokens"] += cached
+        words = [f"word{i}" for i in range(tokens)]
+        created = int(time.time())
+
+        if body.get("stream"):
+            async def events():
+                await asyncio.sleep(latency)
+                for i, word in enumerate(words):
+                    if token_delay and i:
+                        await asyncio.sleep(token_delay)
+                    chunk = {
+                        "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": {"role": "assistant", "content": word + " "} if i == 0
+                                     else {"content": word + " "}, "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                final = {
+                    "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                }
+                yield f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(latency + token_delay * max(0, tokens - 1))
+        return JSONResponse({
+            "id": "chatcmpl-mock", "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": tokens, "total_tokens": prompt_tokens + tokens,
+                      "prompt_tokens_details": {"cached_tokens": cached}},
+        })
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(latency)
+        error = injected_error()
+        if error is not None:
+            return error
+        return JSONResponse({
+            "object": "list", "model": body.get("model", "text-embedding-3-small"),
+            "data": [{"object": "embedding", "index": i, "embedding": embed_text(text)} for i, text in enumerate(inputs)],
+            "usage": {"prompt_tokens": sum(len(t) // 4 for t in inputs), "total_tokens": sum(len(t) // 4 for t in inputs)},
+        })
+
+    return app
+
+
+def embed_text(text: str, dimensions: int = 256) -> list:
+    """Deterministic unit-length bag-of-words embedding"""
+    vector = [0.0] * dimensions
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        vector[int.from_bytes(digest[:4], "little") % dimensions] += 1.0 if digest[4] & 1 else -1.0
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible mock server")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind")
+    parser.add_argument("--port", type=int, default=8001, help="Port to listen on")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before each response")
+    parser.add_argument("--tokens", type=int, default=50, help="Tokens per completion")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Completion tokens per second, 0 for no pacing")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an error")
+    parser.add_argument("--error-status", type=int, nargs="+", default=[429, 500, 503], help="Status codes of injected errors")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for choosing which requests fail")
+    parser.add_argument("--no-prompt-cache", action="store_true", help="Never report cached prompt tokens")
+    args = parser.parse_args()
+    app = create_mock_app(args.latency, args.tokens, args.token_rate, args.error_rate, args.error_status, args.seed,
+                          prompt_cache=not args.no_prompt_cache)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
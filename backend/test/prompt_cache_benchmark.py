@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Prompt Tokens and Prefix Cache Benchmark
+
+Runs multi-turn chatbot conversations through AIService against the local mock
+server, which emulates provider prompt caching (prefixes of 1024+ tokens, in
+128-token steps, reported as usage.prompt_tokens_details.cached_tokens). The
+same conversations are run with three ways of building the prompt:
+- legacy: the original indented template with the user's query ahead of the
+  history, flattened into one message behind a ConversationChain-style
+  memory of the previous prompts
+- flattened: the registry's static instructions first, the rest flattened
+  into one message behind a memory of the previous per-request parts, so the
+  history is still sent twice
+- structured: a system message, the conversation as user/assistant
+  messages, and the new question, sent to the chat model directly
+
+The two flattened modes are rebuilt here from the code they replaced. The
+script reports prompt tokens per turn (mean and at the last turn), how many
+of them the provider served from its cache, the tokens left at full price,
+and the time to build a prompt.
+
+Usage:
+    python prompt_cache_benchmark.py [--chats 10] [--turns 8] [--tokens 120]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import logging
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ["FAQ_MATCH_ENABLED"] = "false"
+os.environ["TRACING_ENABLED"] = "false"
+os.environ["DATABASE_BACKEND"] = "memory"
+os.environ["LLM_HTTP_HTTP2"] = "false"
+
+from load_benchmark import QUESTIONS, free_port, wait_for
+from app.services.ai_service import AIService
+from app.services.prompts import CHATBOT_PROMPT
+from app.services.tokens import MESSAGE_OVERHEAD_TOKENS
+
+DETAILS = (
+    "For context, I am 38, earn about 4,100 a month after tax, rent for 1,350, have 6,000 in savings "
+    "and 9,500 left on a car loan at 7.9%. My employer matches pension contributions up to 5% and I "
+    "currently put in 3%. I would like to retire around 60 and help my two children with university."
+)
+
+# The LLM service wrapped every prompt in this, after its memory of the chat
+CONVERSATION_TEMPLATE = """The following is a friendly conversation between a human and an AI. The AI is talkative and provides lots of specific details from its context. If the AI does not know the answer to a question, it truthfully says it does not know.
+
+Current conversation:
+{history}
+Human: {input}
+AI:"""
+
+LEGACY_TEMPLATE = """
+        You are a knowledgeable and ethical financial advisor assistant with expertise in:
+        1. Personal finance and budgeting
+        2. Investment strategies and portfolio management
+        3. Retirement planning and savings
+        4. Tax optimization strategies
+        5. Insurance and risk management
+        6. Debt management and credit improvement
+
+        Guidelines:
+        - Provide personalized, actionable financial advice based on the information shared
+        - Always prioritize the client's long-term financial well-being
+        - Explain financial concepts in clear, simple terms while maintaining accuracy
+        - Disclose limitations and uncertainties in your advice
+        - When appropriate, suggest seeking professional advice for complex situations
+        - Do not recommend specific investment products or make promises about returns
+        - Maintain a professional, supportive, and non-judgmental tone
+        - Ask clarifying questions when needed to provide better guidance
+
+        - When internal document excerpts are provided, base your answer on them and cite them by number
+        {document_context}
+        User's query: {last_message}
+        {conversation_history}
+
+        Please provide helpful financial advice based on the above information:
+        """
+
+FLATTENED_TEMPLATE = """{summary}{history}{documents}User's query: {question}
+
+Please provide helpful financial advice based on the above information:"""
+
+
+class ChainMemory:
+    """
+    The LLM service's former per-chat memory: the last `max_turns` exchanges,
+    trimmed further to `max_tokens`, rendered as Human/AI lines
+    """
+    def __init__(self, token_counter, max_turns: int = 10, max_tokens: int = 2000):
+        self.token_counter = token_counter
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.turns: Dict[str, List[Tuple[str, str, int]]] = {}
+
+    def add_turn(self, chat_id: str, user_message: str, ai_message: str):
+        turns = self.turns.setdefault(chat_id, [])
+        for role, content in (("Human", user_message), ("AI", ai_message)):
+            turns.append((role, content, self.token_counter(content)))
+            while turns and (len(turns) > self.max_turns * 2 or sum(t[2] for t in turns) > self.max_tokens):
+                turns.pop(0)
+
+    def render(self, chat_id: str) -> str:
+        return "\n".join(f"{role}: {content}" for role, content, _ in self.turns.get(chat_id, []))
+
+
+class FlattenedPrompts:
+    """
+    The chatbot prompt as one user message behind a memory of earlier prompts
+
+    Args:
+        service (AIService): Provides the context window and token counter
+        legacy (bool): Use the original template instead of the registry's split one
+    """
+    def __init__(self, service: AIService, legacy: bool):
+        self.service = service
+        self.legacy = legacy
+        self.memory = ChainMemory(service.token_counter)
+        self.pending: Dict[str, str] = {}
+
+    async def build(self, messages: List[Dict[str, str]], chat_id: Optional[str] = None) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        last_message = messages[-1]["content"]
+        history, summary, context_metrics = await self.service.context_window.fit(
+            "chatbot", messages[:-1],
+            reserved_tokens=self.service.token_counter(last_message) + MESSAGE_OVERHEAD_TOKENS, chat_id=chat_id,
+        )
+        if self.legacy:
+            conversation_history = f"\n\nSummary of earlier conversation:\n{summary}\n" if summary else ""
+            if history:
+                conversation_history += "\n\nConversation history:\n"
+                conversation_history += "".join(f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}\n" for m in history)
+            message = LEGACY_TEMPLATE.format(document_context="", last_message=last_message, conversation_history=conversation_history)
+            system = ""
+        else:
+            conversation_history = ""
+            if history:
+                conversation_history = "Conversation history:\n"
+                conversation_history += "".join(f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}\n" for m in history)
+                conversation_history += "\n"
+            message = FLATTENED_TEMPLATE.format(
+                summary=f"Summary of earlier conversation:\n{summary}\n\n" if summary else "",
+                history=conversation_history, documents="", question=last_message,
+            )
+            system = CHATBOT_PROMPT.system + "\n\n"
+        # Memory held the message without the system part
+        self.pending[chat_id] = message
+        prompt = system + CONVERSATION_TEMPLATE.format(history=self.memory.render(chat_id), input=message)
+        tokens = self.service.token_counter(prompt)
+        metadata = {"context": {"prompt_tokens_after": tokens, "static_prefix_tokens": 0,
+                                "messages_trimmed": context_metrics["messages_trimmed"]}}
+        return [{"role": "user", "content": prompt}], metadata
+
+    def remember(self, chat_id: str, answer: str):
+        self.memory.add_turn(chat_id, self.pending.pop(chat_id), answer)
+
+
+async def converse(service: AIService, mode: str, flattened: Optional[FlattenedPrompts], chats: int, turns: int) -> List[Dict[str, Any]]:
+    """Run the conversations; return the metadata of every answer, with its turn"""
+    answers = []
+    for chat in range(chats):
+        chat_id, messages = f"{mode}-{chat}", []
+        for turn in range(turns):
+            messages.append({"role": "user", "content": f"{QUESTIONS[(chat + turn) % len(QUESTIONS)]} {DETAILS} (turn {turn})"})
+            response = await service.process_request(list(messages), "chatbot", chat_id)
+            if response["metadata"].get("error"):
+                raise RuntimeError(response["content"])
+            if flattened is not None:
+                flattened.remember(chat_id, response["content"])
+            messages.append({"role": "assistant", "content": response["content"]})
+            answers.append({**response["metadata"], "turn": turn})
+    return answers
+
+
+async def build_time_us(builder, rounds: int = 2000) -> float:
+    """Median time to build one prompt for a mid-conversation request"""
+    messages = []
+    for turn in range(6):
+        messages += [{"role": "user", "content": f"{QUESTIONS[turn % len(QUESTIONS)]} {DETAILS}"},
+                     {"role": "assistant", "content": "word " * 100}]
+    messages.append({"role": "user", "content": QUESTIONS[0]})
+    await builder(messages, "timing")
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await builder(messages, "timing")
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1e6
+
+
+async def run(args):
+    port = free_port()
+    mock = subprocess.Popen([sys.executable, str(Path(__file__).parent / "mock_openai_server.py"),
+                             "--port", str(port), "--latency", "0", "--tokens", str(args.tokens)])
+    os.environ["OPENAI_API_BASE"] = f"http://127.0.0.1:{port}/v1"
+    try:
+        await wait_for(f"http://127.0.0.1:{port}/stats", mock, "mock server")
+        service = AIService()
+        structured = service.prompt_builders["chatbot"]
+        print(f"{args.chats} chats x {args.turns} turns, {args.tokens}-token answers")
+        print(f"{'mode':<11} {'prompt tok/turn':>16} {'last turn':>10} {'cached tok/turn':>16} {'cached':>7} "
+              f"{'full-price tok/turn':>20} {'build us':>9}")
+        for mode in ("legacy", "flattened", "structured"):
+            flattened = FlattenedPrompts(service, legacy=mode == "legacy") if mode != "structured" else None
+            builder = flattened.build if flattened is not None else structured
+            service.prompt_builders["chatbot"] = builder
+            answers = await converse(service, mode, flattened, args.chats, args.turns)
+            prompt = statistics.mean(a["prompt_tokens"] for a in answers)
+            last = statistics.mean(a["prompt_tokens"] for a in answers if a["turn"] == args.turns - 1)
+            cached = statistics.mean(a["cached_prompt_tokens"] for a in answers)
+            print(f"{mode:<11} {prompt:>16.1f} {last:>10.1f} {cached:>16.1f} {cached / prompt:>7.0%} "
+                  f"{prompt - cached:>20.1f} {await build_time_us(builder):>9.1f}")
+        print(f"static prefix: {answers[-1]['context']['static_prefix_tokens']} tokens")
+    finally:
+        mock.terminate()
+        mock.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare prompt tokens and provider prefix-cache hits per chatbot turn")
+    parser.add_argument("--chats", type=int, default=10, help="Conversations per mode")
+    parser.add_argument("--turns", type=int, default=8, help="Turns per conversation")
+    parser.add_argument("--tokens", type=int, default=120, help="Tokens per mock answer")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    asyncio.run(run(args))
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Document Retrieval Benchmark
+
+Builds a local corpus of synthetic policy/product markdown files (plus
+corporate.md from this directory), indexes it with DocumentIndex using the
+deterministic FakeEmbedder, and reports:
+
+- ingestion time, chunks per second and peak Python memory while ingesting
+- recall@1 and recall@k for questions about facts planted in known sections
+- search latency percentiles
+- sync time when nothing changed and after editing a single file
+
+Usage:
+    python rag_benchmark.py [--files 200] [--sections 20] [--queries 500] [--k 4]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import asyncio
+import logging
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+import numpy as np
+
+from app.services.document_index import DocumentIndex
+from app.services.embeddings import EmbeddingService, EmbeddingStore
+from app.services.tokens import estimate_tokens
+from fake_embedder import FakeEmbedder
+
+ACCOUNTS = ["savings", "checking", "brokerage", "retirement", "college", "business", "trust", "escrow"]
+RULES = ["withdrawal limit", "monthly fee", "minimum balance", "interest rate", "transfer cutoff", "overdraft charge"]
+FILLER = (
+    "Clients should review the terms with their advisor before opening an account. "
+    "Rates and limits are reviewed quarterly by the product committee and may change. "
+)
+
+
+def product_name(rng: random.Random) -> str:
+    syllables = ["zor", "vel", "tan", "qui", "mar", "lex", "dor", "pha", "rin", "sol", "ket", "bru"]
+    return "".join(rng.choice(syllables) for _ in range(3)).capitalize()
+
+
+def build_corpus(root: str, files: int, sections: int, seed: int = 11):
+    """Write the corpus and return (question, file, heading) for every planted fact"""
+    rng = random.Random(seed)
+    facts = []
+    for f in range(files):
+        path = os.path.join(root, f"policy_{f:04d}.md")
+        lines = [f"# Product policy {f}", "", FILLER * 3, ""]
+        for s in range(sections):
+            product, account, rule = product_name(rng), rng.choice(ACCOUNTS), rng.choice(RULES)
+            heading = f"{product} {account} account"
+            value = f"{rng.randint(1, 99)} dollars"
+            lines += [f"## {heading}", "", FILLER, "",
+                      f"The {rule} for the {product} {account} account is {value}.", "", FILLER * 2, ""]
+            facts.append((f"What is the {rule} of the {product} {account} account?", os.path.abspath(path), heading))
+        with open(path, "w", encoding="utf-8") as out:
+            out.write("\n".join(lines))
+    corporate = Path(__file__).parent / "corporate.md"
+    if corporate.exists():
+        shutil.copy(corporate, root)
+    return facts
+
+
+async def run(files: int, sections: int, queries: int, k: int):
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, "corpus")
+        os.makedirs(corpus)
+        facts = build_corpus(corpus, files, sections)
+
+        embedder = FakeEmbedder()
+        embeddings = EmbeddingService(embedder, EmbeddingStore(os.path.join(tmp, "embeddings.f32"), embedder.model))
+        index = DocumentIndex(os.path.join(tmp, "documents.db"), embeddings, estimate_tokens, chunk_tokens=200, overlap_tokens=30)
+
+        stats = await index.sync(corpus)
+        corpus_mb = sum(os.path.getsize(os.path.join(corpus, f)) for f in os.listdir(corpus)) / 1e6
+        print(f"ingested {stats['files_indexed']} files ({corpus_mb:.1f} MB) into {stats['chunks']:,} chunks "
+              f"in {stats['seconds']:.2f}s ({stats['chunks'] / stats['seconds']:,.0f} chunks/s)")
+
+        # Memory is traced on a second ingestion into a fresh index (tracing slows the timed run)
+        fresh = DocumentIndex(os.path.join(tmp, "traced.db"), embeddings, estimate_tokens, chunk_tokens=200, overlap_tokens=30)
+        tracemalloc.start()
+        await fresh.sync(corpus)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        fresh.close()
+        print(f"peak Python memory while ingesting: {peak / 1e6:.1f} MB (including the in-memory search matrix)")
+
+        sample = random.Random(3).sample(facts, min(queries, len(facts)))
+        hits_at_1 = hits_at_k = 0
+        latencies = []
+        for question, path, heading in sample:
+            started = time.perf_counter()
+            results = await index.search(question, k=k)
+            latencies.append(time.perf_counter() - started)
+            found = [(r["source"], r["heading"].split(" > ")[-1]) for r in results]
+            hits_at_1 += bool(found) and found[0] == (path, heading)
+            hits_at_k += (path, heading) in found
+        latencies_ms = np.array(latencies) * 1000
+        print(f"recall@1 {hits_at_1 / len(sample):.3f}  recall@{k} {hits_at_k / len(sample):.3f}  over {len(sample)} queries")
+        print(f"search latency p50 {np.percentile(latencies_ms, 50):.2f}ms  p95 {np.percentile(latencies_ms, 95):.2f}ms  "
+              f"p99 {np.percentile(latencies_ms, 99):.2f}ms (includes the {embeddings.batch_wait * 1000:.0f}ms embedding batch window)")
+
+        stats = await index.sync(corpus)
+        print(f"sync, nothing changed:  {stats['seconds'] * 1000:.1f}ms")
+
+        edited = os.path.join(corpus, "policy_0000.md")
+        with open(edited, "a", encoding="utf-8") as out:
+            out.write("\n## Amendment\n\nThe amendment adds a paperless discount.\n")
+        requests = embedder.requests
+        texts = embedder.texts
+        stats = await index.sync(corpus)
+        print(f"sync, one file edited:  {stats['seconds'] * 1000:.1f}ms "
+              f"({stats['files_indexed']} file re-indexed, {embedder.texts - texts} texts / "
+              f"{embedder.requests - requests} requests sent to the embedder)")
+        index.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark document retrieval recall and latency")
+    parser.add_argument("--files", type=int, default=200, help="Synthetic markdown files")
+    parser.add_argument("--sections", type=int, default=20, help="Sections (planted facts) per file")
+    parser.add_argument("--queries", type=int, default=500, help="Questions to evaluate")
+    parser.add_argument("--k", type=int, default=4, help="Chunks retrieved per question")
+    args = parser.parse_args()
+    asyncio.run(run(args.files, args.sections, args.queries, args.k))
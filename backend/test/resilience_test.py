@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+LLM Resilience Test
+
+Swaps the LangChain model inside LLMService for a local fault-injecting
+stand-in and checks the retry and circuit breaker behaviour end to end:
+transient errors are retried with backoff, permanent ones are not, a failing
+upstream opens the breaker so later calls fail fast, and a healthy probe
+closes it again. Also checks that AIService classifies the typed errors.
+
+Usage:
+    python resilience_test.py [--verbose]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+
+import httpx
+import openai
+from langchain.schema.messages import AIMessage, AIMessageChunk
+
+import app.services.ai_service as ai_module
+from app.services.llm_service import LLMService
+from app.services.resilience import (
+    ResilientCaller, CircuitOpenError, LLMConnectionError, LLMContextLimitError,
+)
+
+REQUEST = httpx.Request("POST", "http://mock/v1/chat/completions")
+
+
+def rate_limit_error(retry_after: str = None) -> Exception:
+    headers = {"retry-after": retry_after} if retry_after else {}
+    return openai.RateLimitError(
+        "Rate limit reached", response=httpx.Response(429, headers=headers, request=REQUEST), body=None
+    )
+
+
+def context_error() -> Exception:
+    return openai.BadRequestError(
+        "This model's maximum context length is 128000 tokens",
+        response=httpx.Response(400, request=REQUEST),
+        body={"code": "context_length_exceeded"},
+    )
+
+
+def connection_error() -> Exception:
+    return openai.APIConnectionError(request=REQUEST)
+
+
+class FaultyLLM:
+    """
+    Stand-in for ChatOpenAI that fails according to a script
+
+    Args:
+        faults (list): One entry per call; an exception factory to raise, or None to succeed
+        fail_after_chunks (int): When streaming, raise the fault after this many chunks
+    """
+    def __init__(self, faults=None, fail_after_chunks: int = 0):
+        self.faults = list(faults or [])
+        self.fail_after_chunks = fail_after_chunks
+        self.calls = 0
+
+    def _next_fault(self):
+        self.calls += 1
+        return self.faults.pop(0) if self.faults else None
+
+    async def ainvoke(self, messages, **kwargs) -> AIMessage:
+        fault = self._next_fault()
+        if fault:
+            raise fault()
+        return AIMessage(content="ok")
+
+    async def astream(self, messages):
+        fault = self._next_fault()
+        for i, word in enumerate(["streamed ", "answer"]):
+            if fault and i == self.fail_after_chunks:
+                raise fault()
+            yield AIMessageChunk(content=word)
+
+
+def service(llm: FaultyLLM, **resilience) -> LLMService:
+    llm_service = LLMService()
+    llm_service.llm = llm
+    llm_service.resilience = ResilientCaller(**{"base_delay": 0.01, "max_delay": 0.05, **resilience})
+    return llm_service
+
+
+async def expect_error(coro, error_type):
+    try:
+        await coro
+    except error_type as e:
+        return e
+    raise AssertionError(f"expected {error_type.__name__}")
+
+
+async def test_transient_errors_are_retried():
+    llm = FaultyLLM([rate_limit_error, connection_error])
+    assert await service(llm).generate_response("hi") == "ok"
+    assert llm.calls == 3
+
+
+async def test_retries_are_bounded():
+    llm = FaultyLLM([connection_error] * 5)
+    await expect_error(service(llm, max_attempts=3).generate_response("hi"), LLMConnectionError)
+    assert llm.calls == 3
+
+
+async def test_permanent_errors_are_not_retried():
+    llm = FaultyLLM([context_error])
+    llm_service = service(llm)
+    await expect_error(llm_service.generate_response("hi"), LLMContextLimitError)
+    assert llm.calls == 1
+    # A rejected prompt says nothing about upstream health
+    assert llm_service.resilience.breaker(llm_service.model_name).failures == 0
+
+
+async def test_retry_after_is_honoured():
+    llm = FaultyLLM([lambda: rate_limit_error("0.2")])
+    started = time.monotonic()
+    await service(llm, max_delay=1.0).generate_response("hi")
+    assert time.monotonic() - started >= 0.2
+
+
+async def test_breaker_opens_and_recovers():
+    llm = FaultyLLM([connection_error] * 4)
+    llm_service = service(llm, max_attempts=2, failure_threshold=4, reset_timeout=0.2)
+    await expect_error(llm_service.generate_response("a"), LLMConnectionError)
+    await expect_error(llm_service.generate_response("b"), LLMConnectionError)
+    assert llm_service.resilience.breaker(llm_service.model_name).state == "open"
+
+    # Open: fail fast without touching the upstream
+    calls = llm.calls
+    await expect_error(llm_service.generate_response("c"), CircuitOpenError)
+    assert llm.calls == calls
+
+    # After the reset timeout a healthy probe closes the breaker
+    await asyncio.sleep(0.25)
+    assert await llm_service.generate_response("d") == "ok"
+    assert llm_service.resilience.breaker(llm_service.model_name).state == "closed"
+
+
+async def test_failed_probe_reopens_breaker():
+    llm = FaultyLLM([connection_error] * 3)
+    llm_service = service(llm, max_attempts=1, failure_threshold=2, reset_timeout=0.1)
+    for _ in range(2):
+        await expect_error(llm_service.generate_response("a"), LLMConnectionError)
+    await asyncio.sleep(0.15)
+    await expect_error(llm_service.generate_response("probe"), LLMConnectionError)
+    assert llm_service.resilience.breaker(llm_service.model_name).state == "open"
+    await expect_error(llm_service.generate_response("b"), CircuitOpenError)
+
+
+async def test_stream_retries_before_first_chunk_only():
+    llm = FaultyLLM([connection_error])
+    chunks = [c async for c in service(llm).stream_response("hi")]
+    assert "".join(chunks) == "streamed answer" and llm.calls == 2
+
+    llm = FaultyLLM([connection_error], fail_after_chunks=1)
+    chunks = []
+    try:
+        async for chunk in service(llm).stream_response("hi"):
+            chunks.append(chunk)
+        raise AssertionError("expected LLMConnectionError")
+    except LLMConnectionError:
+        pass
+    assert chunks == ["streamed "] and llm.calls == 1
+
+
+async def test_agent_reports_typed_error():
+    ai_service = ai_module.AIService()
+    llm_service = service(FaultyLLM([rate_limit_error] * 3), max_attempts=3)
+    original = ai_module.get_llm_service
+    ai_module.get_llm_service = lambda: llm_service
+    try:
+        response = await ai_service.process_request([{"role": "user", "content": "hi"}], "chatbot")
+    finally:
+        ai_module.get_llm_service = original
+    assert response["metadata"]["error_type"] == "rate_limit_error"
+
+
+TESTS = [
+    test_transient_errors_are_retried,
+    test_retries_are_bounded,
+    test_permanent_errors_are_not_retried,
+    test_retry_after_is_honoured,
+    test_breaker_opens_and_recovers,
+    test_failed_probe_reopens_breaker,
+    test_stream_retries_before_first_chunk_only,
+    test_agent_reports_typed_error,
+]
+
+
+async def run() -> int:
+    failed = 0
+    for test in TESTS:
+        try:
+            await test()
+            print(f"PASS {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"FAIL {test.__name__}: {type(e).__name__}: {e}")
+    print(f"{len(TESTS) - failed}/{len(TESTS)} passed")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check LLM retries and circuit breaking against a fault-injecting stand-in")
+    parser.add_argument("--verbose", action="store_true", help="Show retry warnings")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING if args.verbose else logging.CRITICAL)
+    sys.exit(1 if asyncio.run(run()) else 0)
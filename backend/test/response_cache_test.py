@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Response Cache Test
+
+Checks the LLM completion cache:
+- exact and normalized (whitespace, case) prompt hits, and misses on other
+  models or temperatures
+- entries expire after the TTL, and the in-memory tier is a bounded LRU
+- the SQLite tier survives a restart and promotes hits to the memory tier
+- the SQLite tier drops expired rows and keeps at most max_disk_entries
+- LLMService answers a repeated prompt from the cache without calling the model
+
+Usage:
+    python response_cache_test.py
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import asyncio
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ["TRACING_ENABLED"] = "false"
+
+from langchain.schema.messages import AIMessage
+
+from app.services.llm_service import LLMService
+from app.services.response_cache import ResponseCache
+
+MODEL = "gpt-4o-mini"
+
+
+def disk_rows(path: str) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+
+async def test_exact_and_normalized_hits():
+    cache = ResponseCache()
+    await cache.set(MODEL, 0.7, "How do I  budget?", "Track your spending.")
+    assert await cache.get(MODEL, 0.7, "How do I  budget?") == "Track your spending."
+    assert await cache.get(MODEL, 0.7, "  how do i budget? ") == "Track your spending."
+    assert await cache.get(MODEL, 0.2, "How do I  budget?") is None
+    assert await cache.get("gpt-4o", 0.7, "How do I  budget?") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["normalized_hits"], stats["misses"]) == (2, 1, 2), stats
+
+
+async def test_entries_expire():
+    cache = ResponseCache(ttl=0.05)
+    await cache.set(MODEL, 0.7, "prompt", "answer")
+    assert await cache.get(MODEL, 0.7, "prompt") == "answer"
+    await asyncio.sleep(0.06)
+    assert await cache.get(MODEL, 0.7, "prompt") is None
+
+
+async def test_memory_tier_is_lru():
+    # Already normalized prompts take one entry each
+    cache = ResponseCache(max_entries=2)
+    await cache.set(MODEL, 0.7, "a", "1")
+    await cache.set(MODEL, 0.7, "b", "2")
+    assert await cache.get(MODEL, 0.7, "a") == "1"
+    await cache.set(MODEL, 0.7, "c", "3")
+    assert await cache.get(MODEL, 0.7, "b") is None
+    assert await cache.get(MODEL, 0.7, "a") == "1" and await cache.get(MODEL, 0.7, "c") == "3"
+    assert cache.stats()["evictions"] == 1
+
+
+async def test_disk_tier_survives_restart_and_promotes():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.db")
+        await ResponseCache(disk_path=path).set(MODEL, 0.7, "What is an ETF?", "A basket of securities.")
+
+        restarted = ResponseCache(disk_path=path)
+        assert restarted.stats()["entries"] == 0
+        assert await restarted.get(MODEL, 0.7, "what is an  ETF?") == "A basket of securities."
+        assert restarted.stats()["entries"] == 1 and restarted.stats()["normalized_hits"] == 1
+        # Served from memory from now on, even if the row is gone
+        await asyncio.to_thread(restarted._execute, "DELETE FROM completions")
+        assert await restarted.get(MODEL, 0.7, "what is an  ETF?") == "A basket of securities."
+
+
+async def test_disk_tier_is_purged_and_capped():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.db")
+        expiring = ResponseCache(ttl=0.05, disk_path=path, purge_interval=0)
+        await expiring.set(MODEL, 0.7, "old", "stale")
+        await asyncio.sleep(0.06)
+
+        cache = ResponseCache(disk_path=path, max_disk_entries=6, purge_interval=0)
+        assert await cache.get(MODEL, 0.7, "old") is None
+        for i in range(5):
+            await cache.set(MODEL, 0.7, f"Question {i}", f"answer {i}")
+            time.sleep(0.001)
+        # The expired pair went first, then the oldest rows beyond the cap
+        assert disk_rows(path) == 6
+        cold = ResponseCache(disk_path=path)
+        assert await cold.get(MODEL, 0.7, "Question 0") is None
+        assert await cold.get(MODEL, 0.7, "Question 4") == "answer 4"
+
+
+async def test_service_answers_repeats_from_cache():
+    class CountingLLM:
+        calls = 0
+
+        async def ainvoke(self, messages, **kwargs) -> AIMessage:
+            CountingLLM.calls += 1
+            return AIMessage(content=f"answer {CountingLLM.calls}")
+
+    service = LLMService()
+    service.cache = ResponseCache()
+    service.llm = CountingLLM()
+    first = await service.generate("Should I pay off debt first?")
+    again = await service.generate("should I pay off debt  first?")
+    assert CountingLLM.calls == 1
+    assert again.text == first.text == "answer 1" and again.cached and not first.cached
+    assert again.total_tokens == 0
+
+
+TESTS = [
+    test_exact_and_normalized_hits,
+    test_entries_expire,
+    test_memory_tier_is_lru,
+    test_disk_tier_survives_restart_and_promotes,
+    test_disk_tier_is_purged_and_capped,
+    test_service_answers_repeats_from_cache,
+]
+
+
+async def run() -> int:
+    failed = 0
+    for test in TESTS:
+        try:
+            await test()
+            print(f"PASS {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"FAIL {test.__name__}: {type(e).__name__}: {e}")
+    print(f"{len(TESTS) - failed}/{len(TESTS)} passed")
+    return failed
+
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(description="Check the LLM completion cache").parse_args()
+    logging.disable(logging.CRITICAL)
+    sys.exit(1 if asyncio.run(run()) else 0)
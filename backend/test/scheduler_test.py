@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Scheduler Test
+
+Checks RequestScheduler admission control directly and through the API:
+- waiting requests run in priority order (chatbot, analysis, summary)
+- inside a priority level clients are served round-robin
+- a full queue sheds new requests with SchedulerOverloaded and a Retry-After
+- a waiter cancelled while queued gives up its place without taking a slot
+- with a shared state store the cap and queue depth hold across workers, and
+  a slot freed by one worker is picked up by another's waiter
+- /chat and /chat/stream answer a shed request with 429 and Retry-After, and
+  a failure before the answer starts (loading the chat history) with a 500
+- unknown agent types are queued and measured as the chatbot serving them,
+  so client input never becomes a queue-wait label
+
+Usage:
+    python scheduler_test.py
+"""
+
+import os
+import sys
+import asyncio
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ["FAQ_MATCH_ENABLED"] = "false"
+os.environ["TRACING_ENABLED"] = "false"
+os.environ["DATABASE_BACKEND"] = "memory"
+
+import httpx
+from langchain.schema.messages import AIMessage
+
+from main import app
+from app.services.ai_service import get_ai_service
+from app.services.database import DatabaseService, get_database_service
+from app.services.llm_service import get_llm_service
+from app.services.scheduler import ACTIVE_KEY, QUEUED_KEY, RequestScheduler, SchedulerOverloaded
+from app.services.shared_state import SharedState
+from app.services.storage import InMemoryStorage
+
+
+async def queue_behind_blocker(scheduler: RequestScheduler, requests):
+    """
+    Hold the only slot, queue `requests` ((name, agent_type, client_id)) in
+    order, then let them run and return the order in which they got the slot
+    """
+    order = []
+
+    async def worker(name: str, agent_type: str, client_id: str):
+        async with scheduler.slot(agent_type, client_id):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    await scheduler.acquire("chatbot", "blocker")
+    tasks = []
+    for request in requests:
+        tasks.append(asyncio.create_task(worker(*request)))
+        await asyncio.sleep(0)
+    assert scheduler.queue_depth == len(requests), scheduler.queue_depth
+    scheduler.release()
+    await asyncio.gather(*tasks)
+    return order
+
+
+async def test_priority_order():
+    scheduler = RequestScheduler(max_concurrent=1)
+    order = await queue_behind_blocker(scheduler, [
+        ("summary", "summary", "a"),
+        ("analysis", "analysis", "a"),
+        ("chatbot-1", "chatbot", "a"),
+        ("unknown", "other", "a"),
+        ("chatbot-2", "chatbot", "b"),
+    ])
+    # Unknown agent types wait with the lowest priority
+    assert order[:3] == ["chatbot-1", "chatbot-2", "analysis"], order
+    assert set(order[3:]) == {"summary", "unknown"}, order
+
+
+async def test_clients_are_served_round_robin():
+    scheduler = RequestScheduler(max_concurrent=1)
+    busy = [(f"a{i}", "chatbot", "a") for i in range(4)]
+    order = await queue_behind_blocker(scheduler, busy + [("b0", "chatbot", "b"), ("b1", "chatbot", "b"), ("c0", "chatbot", "c")])
+    assert order == ["a0", "b0", "c0", "a1", "b1", "a2", "a3"], order
+    assert scheduler.stats()["active"] == 0
+
+
+async def test_full_queue_is_shed():
+    scheduler = RequestScheduler(max_concurrent=1, max_queue_depth=2)
+    await scheduler.acquire("chatbot", "a")
+    waiting = [asyncio.create_task(scheduler.acquire("chatbot", client)) for client in ("b", "c")]
+    await asyncio.sleep(0)
+    try:
+        await scheduler.acquire("chatbot", "d")
+        raise AssertionError("request admitted past a full queue")
+    except SchedulerOverloaded as e:
+        assert e.queue_depth == 2 and e.retry_after >= 1, (e.queue_depth, e.retry_after)
+    assert scheduler.shed == 1 and scheduler.queue_depth == 2
+
+    # The shed request left no waiter behind
+    for _ in waiting:
+        scheduler.release()
+        await asyncio.sleep(0)
+    await asyncio.gather(*waiting)
+    scheduler.release()
+    assert scheduler.stats()["active"] == 0 and scheduler.queue_depth == 0
+
+
+async def test_cancelled_waiter_is_discarded():
+    scheduler = RequestScheduler(max_concurrent=1)
+    await scheduler.acquire("chatbot", "a")
+    cancelled = asyncio.create_task(scheduler.acquire("chatbot", "b"))
+    waiting = asyncio.create_task(scheduler.acquire("chatbot", "c"))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    assert cancelled.cancelled() and scheduler.queue_depth == 1
+    scheduler.release()
+    await waiting
+    assert scheduler.stats()["active"] == 1
+    scheduler.release()
+    assert scheduler.stats()["active"] == 0
+
+
+async def test_cap_is_shared_between_workers():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state.db")
+        state_a, state_b = SharedState(path), SharedState(path)
+        # Two schedulers on separate handles stand in for two workers
+        worker_a = RequestScheduler(max_concurrent=1, max_queue_depth=1, state=state_a)
+        worker_b = RequestScheduler(max_concurrent=1, max_queue_depth=1, state=state_b)
+        try:
+            await worker_a.acquire("chatbot", "a")
+            waiting = asyncio.create_task(worker_b.acquire("chatbot", "b"))
+            await asyncio.sleep(0.1)
+            assert not waiting.done() and worker_b.queue_depth == 1
+
+            # The queue is full across both workers, so worker A sheds
+            try:
+                await worker_a.acquire("chatbot", "c")
+                raise AssertionError("request admitted past the shared queue")
+            except SchedulerOverloaded as e:
+                assert e.queue_depth == 1, e.queue_depth
+
+            # Worker B's waiter gets the slot worker A gives back
+            worker_a.release()
+            await asyncio.wait_for(waiting, 1)
+            assert worker_a.stats()["active"] == 0 and worker_b.stats()["active"] == 1
+            worker_b.release()
+            await asyncio.sleep(0.1)
+            assert state_a.get(ACTIVE_KEY) == 0 and state_a.get(QUEUED_KEY) == 0
+        finally:
+            state_a.close()
+            state_b.close()
+
+
+async def test_api_answers_shed_requests_with_429():
+    ai_service = get_ai_service()
+    original = ai_service.scheduler
+    ai_service.scheduler = RequestScheduler(max_concurrent=1, max_queue_depth=0)
+    await ai_service.scheduler.acquire("chatbot", "blocker")
+    body = {"messages": [{"role": "user", "content": "Should I rebalance?"}], "agent_type": "chatbot"}
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            for path in ("/chat", "/chat/stream"):
+                response = await client.post(path, json=body, headers={"X-Client-ID": "tester"})
+                assert response.status_code == 429, (path, response.status_code, response.text)
+                assert response.headers["Retry-After"] == "1", response.headers
+        assert ai_service.scheduler.shed == 2
+    finally:
+        ai_service.scheduler = original
+
+
+async def test_api_answers_failed_history_reads_with_500():
+    class BrokenStorage(InMemoryStorage):
+        async def get_recent_messages(self, chat_id, limit):
+            raise RuntimeError("database unavailable")
+
+    app.dependency_overrides[get_database_service] = lambda: DatabaseService(BrokenStorage())
+    body = {"messages": [{"role": "user", "content": "And my pension?"}], "agent_type": "chatbot", "chat_id": "known"}
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            for path in ("/chat", "/chat/stream"):
+                response = await client.post(path, json=body)
+                assert response.status_code == 500, (path, response.status_code, response.text)
+                assert response.json() == {"detail": "database unavailable"}, (path, response.text)
+    finally:
+        app.dependency_overrides.clear()
+
+
+async def test_unknown_agent_types_use_the_chatbot_label():
+    class StandInLLM:
+        async def ainvoke(self, messages, **kwargs) -> AIMessage:
+            return AIMessage(content="Keep three months of expenses aside.")
+
+    llm_service = get_llm_service()
+    ai_service = get_ai_service()
+    original_llm, original_scheduler = llm_service.llm, ai_service.scheduler
+    llm_service.llm = StandInLLM()
+    ai_service.scheduler = RequestScheduler()
+    messages = [{"role": "user", "content": "How big should my emergency fund be?"}]
+    try:
+        for agent_type in ("chatbot", "made-up-1", "made-up-2"):
+            response = await ai_service.process_request(messages, agent_type, client_id="tester")
+            assert response["agent_type"] == "chatbot", response
+        events = await ai_service.stream_request(messages, "made-up-3", client_id="tester")
+        async for _ in events:
+            pass
+        waits = ai_service.scheduler.stats()["queue_wait"]
+        assert list(waits) == ["chatbot"] and waits["chatbot"]["samples"] == 4, waits
+    finally:
+        llm_service.llm, ai_service.scheduler = original_llm, original_scheduler
+
+
+TESTS = [
+    test_priority_order,
+    test_clients_are_served_round_robin,
+    test_full_queue_is_shed,
+    test_cancelled_waiter_is_discarded,
+    test_cap_is_shared_between_workers,
+    test_api_answers_shed_requests_with_429,
+    test_api_answers_failed_history_reads_with_500,
+    test_unknown_agent_types_use_the_chatbot_label,
+]
+
+
+async def run() -> int:
+    failed = 0
+    for test in TESTS:
+        try:
+            await test()
+            print(f"PASS {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"FAIL {test.__name__}: {type(e).__name__}: {e}")
+    print(f"{len(TESTS) - failed}/{len(TESTS)} passed")
+    return failed
+
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(description="Check request scheduling, fairness and load shedding").parse_args()
+    logging.disable(logging.CRITICAL)
+    sys.exit(1 if asyncio.run(run()) else 0)
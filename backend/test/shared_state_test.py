@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Shared State Test
+
+Checks the multi-worker mode. Separate SharedState handles (and separate
+processes) on one file stand in for uvicorn workers:
+- values, TTLs (ttl=0 expires at once) and atomic counters
+- async callers (summarizer, circuit breakers) reach the store from worker
+  threads, never from the event loop
+- summaries written by one worker are extended by another
+- circuit breaker failures add up across workers, and only one worker probes
+- processes appending to one embedding store keep every hash on its own vector
+- end to end, a chat continued on a 2-worker uvicorn server keeps its history
+
+Usage:
+    python shared_state_test.py [--skip-server]
+"""
+
+import os
+import sys
+import time
+import socket
+import asyncio
+import logging
+import threading
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import httpx
+import numpy as np
+
+from app.services.llm_service import Completion
+from app.services.shared_state import SharedState
+from app.services.summarizer import IncrementalSummarizer
+from app.services.resilience import CircuitOpenError, LLMServerError, ResilientCaller
+from app.services.embeddings import EmbeddingStore
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def increment(path: str, times: int):
+    state = SharedState(path)
+    for _ in range(times):
+        state.incr("hits")
+
+
+def append_vectors(path: str, worker: int, rows: int):
+    store = EmbeddingStore(path, "test-model")
+    for i in range(rows):
+        key = f"w{worker}-{i}"
+        store.add([key], np.full((1, 4), worker * 1000 + i, dtype=np.float32))
+
+
+async def test_values_and_ttl():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state.db")
+        now = [1000.0]
+        a, b = SharedState(path, clock=lambda: now[0]), SharedState(path, clock=lambda: now[0])
+        a.set("plain", {"x": [1, 2]})
+        a.set("short", "gone soon", ttl=5)
+        assert b.get("plain") == {"x": [1, 2]}
+        assert b.get("short") == "gone soon"
+        a.set("instant", "already expired", ttl=0)
+        assert b.get("instant") is None
+        assert a.update("instant", lambda v: "again", ttl=0) == "again" and b.get("instant") is None
+        now[0] += 5
+        assert b.get("short") is None
+        assert [key for key, _ in b.scan("")] == ["plain"]
+        b.delete("plain")
+        assert a.get("plain", "missing") == "missing"
+        assert a.update("list", lambda v: (v or []) + [1]) == [1]
+        assert b.update("list", lambda v: (v or []) + [2]) == [1, 2]
+        b.update("list", lambda v: None)
+        assert a.get("list") is None
+
+
+async def test_counter_is_atomic_across_processes():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state.db")
+        context = multiprocessing.get_context("spawn")
+        workers = [context.Process(target=increment, args=(path, 200)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert SharedState(path).get("hits") == 800
+
+
+async def test_summaries_are_extended_by_any_worker():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state.db")
+        prompts = []
+
+        async def generate(messages) -> Completion:
+            prompts.append(messages[-1]["content"])
+            return Completion(f"summary {len(prompts)}")
+
+        worker_a = IncrementalSummarizer(generate, count_words, state=SharedState(path))
+        worker_b = IncrementalSummarizer(generate, count_words, state=SharedState(path))
+        texts = [f"message {i}" for i in range(6)]
+        await worker_a.summarize(texts, key="chat")
+        summary, metrics = await worker_b.summarize(texts + ["message 6"], key="chat")
+        assert metrics["new_messages"] == 1, metrics
+        assert "summary 1" in prompts[-1] and summary == "summary 2"
+
+
+async def test_breaker_is_shared():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state.db")
+        worker_a = ResilientCaller(max_attempts=1, failure_threshold=2, reset_timeout=0.2, shared_state=SharedState(path))
+        worker_b = ResilientCaller(max_attempts=1, failure_threshold=2, reset_timeout=0.2, shared_state=SharedState(path))
+
+        async def fail():
+            raise LLMServerError("upstream 503")
+
+        async def succeed():
+            return "ok"
+
+        for worker in (worker_a, worker_b):
+            try:
+                await worker.call("model", fail)
+            except LLMServerError:
+                pass
+        # Two failures on different workers reach the threshold for both
+        for worker in (worker_a, worker_b):
+            try:
+                await worker.call("model", succeed)
+                raise AssertionError("breaker did not open")
+            except CircuitOpenError:
+                pass
+
+        await asyncio.sleep(0.25)
+        release = asyncio.Event()
+
+        async def slow_probe():
+            await release.wait()
+            return "ok"
+
+        probe = asyncio.create_task(worker_a.call("model", slow_probe))
+        await asyncio.sleep(0.01)
+        try:
+            await worker_b.call("model", succeed)
+            raise AssertionError("second worker probed while the first was probing")
+        except CircuitOpenError:
+            pass
+        release.set()
+        assert await probe == "ok"
+        assert await worker_b.call("model", succeed) == "ok"
+        assert worker_b.stats()["breakers"]["model"]["state"] == "closed"
+
+
+class ThreadRecordingState(SharedState):
+    """SharedState that notes whether each call ran on the event loop's thread"""
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.calls_on_loop = 0
+        self.calls = 0
+
+    def _note(self):
+        self.calls += 1
+        self.calls_on_loop += threading.current_thread() is threading.main_thread()
+
+    def get(self, *args, **kwargs):
+        self._note()
+        return super().get(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        self._note()
+        return super().set(*args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        self._note()
+        return super().update(*args, **kwargs)
+
+
+async def test_async_callers_stay_off_the_event_loop():
+    with tempfile.TemporaryDirectory() as tmp:
+        state = ThreadRecordingState(os.path.join(tmp, "state.db"))
+
+        async def generate(messages) -> Completion:
+            return Completion("summary")
+
+        summarizer = IncrementalSummarizer(generate, count_words, state=state)
+        await summarizer.summarize(["message 0", "message 1"], key="chat")
+        await summarizer.summarize(["message 0", "message 1", "message 2"], key="chat")
+
+        caller = ResilientCaller(max_attempts=2, base_delay=0.001, failure_threshold=5, shared_state=state)
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise LLMServerError("upstream 503")
+            return "ok"
+
+        assert await caller.call("model", flaky) == "ok"
+        assert state.calls >= 6 and state.calls_on_loop == 0, (state.calls, state.calls_on_loop)
+
+
+async def test_embedding_store_appends_from_several_processes():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "vectors.f32")
+        context = multiprocessing.get_context("spawn")
+        workers = [context.Process(target=append_vectors, args=(path, w, 50)) for w in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        store = EmbeddingStore(path, "test-model")
+        assert len(store) == 150
+        for w in range(3):
+            for i in range(50):
+                assert store.get(f"w{w}-{i}")[0] == w * 1000 + i
+
+        # A store that is already open picks up rows added elsewhere before appending
+        first, second = EmbeddingStore(path, "test-model"), EmbeddingStore(path, "test-model")
+        second.add(["late"], np.full((1, 4), 7, dtype=np.float32))
+        first.add(["later"], np.full((1, 4), 8, dtype=np.float32))
+        assert first.get("late")[0] == 7 and first.get("later")[0] == 8
+        reopened = EmbeddingStore(path, "test-model")
+        assert reopened.get("late")[0] == 7 and reopened.get("later")[0] == 8
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for(url: str):
+    async with httpx.AsyncClient() as client:
+        for _ in range(300):
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+
+async def test_chat_continues_across_workers():
+    backend = Path(__file__).resolve().parent.parent
+    with tempfile.TemporaryDirectory() as tmp:
+        mock_port, port = free_port(), free_port()
+        env = {
+            **os.environ,
+            "OPENAI_API_BASE": f"http://127.0.0.1:{mock_port}/v1",
+            "LLM_HTTP_HTTP2": "false",
+            "SHARED_STATE_PATH": os.path.join(tmp, "state.db"),
+            "DATABASE_PATH": os.path.join(tmp, "chats.db"),
+            "EMBEDDING_STORE_PATH": os.path.join(tmp, "embeddings.f32"),
+            "FAQ_MATCH_ENABLED": "false",
+            "WARMUP_ON_STARTUP": "false",
+        }
+        processes = [
+            subprocess.Popen([sys.executable, str(Path(__file__).parent / "mock_openai_server.py"),
+                              "--port", str(mock_port), "--latency", "0"]),
+            subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", "2",
+                              "--log-level", "warning"], cwd=backend, env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL),
+        ]
+        try:
+            await wait_for(f"http://127.0.0.1:{mock_port}/stats")
+            await wait_for(f"http://127.0.0.1:{port}/")
+            base_url = f"http://127.0.0.1:{port}"
+            async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+                response = await client.post("/chat", json={"messages": [{"role": "user", "content": "turn 0"}]})
+                response.raise_for_status()
+                chat_id = response.json()["chat_id"]
+            # A fresh connection per request, so the turns are spread over both workers
+            for turn in range(1, 6):
+                async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+                    response = await client.post("/chat", json={"chat_id": chat_id,
+                                                                "messages": [{"role": "user", "content": f"turn {turn}"}]})
+                    response.raise_for_status()
+            for _ in range(4):
+                async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+                    page = (await client.get("/history", params={"chat_id": chat_id})).json()
+                assert [m["content"] for m in page["messages"] if m["role"] == "user"] == [f"turn {i}" for i in range(6)]
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+
+TESTS = [
+    test_values_and_ttl,
+    test_counter_is_atomic_across_processes,
+    test_summaries_are_extended_by_any_worker,
+    test_breaker_is_shared,
+    test_async_callers_stay_off_the_event_loop,
+    test_embedding_store_appends_from_several_processes,
+    test_chat_continues_across_workers,
+]
+
+
+async def run(skip_server: bool) -> int:
+    failed = 0
+    tests = [t for t in TESTS if not (skip_server and t is test_chat_continues_across_workers)]
+    for test in tests:
+        try:
+            await test()
+            print(f"PASS {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"FAIL {test.__name__}: {type(e).__name__}: {e}")
+    print(f"{len(tests) - failed}/{len(tests)} passed")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the shared state used by multi-worker deployments")
+    parser.add_argument("--skip-server", action="store_true", help="Skip the test that starts a 2-worker server")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    sys.exit(1 if asyncio.run(run(args.skip_server)) else 0)
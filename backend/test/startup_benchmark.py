@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Worker Cold-Start Benchmark
+
+Starts fresh interpreters and reports how long a backend worker takes to
+come up:
+
+- `import main`, the median over several runs, without OPENAI_API_KEY set
+- import time per top-level package, from `python -X importtime`
+- app startup plus the first response to GET /
+- the deferred warm-up (chat model client, tokenizer, embedding stack) that
+  the startup hook runs in the background
+
+Usage:
+    python startup_benchmark.py [--runs 5] [--top 12] [--max-import-seconds 1.0]
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+IMPORT_SCRIPT = """
+import time, json
+started = time.perf_counter()
+import main
+print(json.dumps({"import": time.perf_counter() - started}))
+"""
+
+STARTUP_SCRIPT = """
+import os, time, json, logging
+os.environ["WARMUP_ON_STARTUP"] = "false"
+started = time.perf_counter()
+import main
+from fastapi.testclient import TestClient
+logging.disable(logging.WARNING)
+with TestClient(main.app) as client:
+    client.get("/").raise_for_status()
+    first_response = time.perf_counter() - started
+    warm_started = time.perf_counter()
+    main.get_ai_service().warm_up()
+    warm_up = time.perf_counter() - warm_started
+print(json.dumps({"first_response": first_response, "warm_up": warm_up}))
+"""
+
+
+def run_python(script: str, env: dict, *flags: str):
+    """Run a script in a fresh interpreter from the backend directory; return (json result, stderr)"""
+    completed = subprocess.run(
+        [sys.executable, *flags, "-c", script], cwd=BACKEND, env=env, capture_output=True, text=True, check=False
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"worker failed to start:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+
+def import_time_by_package(stderr: str):
+    """Sum the self time of every imported module by top-level package, in seconds"""
+    totals = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        totals[name.strip().split(".")[0]] += int(self_us) / 1e6
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def run(runs: int, top: int, max_import_seconds: float) -> bool:
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    env["PYTHONWARNINGS"] = "ignore"
+    # Compile once so the runs measure importing, not byte-compiling
+    subprocess.run([sys.executable, "-m", "compileall", "-q", "app", "main.py"], cwd=BACKEND, check=False)
+
+    imports = [run_python(IMPORT_SCRIPT, env)[0]["import"] for _ in range(runs)]
+    median = statistics.median(imports)
+    print(f"import main (no OPENAI_API_KEY):  median {median * 1000:.0f}ms  "
+          f"min {min(imports) * 1000:.0f}ms  max {max(imports) * 1000:.0f}ms over {runs} runs")
+
+    _, stderr = run_python(IMPORT_SCRIPT, env, "-X", "importtime")
+    print(f"\nimport time by top-level package (top {top}):")
+    for package, seconds in import_time_by_package(stderr)[:top]:
+        print(f"  {package:<28} {seconds * 1000:8.1f}ms")
+
+    startup, _ = run_python(STARTUP_SCRIPT, {**env, "OPENAI_API_KEY": "sk-benchmark"})
+    print(f"\nimport + startup + first GET /:   {startup['first_response'] * 1000:.0f}ms")
+    print(f"deferred warm-up (in background): {startup['warm_up'] * 1000:.0f}ms")
+
+    if max_import_seconds and median > max_import_seconds:
+        print(f"\nFAIL: import took {median:.2f}s, budget {max_import_seconds:.2f}s")
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark backend worker cold-start time")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to time the import in")
+    parser.add_argument("--top", type=int, default=12, help="Packages to list in the import report")
+    parser.add_argument("--max-import-seconds", type=float, default=0.0, help="Fail when the median import is slower")
+    args = parser.parse_args()
+    sys.exit(0 if run(args.runs, args.top, args.max_import_seconds) else 1)
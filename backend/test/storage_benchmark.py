@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Storage Backend Benchmark
+
+Compares DatabaseService write throughput for the in-memory and SQLite
+backends. Messages are written by many concurrent store_message calls, the
+way overlapping /chat requests would, so the SQLite writer task can group
+them into batched transactions.
+
+Usage:
+    python storage_benchmark.py [--sizes 1000 10000 100000] [--concurrency 64]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from app.services.database import DatabaseService
+from app.services.storage import InMemoryStorage, SQLiteStorage
+
+# Keep per-message INFO logs out of the report
+logging.disable(logging.INFO)
+
+
+async def write_messages(db: DatabaseService, count: int, concurrency: int) -> float:
+    """Write `count` messages across 1 chat per 20 messages and return messages/second"""
+    async def writer(worker: int):
+        for i in range(worker, count, concurrency):
+            await db.store_message(f"chat-{i // 20}", {"role": "user", "content": f"message {i} " * 8})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(writer(w) for w in range(concurrency)))
+    # Include draining the write-behind queue, so the rate is for stored messages
+    await db.flush()
+    return count / (time.perf_counter() - started)
+
+
+async def run(sizes, concurrency: int):
+    print(f"{'backend':<10} {'messages':>10} {'msgs/sec':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            for name, backend in (
+                ("memory", InMemoryStorage()),
+                ("sqlite", SQLiteStorage(os.path.join(tmp, f"bench-{size}.db"))),
+            ):
+                db = DatabaseService(backend)
+                rate = await write_messages(db, size, concurrency)
+                await db.close()
+                print(f"{name:<10} {size:>10} {rate:>12,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark chat storage backends")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Message counts to write")
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent writers")
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.concurrency))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Streaming Chat Benchmark
+
+Starts the FastAPI app in-process with a local mock model that emits tokens at
+a fixed rate, then measures time-to-first-token and total time for
+/chat/stream (SSE and NDJSON) against the buffered /chat endpoint.
+
+Usage:
+    python streaming_benchmark.py [--requests 20] [--tokens 200] [--token-delay 0.01]
+"""
+
+import os
+import sys
+import time
+import socket
+import logging
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+import httpx
+import uvicorn
+from langchain.schema.messages import AIMessage, AIMessageChunk
+
+import main
+from app.services.llm_service import get_llm_service
+
+# Keep per-request INFO logs out of the report
+logging.disable(logging.INFO)
+
+
+class MockStreamingLLM:
+    """Local stand-in model that produces `tokens` chunks, `delay` seconds apart"""
+    def __init__(self, tokens: int, delay: float):
+        self.tokens = tokens
+        self.delay = delay
+
+    async def astream(self, messages):
+        for i in range(self.tokens):
+            await asyncio.sleep(self.delay)
+            yield AIMessageChunk(content=f"tok{i} ")
+
+    async def ainvoke(self, messages, **kwargs) -> AIMessage:
+        return AIMessage(content="".join([chunk.content async for chunk in self.astream(messages)]))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def measure(client: httpx.AsyncClient, path: str, payload: dict):
+    """Return (time to first body byte, total time) in milliseconds"""
+    started = time.perf_counter()
+    first = None
+    async with client.stream("POST", path, json=payload) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            if first is None and chunk:
+                first = time.perf_counter()
+    total = time.perf_counter()
+    return (first - started) * 1000, (total - started) * 1000
+
+
+async def run(requests: int, tokens: int, token_delay: float):
+    get_llm_service().llm = MockStreamingLLM(tokens, token_delay)
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    payload = {"messages": [{"role": "user", "content": "How much should I save each month?"}], "agent_type": "chatbot"}
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+        print(f"{'endpoint':<28} {'ttft p50 ms':>12} {'ttft p95 ms':>12} {'total p50 ms':>13}")
+        for path in ("/chat", "/chat/stream?format=sse", "/chat/stream?format=ndjson"):
+            results = [await measure(client, path, payload) for _ in range(requests)]
+            ttft = sorted(r[0] for r in results)
+            total = sorted(r[1] for r in results)
+            print(
+                f"{path:<28} {statistics.median(ttft):>12.1f} {ttft[int(len(ttft) * 0.95)]:>12.1f}"
+                f" {statistics.median(total):>13.1f}"
+            )
+
+    server.should_exit = True
+    await server_task
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark time-to-first-token for streaming chat")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per endpoint")
+    parser.add_argument("--tokens", type=int, default=200, help="Tokens produced by the mock model")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Seconds between mock tokens")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.tokens, args.token_delay))
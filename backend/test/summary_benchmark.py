@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Summary Agent Token Benchmark
+
+Simulates conversations where the summary agent is asked for a summary after
+every turn, and reports the LLM prompt tokens consumed per summary when the
+whole conversation is re-summarized each time versus when the incremental
+summarizer only folds in new messages.
+
+Usage:
+    python summary_benchmark.py [--conversations 10] [--turns 100]
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from app.services.llm_service import Completion
+from app.services.summarizer import IncrementalSummarizer
+from app.services.tokens import MESSAGE_OVERHEAD_TOKENS, estimate_tokens
+
+SUMMARY = "The user is planning their savings, pension contributions and monthly budget. " * 3
+
+
+async def stand_in_model(messages) -> Completion:
+    """Returns a fixed-size summary without any I/O, reporting usage like the API would"""
+    prompt_tokens = sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+    return Completion(SUMMARY, prompt_tokens=prompt_tokens, completion_tokens=estimate_tokens(SUMMARY))
+
+
+async def run(conversations: int, turns: int):
+    full = IncrementalSummarizer(stand_in_model, estimate_tokens)
+    incremental = IncrementalSummarizer(stand_in_model, estimate_tokens)
+    full_tokens, incremental_tokens = [], []
+
+    for conversation in range(conversations):
+        texts = []
+        for turn in range(turns):
+            texts.append(f"Turn {turn}: I earn 3,200 a month and want to know how much to put into my pension and ISA.")
+            # Without a key nothing is reused, which is how the agent behaved before
+            _, metrics = await full.summarize(texts)
+            full_tokens.append(metrics["prompt_tokens"])
+            _, metrics = await incremental.summarize(texts, key=f"chat-{conversation}")
+            incremental_tokens.append(metrics["prompt_tokens"])
+
+    print(f"{'mode':<12} {'mean tok/summary':>17} {'last-turn tok':>14} {'total tokens':>13}")
+    for name, tokens in (("full", full_tokens), ("incremental", incremental_tokens)):
+        print(f"{name:<12} {statistics.mean(tokens):>17.1f} {tokens[-1]:>14} {sum(tokens):>13,}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark LLM tokens per conversation summary")
+    parser.add_argument("--conversations", type=int, default=10, help="Number of conversations")
+    parser.add_argument("--turns", type=int, default=100, help="Turns per conversation")
+    args = parser.parse_args()
+    asyncio.run(run(args.conversations, args.turns))
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Tracing Test
+
+Checks request tracing:
+- nested spans share the trace id and link to their parent's span id
+- traceparent headers are parsed, and malformed ones ignored
+- a request continues the caller's trace: the server span's parent is the
+  incoming span, the agent spans hang off the server span, and the response
+  traceparent names the server span
+- a caller's unsampled flag is honoured: the trace context still propagates
+  (flags 00 in the response) but no span is kept
+- the trace file is written by the background writer as OTLP/JSON lines
+
+Usage:
+    python tracing_test.py
+"""
+
+import os
+import sys
+import json
+import asyncio
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ["FAQ_MATCH_ENABLED"] = "false"
+os.environ["TRACING_ENABLED"] = "true"
+os.environ["TRACING_FILE"] = ""
+os.environ["DATABASE_BACKEND"] = "memory"
+
+import httpx
+from langchain.schema.messages import AIMessage
+
+from main import app
+from app.services.llm_service import get_llm_service
+from app.services.tracing import Tracer, current_span, get_tracer, parse_traceparent
+
+CALLER_TRACE = "4bf92f3577b34da6a3ce929d0e0e4736"
+CALLER_SPAN = "00f067aa0ba902b7"
+
+
+class StandInLLM:
+    async def ainvoke(self, messages, **kwargs) -> AIMessage:
+        return AIMessage(content="Start with an emergency fund.")
+
+
+async def post_chat(traceparent: str = None) -> httpx.Response:
+    headers = {"traceparent": traceparent} if traceparent else {}
+    body = {"messages": [{"role": "user", "content": "Where do I start saving?"}], "agent_type": "chatbot"}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await client.post("/chat", json=body, headers=headers)
+
+
+def spans_of(trace_id: str):
+    return {span.name: span for span in get_tracer().finished if span.trace_id == trace_id}
+
+
+async def test_nested_spans_link_to_their_parents():
+    tracer = Tracer()
+    with tracer.start_as_current_span("request", kind="server") as root:
+        with tracer.start_as_current_span("agent") as child:
+            assert current_span() is child
+            with tracer.start_as_current_span("llm", kind="client") as grandchild:
+                pass
+        assert current_span() is root
+    assert root.parent_id is None and root.is_local_root
+    assert child.parent_id == root.span_id and grandchild.parent_id == child.span_id
+    assert root.trace_id == child.trace_id == grandchild.trace_id
+    assert len({root.span_id, child.span_id, grandchild.span_id}) == 3
+    # Spans are finished innermost first
+    assert [span.name for span in tracer.finished] == ["llm", "agent", "request"]
+
+
+async def test_traceparent_parsing():
+    context = parse_traceparent(f"00-{CALLER_TRACE}-{CALLER_SPAN}-01")
+    assert context == (CALLER_TRACE, CALLER_SPAN, True), context
+    assert parse_traceparent(f"00-{CALLER_TRACE}-{CALLER_SPAN}-00").sampled is False
+    for malformed in (None, "", "garbage", f"ff-{CALLER_TRACE}-{CALLER_SPAN}-01",
+                      f"00-{'0' * 32}-{CALLER_SPAN}-01", f"00-{CALLER_TRACE}-{CALLER_SPAN[:-1]}-01"):
+        assert parse_traceparent(malformed) is None, malformed
+
+
+async def test_request_continues_the_callers_trace():
+    response = await post_chat(f"00-{CALLER_TRACE}-{CALLER_SPAN}-01")
+    assert response.status_code == 200, response.text
+    echoed = parse_traceparent(response.headers["traceparent"])
+    assert echoed.trace_id == CALLER_TRACE and echoed.sampled
+
+    spans = spans_of(CALLER_TRACE)
+    server, agent = spans["POST /chat"], spans["agent.request"]
+    assert server.span_id == echoed.span_id
+    assert server.parent_id == CALLER_SPAN and server.remote_parent and server.is_local_root
+    assert agent.parent_id == server.span_id and not agent.is_local_root
+    assert server.attributes["http.status_code"] == 200
+
+
+async def test_unsampled_traces_propagate_but_are_not_kept():
+    trace_id = "0af7651916cd43dd8448eb211c80319c"
+    response = await post_chat(f"00-{trace_id}-b7ad6b7169203331-00")
+    assert response.status_code == 200, response.text
+    echoed = parse_traceparent(response.headers["traceparent"])
+    assert echoed.trace_id == trace_id and not echoed.sampled
+    assert response.headers["traceparent"].endswith("-00")
+    assert spans_of(trace_id) == {}
+
+    # Without a header the server starts a new, sampled trace
+    response = await post_chat()
+    echoed = parse_traceparent(response.headers["traceparent"])
+    assert echoed.sampled and spans_of(echoed.trace_id)["POST /chat"].parent_id is None
+
+
+async def test_trace_file_is_written_by_the_background_writer():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "spans.jsonl")
+        tracer = Tracer(path=path)
+        assert tracer._writer.name == "span-writer" and tracer._writer.is_alive()
+        for _ in range(3):
+            with tracer.start_as_current_span("request", {"attempt": 1, "cached": False}, kind="server") as root:
+                with tracer.start_as_current_span("llm", kind="client") as child:
+                    child.set_status("error", "upstream 503")
+        with tracer.start_as_current_span("hidden", parent=parse_traceparent(f"00-{CALLER_TRACE}-{CALLER_SPAN}-00")):
+            pass
+        tracer.close()
+        assert tracer._writer is None
+
+        with open(path, encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        assert [line["name"] for line in lines] == ["llm", "request"] * 3
+        child, parent = lines[-2], lines[-1]
+        assert child["parentSpanId"] == parent["spanId"] == root.span_id and "parentSpanId" not in parent
+        assert child["traceId"] == parent["traceId"] == root.trace_id
+        assert child["kind"] == 3 and child["status"] == {"code": 2, "message": "upstream 503"}
+        assert {"key": "attempt", "value": {"intValue": "1"}} in parent["attributes"]
+
+
+TESTS = [
+    test_nested_spans_link_to_their_parents,
+    test_traceparent_parsing,
+    test_request_continues_the_callers_trace,
+    test_unsampled_traces_propagate_but_are_not_kept,
+    test_trace_file_is_written_by_the_background_writer,
+]
+
+
+async def run() -> int:
+    get_llm_service().llm = StandInLLM()
+    failed = 0
+    for test in TESTS:
+        try:
+            await test()
+            print(f"PASS {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"FAIL {test.__name__}: {type(e).__name__}: {e}")
+    print(f"{len(TESTS) - failed}/{len(TESTS)} passed")
+    return failed
+
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(description="Check span parenting, traceparent propagation and span export").parse_args()
+    logging.disable(logging.CRITICAL)
+    sys.exit(1 if asyncio.run(run()) else 0)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Write-Behind Latency Benchmark
+
+Sends concurrent /chat requests through the FastAPI app, with a stand-in
+model of fixed latency and a storage backend whose writes take a fixed time
+like a remote database, and reports request latency percentiles with
+writes awaited in line (DATABASE_WRITE_BEHIND=false) and with the
+write-behind queue. Also reports how long the final flush takes and checks
+that every message was stored.
+
+Usage:
+    python write_behind_benchmark.py [--requests 400] [--concurrency 32] [--llm-latency 0.05] [--db-latency 0.02]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import warnings
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ["FAQ_MATCH_ENABLED"] = "false"
+os.environ["TRACING_ENABLED"] = "false"
+# Admission control is not under test; let every request in at once
+os.environ.setdefault("SCHEDULER_MAX_CONCURRENT", "1024")
+os.environ.setdefault("SCHEDULER_MAX_QUEUE_DEPTH", "4096")
+
+import httpx
+import numpy as np
+from langchain.schema.messages import AIMessage
+
+from main import app
+from app.services.database import DatabaseService, get_database_service
+from app.services.llm_service import get_llm_service
+from write_behind_test import SlowStorage
+
+
+class FixedLatencyLLM:
+    """Answers every prompt after a fixed delay"""
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def ainvoke(self, messages, **kwargs) -> AIMessage:
+        await asyncio.sleep(self.latency)
+        return AIMessage(content="Keep three to six months of expenses in an emergency fund.")
+
+
+async def drive(db: DatabaseService, requests: int, concurrency: int):
+    """Send the requests and return (latencies in ms, seconds to flush the queue)"""
+    app.dependency_overrides[get_database_service] = lambda: db
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(client: httpx.AsyncClient, i: int):
+        body = {"messages": [{"role": "user", "content": f"Question {i}: how big should my emergency fund be?"}],
+                "agent_type": "chatbot"}
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/chat", json=body)
+            latencies.append((time.perf_counter() - started) * 1000)
+            response.raise_for_status()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60) as client:
+        await asyncio.gather(*(one(client, i) for i in range(requests)))
+    started = time.perf_counter()
+    await db.close()
+    app.dependency_overrides.clear()
+    return np.array(latencies), time.perf_counter() - started
+
+
+async def run(requests: int, concurrency: int, llm_latency: float, db_latency: float):
+    get_llm_service().llm = FixedLatencyLLM(llm_latency)
+    print(f"model {llm_latency * 1000:.0f}ms, each database write {db_latency * 1000:.0f}ms, "
+          f"{requests} requests, {concurrency} concurrent")
+    print(f"{'mode':<14} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'writes':>7} {'flush ms':>9} {'stored':>7}")
+    for name, write_behind in (("awaited", False), ("write-behind", True)):
+        backend = SlowStorage(latency=db_latency)
+        latencies, flush = await drive(DatabaseService(backend, write_behind=write_behind), requests, concurrency)
+        stored = sum(len(messages) for messages in backend.chats.values())
+        print(f"{name:<14} {np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 95):>8.1f} "
+              f"{np.percentile(latencies, 99):>8.1f} {backend.writes:>7} {flush * 1000:>9.1f} {stored:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /chat latency with and without write-behind persistence")
+    parser.add_argument("--requests", type=int, default=400, help="Chat requests to send")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight at once")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Stand-in model latency in seconds")
+    parser.add_argument("--db-latency", type=float, default=0.02, help="Seconds per database write")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    warnings.filterwarnings("ignore")
+    asyncio.run(run(args.requests, args.concurrency, args.llm_latency, args.db_latency))
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Write-Behind Persistence Test
+
+Runs DatabaseService in front of a storage backend with simulated write
+latency and checks the write queue: stores return before the write lands,
+reads of a chat wait for its queued writes, concurrent stores are grouped
+into batches, a full queue holds callers back, a failed batch is retried in
+order and, once it is given up on, does not hang readers or is reported to
+synchronous callers, and close() flushes everything to SQLite.
+
+Usage:
+    python write_behind_test.py [--verbose]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from app.services.database import DatabaseService
+from app.services.storage import InMemoryStorage, SQLiteStorage
+
+
+class SlowStorage(InMemoryStorage):
+    """
+    In-memory storage whose writes take `latency` seconds, like a remote database
+
+    Args:
+        latency (float): Seconds per append_messages call
+        fail (bool): Raise instead of writing
+        failures (int): Raise on this many calls before writing
+    """
+    def __init__(self, latency: float = 0.05, fail: bool = False, failures: int = 0):
+        super().__init__()
+        self.latency = latency
+        self.fail = fail
+        self.failures = failures
+        self.writes = 0
+
+    async def append_messages(self, rows):
+        self.writes += 1
+        await asyncio.sleep(self.latency)
+        if self.fail or self.writes <= self.failures:
+            raise RuntimeError("database unavailable")
+        for chat_id, message in rows:
+            await self.append_message(chat_id, message)
+
+
+def turn(i: int):
+    return [{"role": "user", "content": f"question {i}"}, {"role": "assistant", "content": f"answer {i}"}]
+
+
+async def test_store_returns_before_write():
+    db = DatabaseService(SlowStorage(latency=0.2), write_behind=True)
+    started = time.perf_counter()
+    await db.store_messages("chat", turn(0))
+    assert time.perf_counter() - started < 0.05
+    await db.close()
+    assert len(db.backend.chats["chat"]) == 2
+
+
+async def test_synchronous_mode_waits_for_write():
+    db = DatabaseService(SlowStorage(latency=0.1), write_behind=False)
+    started = time.perf_counter()
+    await db.store_messages("chat", turn(0))
+    assert time.perf_counter() - started >= 0.1
+    assert len(db.backend.chats["chat"]) == 2
+
+
+async def test_reads_wait_for_queued_writes():
+    db = DatabaseService(SlowStorage(latency=0.1), write_behind=True)
+    for i in range(3):
+        await db.store_messages("chat", turn(i))
+    conversation = await db.get_conversation("chat")
+    assert [m["content"] for m in conversation] == [m["content"] for i in range(3) for m in turn(i)]
+    chats, _ = await db.list_chats()
+    assert chats[0]["message_count"] == 6
+    await db.close()
+
+
+async def test_concurrent_stores_are_batched():
+    db = DatabaseService(SlowStorage(latency=0.02), write_behind=True)
+    await asyncio.gather(*(db.store_messages(f"chat-{i}", turn(i)) for i in range(200)))
+    await db.flush()
+    assert sum(len(messages) for messages in db.backend.chats.values()) == 400
+    assert db.backend.writes <= 3, db.backend.writes
+    await db.close()
+
+
+async def test_full_queue_applies_backpressure():
+    db = DatabaseService(SlowStorage(latency=0.1), write_behind=True, queue_size=2, batch_size=1)
+    started = time.perf_counter()
+    # One store is taken by the writer, two fill the queue, the fourth has to wait
+    for i in range(4):
+        await db.store_messages("chat", turn(i))
+    assert time.perf_counter() - started >= 0.1
+    await db.close()
+    assert len(db.backend.chats["chat"]) == 8
+
+
+async def test_failed_batch_is_retried_in_order():
+    db = DatabaseService(SlowStorage(latency=0.01, failures=2), write_behind=True, retry_delay=0.01)
+    for i in range(3):
+        await db.store_messages("chat", turn(i))
+    conversation = await asyncio.wait_for(db.get_conversation("chat"), timeout=1)
+    assert [m["content"] for m in conversation] == [m["content"] for i in range(3) for m in turn(i)]
+    await db.close()
+
+
+async def test_failed_write_does_not_hang_reads():
+    db = DatabaseService(SlowStorage(latency=0.01, fail=True), write_behind=True, write_retries=2, retry_delay=0.01)
+    await db.store_messages("chat", turn(0))
+    conversation = await asyncio.wait_for(db.get_conversation("chat"), timeout=1)
+    assert conversation == []
+    assert db.backend.writes == 3
+    await db.close()
+
+
+async def test_synchronous_store_reports_failed_write():
+    db = DatabaseService(SlowStorage(latency=0.01, fail=True), write_behind=False, write_retries=1, retry_delay=0.01)
+    try:
+        await db.store_messages("chat", turn(0))
+        raise AssertionError("failed write not reported")
+    except RuntimeError as e:
+        assert "database unavailable" in str(e)
+    assert db.backend.writes == 2
+    await db.close()
+
+
+async def test_close_flushes_to_sqlite():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "chats.db")
+        db = DatabaseService(SQLiteStorage(path), write_behind=True)
+        await asyncio.gather(*(db.store_messages(f"chat-{i % 10}", turn(i)) for i in range(500)))
+        await db.close()
+        reopened = SQLiteStorage(path)
+        chats = [(await reopened.get_messages_page(f"chat-{i}", 1000))[0] for i in range(10)]
+        await reopened.close()
+        assert sum(len(messages) for messages in chats) == 1000
+        # Each chat keeps its turns in order
+        assert [m["content"] for m in chats[3][:4]] == ["question 3", "answer 3", "question 13", "answer 13"]
+
+
+TESTS = [
+    test_store_returns_before_write,
+    test_synchronous_mode_waits_for_write,
+    test_reads_wait_for_queued_writes,
+    test_concurrent_stores_are_batched,
+    test_full_queue_applies_backpressure,
+    test_failed_batch_is_retried_in_order,
+    test_failed_write_does_not_hang_reads,
+    test_synchronous_store_reports_failed_write,
+    test_close_flushes_to_sqlite,
+]
+
+
+async def run() -> int:
+    failed = 0
+    for test in TESTS:
+        try:
+            await test()
+            print(f"PASS {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"FAIL {test.__name__}: {type(e).__name__}: {e}")
+    print(f"{len(TESTS) - failed}/{len(TESTS)} passed")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the write-behind persistence queue")
+    parser.add_argument("--verbose", action="store_true", help="Show write error logs")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING if args.verbose else logging.CRITICAL)
+    sys.exit(1 if asyncio.run(run()) else 0)
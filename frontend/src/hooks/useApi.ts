@@ -9,6 +9,8 @@ interface Message {
 interface ChatRequest {
   messages: Message[];
   agent_type: 'chatbot' | 'summary';
+  // Continue an existing chat; only the new messages need to be sent
+  chat_id?: string;
 }
 
 interface ChatResponse {
@@ -16,8 +18,21 @@ interface ChatResponse {
   chat_id: string;
 }
 
+interface ChatSummary {
+  chat_id: string;
+  message_count: number;
+  last_role: 'user' | 'assistant';
+  last_message: string;
+  updated_at: number;
+}
+
+// Without a chatId the API returns a page of chat summaries,
+// with one it returns a page of that chat's messages
 interface ChatHistoryResponse {
-  history: Record<string, Message[]>;
+  chat_id?: string;
+  chats?: ChatSummary[];
+  messages?: Message[];
+  next_cursor: number | null;
 }
 
 interface FAQResponse {